@@ -1,8 +1,252 @@
-import json
+import os
+import sys
 import csv
 import uuid
-import pandas as pd
-from typing import Dict, Set, List, Tuple
+import hashlib
+import argparse
+import multiprocessing
+from itertools import islice
+from operator import itemgetter
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from hald_stream import iter_entities, iter_relations
+
+# Общие с extractor форматы вывода (sinks.py) лежат в корне репозитория
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sinks import open_sink
+
+try:
+    import numpy as np
+except ImportError:  # numpy нужен только для колоночного маппинга рёбер (--columnar)
+    np = None
+
+# Порядок колонок, как их раньше выводил pandas из словарей строк
+NODE_COLUMNS = ['id', 'name', 'all_categories']
+EDGE_COLUMNS = ['id', 'subject', 'object', 'predicate', 'primary_knowledge_source']
+
+# Пространство имён для детерминированных id узлов: сущность с тем же именем
+# и категорией получает тот же CURIE при каждой пересборке
+NODE_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'infores:mygraph/nodes')
+_NODE_ID_NAMESPACE_BYTES = NODE_ID_NAMESPACE.bytes
+
+# Сколько строк копится в буфере перед записью в файл
+TSV_CHUNK_ROWS = 10000
+
+# Отношений в одном шарде при конвертации рёбер пулом процессов
+EDGE_SHARD_SIZE = 50000
+
+# Отношений в одном блоке колоночного маппинга (массивы numpy на блок)
+COLUMNAR_CHUNK_SIZE = 200000
+
+# Форматы вывода (--format), см. sinks.py
+OUTPUT_FORMATS = ('tsv', 'tsv.gz', 'tsv.zst', 'jsonl', 'jsonl.gz', 'parquet')
+
+class ChunkedRowWriter:
+    """
+    Потоковая запись таблицы: заголовок с фиксированным порядком колонок, затем строки
+    пачками по TSV_CHUNK_ROWS. Формат — по расширению файла или output_format
+    (TSV, .tsv.gz, .tsv.zst, .jsonl, .parquet, см. sinks.py). TSV совпадает
+    с DataFrame.to_csv(sep='\\t', index=False): минимальное экранирование кавычками,
+    перевод строки '\\n', UTF-8.
+    """
+
+    def __init__(self, filepath: str, columns: List[str], chunk_rows: int = TSV_CHUNK_ROWS,
+                 header: bool = True, output_format: Optional[str] = None):
+        self.columns = columns
+        self.chunk_rows = chunk_rows
+        self._rows = []
+        self._sink = open_sink(filepath, columns, output_format=output_format, header=header, lineterminator='\n')
+
+    @property
+    def rows_written(self) -> int:
+        return self._sink.rows_written
+
+    @property
+    def accepts_text(self) -> bool:
+        """
+        Можно ли писать готовый текст TSV (write_text).
+        """
+        return self._sink.accepts_text
+
+    def write(self, row: Tuple):
+        """
+        Добавляет строку — значения в порядке columns.
+        """
+        self._rows.append(row)
+        if len(self._rows) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if self._rows:
+            self._sink.write_many(self._rows)
+            self._rows = []
+
+    def write_rows(self, rows: List[Tuple]):
+        """
+        Пишет готовый блок строк сразу, минуя буфер.
+        """
+        self.flush()
+        self._sink.write_many(rows)
+
+    def write_text(self, text: str, rows: int):
+        """
+        Пишет готовый текст TSV из rows строк; поля в нём не должны требовать экранирования.
+        """
+        self.flush()
+        self._sink.write_text(text, rows)
+
+    def append_file(self, filepath: str, rows: int):
+        """
+        Дописывает готовый TSV без заголовка (шард), содержащий rows строк.
+        """
+        self.flush()
+        with open(filepath, 'r', encoding='utf-8', newline='') as f:
+            if self.accepts_text:
+                for block in iter(lambda: f.read(1 << 20), ''):
+                    self._sink.write_text(block, 0)
+                self._sink.rows_written += rows
+            else:
+                self._sink.write_many(csv.reader(f, delimiter='\t'))
+
+    def close(self):
+        self.flush()
+        self._sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def node_id(name: str, category: str) -> str:
+    """
+    Детерминированный CURIE узла по паре (имя, категория Biolink):
+    MYGRAPH:{uuid.uuid5(NODE_ID_NAMESPACE, "имя\tкатегория")}.
+    """
+    # UUID5 собирается напрямую из SHA-1: uuid.uuid5 через объект UUID в несколько раз медленнее,
+    # а id считаются при записи каждого узла и конца ребра
+    digest = bytearray(hashlib.sha1(_NODE_ID_NAMESPACE_BYTES + f'{name}\t{category}'.encode('utf-8')).digest()[:16])
+    digest[6] = (digest[6] & 0x0F) | 0x50
+    digest[8] = (digest[8] & 0x3F) | 0x80
+    h = digest.hex()
+    return f"MYGRAPH:{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+class EntityTable(Mapping):
+    """
+    Таблица сущностей: имя -> CURIE узла (интерфейс Mapping, как у словаря).
+
+    Имена и типы сущностей интернируются; имена нумеруются по порядку
+    добавления (code), типы из Entity_Info.json хранятся списком по коду.
+    Повторное имя, как в словаре, берёт последний тип и сохраняет первую
+    позицию. Узлами считаются сущности, тип которых есть в entity_mapping.
+
+    CURIE считаются по (имя, категория Biolink), поэтому неизменившиеся
+    сущности сохраняют id между пересборками. Для всех узлов они не
+    хранятся: curie(code) считает id при записи nodes.tsv, а edge_curie(code)
+    запоминает id только сущностей, встретившихся в рёбрах.
+    """
+
+    def __init__(self, entity_mapping: Dict[str, str]):
+        self.entity_mapping = entity_mapping
+        self._codes = {}
+        self.names = []
+        self.types = []
+        # CURIE концов рёбер по коду (None — ещё не считался); список создаётся при первом ребре
+        self._edge_curies = None
+
+    def add(self, name: str, entity_type: str) -> int:
+        """
+        Добавляет сущность (или меняет её тип) и возвращает её код.
+        """
+        if isinstance(entity_type, str):
+            entity_type = sys.intern(entity_type)
+        code = self._codes.get(name)
+        if code is None:
+            if isinstance(name, str):
+                name = sys.intern(name)
+            code = len(self.names)
+            self._codes[name] = code
+            self.names.append(name)
+            self.types.append(entity_type)
+            if self._edge_curies is not None:
+                self._edge_curies.append(None)
+        else:
+            self.types[code] = entity_type
+            if self._edge_curies is not None:
+                self._edge_curies[code] = None
+        return code
+
+    def category(self, code: int) -> Optional[str]:
+        """
+        Категория Biolink сущности; None — тип без маппинга (сущность не узел).
+        """
+        return self.entity_mapping.get(self.types[code])
+
+    def curie(self, code: int) -> str:
+        return node_id(self.names[code], self.entity_mapping[self.types[code]])
+
+    def _edge_memo(self) -> List[Optional[str]]:
+        if self._edge_curies is None:
+            self._edge_curies = [None] * len(self.names)
+        return self._edge_curies
+
+    def edge_id(self, name: str) -> Optional[str]:
+        """
+        CURIE конца ребра по имени (None — не узел) с запоминанием по коду: концы рёбер повторяются.
+        """
+        code = self._codes.get(name)
+        if code is None:
+            return None
+        memo = self._edge_curies if self._edge_curies is not None else self._edge_memo()
+        curie = memo[code]
+        if curie is None:
+            category = self.entity_mapping.get(self.types[code])
+            if category is None:
+                return None
+            curie = memo[code] = node_id(self.names[code], category)
+        return curie
+
+    def edge_curies(self, codes: Iterable[int]) -> List[str]:
+        """
+        CURIE узлов по кодам с тем же запоминанием, что и в edge_id().
+        """
+        memo = self._edge_memo()
+        curies = []
+        for code in codes:
+            curie = memo[code]
+            if curie is None:
+                curie = memo[code] = self.curie(code)
+            curies.append(curie)
+        return curies
+
+    def code(self, name: str) -> Optional[int]:
+        """
+        Код узла по имени; None — нет такой сущности или её тип без маппинга.
+        """
+        code = self._codes.get(name)
+        return code if code is not None and self.types[code] in self.entity_mapping else None
+
+    def get(self, name, default=None):
+        code = self.code(name)
+        return default if code is None else self.curie(code)
+
+    def __getitem__(self, name: str) -> str:
+        code = self.code(name)
+        if code is None:
+            raise KeyError(name)
+        return self.curie(code)
+
+    def __contains__(self, name) -> bool:
+        return self.code(name) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        mapping = self.entity_mapping
+        return (name for name, entity_type in zip(self.names, self.types) if entity_type in mapping)
+
+    def __len__(self) -> int:
+        mapping = self.entity_mapping
+        return sum(1 for entity_type in self.types if entity_type in mapping)
 
 def load_mapping_files() -> Tuple[Dict[str, str], Dict[str, str]]:
     """
@@ -35,238 +279,385 @@ def load_mapping_files() -> Tuple[Dict[str, str], Dict[str, str]]:
     print(f"DEBUG: Несколько примеров отношений: {list(relationship_mapping.keys())[:10]}")
     return entity_mapping, relationship_mapping
 
+def stream_entities(filepath: str) -> Iterator[Tuple[str, str]]:
+    """
+    Потоково читает сущности из Entity_Info.json (см. hald_stream).
+    Выдаёт пары (entity_name, entity_type) по одной.
+    """
+    print(f"DEBUG: Читаем сущности потоком из {filepath}")
+    count = 0
+    for entity_name, entity_type in iter_entities(filepath):
+        count += 1
+        if count <= 5:  # Показываем первые 5 для отладки
+            print(f"DEBUG: Найдена сущность: {entity_name} -> {entity_type}")
+        yield entity_name, entity_type
+    print(f"DEBUG: Итого найдено сущностей: {count}")
+
+def stream_relations(filepath: str) -> Iterator[Dict[str, str]]:
+    """
+    Потоково читает отношения из Relation_Info.json (см. hald_stream).
+    Выдаёт словари с ключами: source_entity, target_entity, relationship.
+    """
+    print(f"DEBUG: Читаем отношения потоком из {filepath}")
+    count = 0
+    try:
+        for rel_dict in iter_relations(filepath):
+            count += 1
+            if count <= 5:  # Показываем первые 5 для отладки
+                print(f"DEBUG: Найдено отношение: {rel_dict}")
+            yield rel_dict
+    except Exception as e:
+        print(f"DEBUG: Ошибка при загрузке отношений: {e}")
+    print(f"DEBUG: Итого найдено отношений: {count}")
+
 def load_entities(filepath: str) -> Dict[str, str]:
     """
     Загружает сущности из Entity_Info.json
     Возвращает словарь: {entity_name: entity_type}
     """
-    entities = {}
-    print(f"DEBUG: Загружаем сущности из {filepath}")
-    
-    with open(filepath, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    
-    print(f"DEBUG: Тип данных в JSON: {type(data)}")
-    print(f"DEBUG: Ключи верхнего уровня: {list(data.keys()) if isinstance(data, dict) else 'Не словарь'}")
-    
-    # Более гибкая обработка структуры JSON
-    def extract_entities(obj, depth=0):
-        if depth > 3:  # Защита от бесконечной рекурсии
-            return
-        
-        if isinstance(obj, dict):
-            # Если это сущность с ключами entity и type
-            if 'entity' in obj and 'type' in obj:
-                entity_name = obj['entity']
-                entity_type = obj['type']
-                entities[entity_name] = entity_type
-                if len(entities) <= 5:  # Показываем первые 5 для отладки
-                    print(f"DEBUG: Найдена сущность: {entity_name} -> {entity_type}")
-            else:
-                # Рекурсивно обрабатываем все значения
-                for value in obj.values():
-                    extract_entities(value, depth + 1)
-        elif isinstance(obj, list):
-            # Обрабатываем каждый элемент списка
-            for item in obj:
-                extract_entities(item, depth + 1)
-    
-    extract_entities(data)
-    print(f"DEBUG: Итого найдено сущностей: {len(entities)}")
-    return entities
+    return dict(stream_entities(filepath))
 
 def load_relations(filepath: str) -> List[Dict[str, str]]:
     """
     Загружает отношения из Relation_Info.json
     Возвращает список словарей с ключами: source_entity, target_entity, relationship
     """
-    relations = []
-    print(f"DEBUG: Загружаем отношения из {filepath}")
-    
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        print(f"DEBUG: Тип данных отношений: {type(data)}")
-        
-        if isinstance(data, dict):
-            print(f"DEBUG: Ключи верхнего уровня отношений: {list(data.keys())}")
-        elif isinstance(data, list):
-            print(f"DEBUG: Список содержит {len(data)} элементов")
-            if len(data) > 0:
-                print(f"DEBUG: Тип первого элемента: {type(data[0])}")
-                if isinstance(data[0], dict):
-                    print(f"DEBUG: Ключи первого элемента: {list(data[0].keys())}")
-        
-        # Более гибкая обработка структуры JSON для отношений
-        def extract_relations(obj, depth=0):
-            if depth > 3:  # Защита от бесконечной рекурсии
-                return
-            
-            if isinstance(obj, dict):
-                # Проверяем различные возможные ключи для отношений
-                possible_source_keys = ['source entity', 'source_entity', 'source', 'from', 'subject']
-                possible_target_keys = ['target entity', 'target_entity', 'target', 'to', 'object']
-                possible_rel_keys = ['relationship', 'relation', 'predicate', 'type']
-                
-                source = None
-                target = None
-                relationship = None
-                
-                for key in possible_source_keys:
-                    if key in obj:
-                        source = obj[key]
-                        break
-                
-                for key in possible_target_keys:
-                    if key in obj:
-                        target = obj[key]
-                        break
-                
-                for key in possible_rel_keys:
-                    if key in obj:
-                        relationship = obj[key]
-                        break
-                
-                if source and target and relationship:
-                    rel_dict = {
-                        'source_entity': str(source).strip(),
-                        'target_entity': str(target).strip(),
-                        'relationship': str(relationship).strip()
-                    }
-                    relations.append(rel_dict)
-                    if len(relations) <= 5:  # Показываем первые 5 для отладки
-                        print(f"DEBUG: Найдено отношение: {rel_dict}")
-                else:
-                    # Рекурсивно обрабатываем вложенные объекты
-                    for value in obj.values():
-                        extract_relations(value, depth + 1)
-            elif isinstance(obj, list):
-                # Обрабатываем каждый элемент списка
-                for item in obj:
-                    extract_relations(item, depth + 1)
-        
-        extract_relations(data)
-        
-    except Exception as e:
-        print(f"DEBUG: Ошибка при загрузке отношений: {e}")
-    
-    print(f"DEBUG: Итого найдено отношений: {len(relations)}")
-    return relations
+    return list(stream_relations(filepath))
 
-def generate_nodes_tsv(entities: Dict[str, str], entity_mapping: Dict[str, str]) -> Dict[str, str]:
+def generate_nodes_tsv(entities: Union[Dict[str, str], Iterable[Tuple[str, str]]],
+                       entity_mapping: Dict[str, str], nodes_path: str = 'nodes.tsv') -> EntityTable:
     """
-    Генерирует файл nodes.tsv в формате, совместимом с PloverDB
-    Возвращает словарь {entity_name: node_id}
+    Генерирует файл узлов (nodes.tsv; формат по расширению nodes_path) в формате, совместимом с PloverDB
+    Принимает словарь {entity_name: entity_type} или поток пар (entity_name, entity_type)
+    Возвращает таблицу сущностей {entity_name: node_id} (EntityTable)
     """
-    nodes_data = []
-    entity_id_mapping = {}
+    entity_table = EntityTable(entity_mapping)
     mapped_count = 0
     unmapped_types = set()
-    
-    for entity_name, entity_type in entities.items():
-        # Проверяем, есть ли маппинг для этого типа сущности
-        if entity_type in entity_mapping:
-            # Генерируем уникальный ID в формате CURIE
-            node_id = f"MYGRAPH:{str(uuid.uuid4())}"
-            biolink_category = entity_mapping[entity_type]
-            
-            nodes_data.append({
-                'id': node_id,
-                'name': entity_name,
-                'all_categories': biolink_category  # Изменено с 'category' на 'all_categories'
-            })
-            
-            entity_id_mapping[entity_name] = node_id
-            mapped_count += 1
-        else:
-            unmapped_types.add(entity_type)
+
+    if isinstance(entities, dict):
+        entities = entities.items()
+    # Повторное имя, как в словаре load_entities, берёт последний тип и сохраняет первую позицию
+    for entity_name, entity_type in entities:
+        entity_table.add(entity_name, entity_type)
+
+    # Строки пишутся в TSV файл пачками по мере маппинга
+    with ChunkedRowWriter(nodes_path, NODE_COLUMNS) as writer:
+        for code, entity_name in enumerate(entity_table.names):
+            # Проверяем, есть ли маппинг для этого типа сущности
+            biolink_category = entity_table.category(code)
+            if biolink_category is not None:
+                # ID в формате CURIE детерминирован по имени и категории, считается здесь же
+                # Колонка 'all_categories' (вместо 'category')
+                writer.write((entity_table.curie(code), entity_name, biolink_category))
+                mapped_count += 1
+            else:
+                unmapped_types.add(entity_table.types[code])
     
     print(f"DEBUG: Замаплено сущностей: {mapped_count}")
     print(f"DEBUG: Незамапленные типы: {unmapped_types}")
     
-    # Сохраняем в TSV файл
-    df_nodes = pd.DataFrame(nodes_data)
-    df_nodes.to_csv('nodes.tsv', sep='\t', index=False)
-    
-    return entity_id_mapping
+    return entity_table
 
-def generate_edges_tsv(relations: List[Dict[str, str]], 
-                      entity_id_mapping: Dict[str, str],
-                      relationship_mapping: Dict[str, str]):
+def map_relations(relations: Iterable[Tuple[str, str, str]],
+                  entity_table: EntityTable,
+                  relationship_mapping: Dict[str, str],
+                  writer: ChunkedRowWriter) -> Tuple[set, set, set]:
     """
-    Генерирует файл edges.tsv в формате, совместимом с PloverDB
+    Маппит отношения (source_entity, target_entity, relationship) на рёбра и пишет их в writer
+    Возвращает множества найденных отношений, незамапленных отношений и отсутствующих сущностей
     """
-    edges_data = []
     missing_entities = set()
     unmapped_relationships = set()
     found_relationships = set()
-    
-    for relation in relations:
-        source_entity = relation['source_entity']
-        target_entity = relation['target_entity']
-        relationship = relation['relationship']
-        
+    get_node_id = entity_table.edge_id
+
+    for source_entity, target_entity, relationship in relations:
         found_relationships.add(relationship)
-        
+
         # Проверяем наличие сущностей
-        source_found = source_entity in entity_id_mapping
-        target_found = target_entity in entity_id_mapping
+        source_id = get_node_id(source_entity)
+        target_id = get_node_id(target_entity)
+        source_found = source_id is not None
+        target_found = target_id is not None
         rel_found = relationship in relationship_mapping
-        
+
         if not source_found:
             missing_entities.add(f"source: {source_entity}")
         if not target_found:
             missing_entities.add(f"target: {target_entity}")
         if not rel_found:
             unmapped_relationships.add(relationship)
-        
-        # Проверяem, что обе сущности есть в нашем маппинге узлов
+
+        # Проверяем, что обе сущности есть в нашем маппинге узлов
         # и что отношение есть в маппинге отношений
         if source_found and target_found and rel_found:
-            edges_data.append({
-                'id': str(uuid.uuid4()),  # Добавлен уникальный идентификатор ребра
-                'subject': entity_id_mapping[source_entity],
-                'object': entity_id_mapping[target_entity],
-                'predicate': relationship_mapping[relationship],
-                'primary_knowledge_source': 'infores:mygraph'  # Добавлен источник знаний
-            })
-    
+            writer.write((
+                str(uuid.uuid4()),  # Уникальный идентификатор ребра
+                source_id,
+                target_id,
+                relationship_mapping[relationship],
+                'infores:mygraph'  # Источник знаний
+            ))
+
+    return found_relationships, unmapped_relationships, missing_entities
+
+# Маппинги в процессах пула: задаются один раз инициализатором, а не передаются с каждой задачей
+_worker_mappings = None
+
+def _init_edge_worker(entity_table: EntityTable, relationship_mapping: Dict[str, str]):
+    global _worker_mappings
+    _worker_mappings = (entity_table, relationship_mapping)
+
+def _convert_edge_shard(task: Tuple[int, str, List[Tuple[str, str, str]]]) -> Tuple[int, str, int, set, set, set]:
+    """
+    Задача пула: пишет рёбра одного шарда в отдельный файл без заголовка
+    """
+    index, shard_path, relations = task
+    entity_table, relationship_mapping = _worker_mappings
+    with ChunkedRowWriter(shard_path, EDGE_COLUMNS, header=False, output_format='tsv') as writer:
+        stats = map_relations(relations, entity_table, relationship_mapping, writer)
+    return (index, shard_path, writer.rows_written) + stats
+
+def _relation_chunks(relations: Iterable[Dict[str, str]],
+                     chunk_size: int) -> Iterator[List[Tuple[str, str, str]]]:
+    chunk = []
+    for relation in relations:
+        chunk.append((relation['source_entity'], relation['target_entity'], relation['relationship']))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _relation_shards(relations: Iterable[Dict[str, str]], edges_path: str,
+                     shard_size: int) -> Iterator[Tuple[int, str, List[Tuple[str, str, str]]]]:
+    for index, shard in enumerate(_relation_chunks(relations, shard_size)):
+        yield index, f"{edges_path}.shard-{index}", shard
+
+def _relation_columns(relations: Iterable[Dict[str, str]],
+                      chunk_size: int) -> Iterator[Tuple[List[str], List[str], List[str]]]:
+    """
+    Блоки отношений в виде колонок: source_entity, target_entity, relationship
+    """
+    relations = iter(relations)
+    columns = [itemgetter('source_entity'), itemgetter('target_entity'), itemgetter('relationship')]
+    while True:
+        chunk = list(islice(relations, chunk_size))
+        if not chunk:
+            return
+        yield tuple(list(map(column, chunk)) for column in columns)
+
+def _sorted_lookup(mapping: Dict[str, str]) -> Tuple['np.ndarray', 'np.ndarray']:
+    """
+    Словарь маппинга как пара массивов: отсортированные ключи и значения в том же порядке
+    """
+    # Значения в отношениях всегда строки, нестроковые ключи с ними не совпадут
+    keys = np.array([key for key in mapping if isinstance(key, str)], dtype=str)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    values = np.array([mapping[key] for key in keys.tolist()], dtype=str)
+    return keys, values
+
+def _sorted_codes(entity_table: EntityTable) -> Tuple['np.ndarray', 'np.ndarray']:
+    """
+    Таблица сущностей как пара массивов: отсортированные имена узлов и их коды в том же порядке
+    """
+    mapping = entity_table.entity_mapping
+    codes = [code for code, (name, entity_type) in enumerate(zip(entity_table.names, entity_table.types))
+             if entity_type in mapping and isinstance(name, str)]
+    names = entity_table.names
+    keys = np.array([names[code] for code in codes], dtype=str)
+    order = np.argsort(keys, kind='stable')
+    return keys[order], np.array(codes, dtype=np.intp)[order]
+
+def _lookup_codes(sorted_keys: 'np.ndarray', queries: 'np.ndarray') -> Tuple['np.ndarray', 'np.ndarray']:
+    """
+    Позиции queries в sorted_keys и маска найденных
+    """
+    if not len(sorted_keys):
+        return np.zeros(len(queries), dtype=np.intp), np.zeros(len(queries), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_keys, queries), len(sorted_keys) - 1)
+    return positions, sorted_keys[positions] == queries
+
+def _needs_quoting(values: Iterable[str]) -> bool:
+    """
+    Есть ли среди значений такие, которые csv.writer взял бы в кавычки
+    """
+    return any(char in value for value in values for char in '\t"\n\r')
+
+def _uuid4_strings(count: int) -> List[str]:
+    """
+    count случайных UUID версии 4 в каноническом виде, как str(uuid.uuid4())
+    """
+    raw = np.frombuffer(os.urandom(16 * count), dtype=np.uint8).reshape(count, 16).copy()
+    # Версия 4 и вариант RFC 4122, как в uuid.uuid4()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    hex_digits = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+    digits = np.empty((count, 32), dtype=np.uint8)
+    digits[:, 0::2] = hex_digits[raw >> 4]
+    digits[:, 1::2] = hex_digits[raw & 0x0F]
+    text = np.full((count, 36), ord('-'), dtype=np.uint8)
+    for start, end, offset in ((0, 8, 0), (8, 12, 1), (12, 16, 2), (16, 20, 3), (20, 32, 4)):
+        text[:, start + offset:end + offset] = digits[:, start:end]
+    joined = text.tobytes().decode('ascii')
+    return [joined[i:i + 36] for i in range(0, 36 * count, 36)]
+
+def map_relations_columnar(relations: Iterable[Dict[str, str]],
+                           entity_table: EntityTable,
+                           relationship_mapping: Dict[str, str],
+                           writer: ChunkedRowWriter,
+                           chunk_size: int = COLUMNAR_CHUNK_SIZE) -> Tuple[set, set, set]:
+    """
+    То же, что map_relations, но блоками по chunk_size в массивах numpy: имена сущностей
+    и отношения кодируются словарём (np.unique), маппинги применяются поиском по
+    отсортированным ключам, отсутствующие и незамапленные считаются масками
+    """
+    entity_keys, entity_codes = _sorted_codes(entity_table)
+    relationship_keys, predicates = _sorted_lookup(relationship_mapping)
+    # id узлов (MYGRAPH:<uuid>) кавычек не требуют; если не требуют и предикаты, строки собираются без csv.writer
+    plain_rows = not _needs_quoting(predicates.tolist())
+    missing_entities = set()
+    unmapped_relationships = set()
+    found_relationships = set()
+    rows = missing_rows = unmapped_rows = 0
+
+    for columns in _relation_columns(relations, chunk_size):
+        sources, targets, relationships = (np.array(column, dtype=str) for column in columns)
+        count = len(sources)
+        rows += count
+
+        # Словарь имён сущностей общий для source и target
+        names, name_codes = np.unique(np.concatenate([sources, targets]), return_inverse=True)
+        name_codes = name_codes.reshape(-1)
+        name_positions, name_found = _lookup_codes(entity_keys, names)
+        source_codes, target_codes = name_codes[:count], name_codes[count:]
+        source_found = name_found[source_codes]
+        target_found = name_found[target_codes]
+
+        labels, label_codes = np.unique(relationships, return_inverse=True)
+        label_codes = label_codes.reshape(-1)
+        label_positions, label_found = _lookup_codes(relationship_keys, labels)
+        rel_found = label_found[label_codes]
+
+        found_relationships.update(labels.tolist())
+        unmapped_relationships.update(labels[~label_found].tolist())
+        missing_entities.update(f"source: {name}" for name in names[np.unique(source_codes[~source_found])].tolist())
+        missing_entities.update(f"target: {name}" for name in names[np.unique(target_codes[~target_found])].tolist())
+        missing_rows += int(np.count_nonzero(~(source_found & target_found)))
+        unmapped_rows += int(np.count_nonzero(~rel_found))
+
+        valid = source_found & target_found & rel_found
+        valid_count = int(np.count_nonzero(valid))
+        if not valid_count:
+            continue
+        # CURIE — один раз на найденное имя блока, затем индексом по рёбрам
+        name_curies = np.empty(len(names), dtype=object)
+        name_curies[name_found] = entity_table.edge_curies(entity_codes[name_positions[name_found]].tolist())
+        subjects = name_curies[source_codes[valid]].tolist()
+        objects = name_curies[target_codes[valid]].tolist()
+        edge_predicates = predicates[label_positions[label_codes[valid]]].tolist()
+        edges = zip(_uuid4_strings(valid_count), subjects, objects, edge_predicates,
+                    ['infores:mygraph'] * valid_count)
+        if plain_rows and writer.accepts_text:
+            writer.write_text('\n'.join(map('\t'.join, edges)) + '\n', valid_count)
+        else:
+            writer.write_rows(list(edges))
+
+    print(f"DEBUG: Колоночный маппинг: отношений {rows}, без сущности в узлах {missing_rows}, "
+          f"с незамапленным отношением {unmapped_rows}")
+    return found_relationships, unmapped_relationships, missing_entities
+
+def generate_edges_tsv(relations: Iterable[Dict[str, str]], 
+                      entity_table: EntityTable,
+                      relationship_mapping: Dict[str, str],
+                      workers: int = 1,
+                      shard_size: int = EDGE_SHARD_SIZE,
+                      columnar: bool = False,
+                      edges_path: str = 'edges.tsv'):
+    """
+    Генерирует файл рёбер (edges.tsv; формат по расширению edges_path) в формате, совместимом с PloverDB
+    При workers > 1 отношения делятся на шарды по shard_size и маппятся в пуле процессов:
+    каждый шард пишется в свой файл, файлы дописываются в edges.tsv по порядку
+    При columnar маппинг выполняется блоками в массивах numpy (map_relations_columnar)
+    """
+    missing_entities = set()
+    unmapped_relationships = set()
+    found_relationships = set()
+
+    if columnar and np is None:
+        print("DEBUG: numpy не установлен, колоночный маппинг недоступен — используем построчный")
+        columnar = False
+
+    if columnar:
+        with ChunkedRowWriter(edges_path, EDGE_COLUMNS) as writer:
+            found_relationships, unmapped_relationships, missing_entities = map_relations_columnar(
+                relations, entity_table, relationship_mapping, writer)
+    elif workers <= 1:
+        # Строки пишутся в TSV файл пачками по мере маппинга
+        with ChunkedRowWriter(edges_path, EDGE_COLUMNS) as writer:
+            triples = ((r['source_entity'], r['target_entity'], r['relationship']) for r in relations)
+            found_relationships, unmapped_relationships, missing_entities = map_relations(
+                triples, entity_table, relationship_mapping, writer)
+    else:
+        # fork наследует маппинги без копирования; при spawn они передаются по разу на процесс
+        method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+        context = multiprocessing.get_context(method)
+        with ChunkedRowWriter(edges_path, EDGE_COLUMNS) as writer:
+            with context.Pool(workers, initializer=_init_edge_worker,
+                              initargs=(entity_table, relationship_mapping)) as pool:
+                # imap сохраняет порядок шардов, поэтому edges.tsv совпадает с однопроцессным
+                for _, shard_path, count, found, unmapped, missing in pool.imap(
+                        _convert_edge_shard, _relation_shards(relations, edges_path, shard_size)):
+                    writer.append_file(shard_path, count)
+                    os.remove(shard_path)
+                    found_relationships |= found
+                    unmapped_relationships |= unmapped
+                    missing_entities |= missing
+        print(f"DEBUG: Рёбра собраны из шардов, процессов: {workers}")
+    edges_count = writer.rows_written
+
     print(f"DEBUG: Найдено уникальных отношений в данных: {len(found_relationships)}")
     print(f"DEBUG: Примеры найденных отношений: {list(found_relationships)[:10]}")
     print(f"DEBUG: Незамапленные отношения: {unmapped_relationships}")
     print(f"DEBUG: Примеры отсутствующих сущностей: {list(missing_entities)[:10]}")
-    print(f"DEBUG: Валидных рёбер создано: {len(edges_data)}")
-    
-    # Сохраняем в TSV файл
-    df_edges = pd.DataFrame(edges_data)
-    df_edges.to_csv('edges.tsv', sep='\t', index=False)
+    print(f"DEBUG: Валидных рёбер создано: {edges_count}")
 
 def main():
     """
     Основная функция программы
     """
+    parser = argparse.ArgumentParser(description="Конвертация HALD (Entity_Info.json, Relation_Info.json) в nodes.tsv и edges.tsv.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Процессов для конвертации рёбер (по умолчанию: 1; 0 — по числу ядер)")
+    parser.add_argument("--shard-size", type=int, default=EDGE_SHARD_SIZE,
+                        help=f"Отношений в одном шарде при --workers > 1 (по умолчанию: {EDGE_SHARD_SIZE})")
+    parser.add_argument("--columnar", action="store_true",
+                        help="Маппить рёбра блоками в массивах numpy (нужен numpy; --workers при этом не используется)")
+    parser.add_argument("--format", default='tsv', choices=OUTPUT_FORMATS,
+                        help="Формат nodes/edges (по умолчанию: tsv): tsv.gz и tsv.zst — сжатый TSV, "
+                             "jsonl — KGX JSON Lines, parquet — Parquet (нужен pyarrow)")
+    args = parser.parse_args()
+    workers = args.workers or os.cpu_count() or 1
+    nodes_path = f'nodes.{args.format}'
+    edges_path = f'edges.{args.format}'
+
     print("Загружаем файлы маппинга...")
     entity_mapping, relationship_mapping = load_mapping_files()
     print(f"Загружено {len(entity_mapping)} типов сущностей")
     print(f"Загружено {len(relationship_mapping)} типов отношений")
     
-    print("Загружаем сущности из Entity_Info.json...")
-    entities = load_entities('Entity_Info.json')
-    print(f"Загружено {len(entities)} сущностей")
-    
-    print("Загружаем отношения из Relation_Info.json...")
-    relations = load_relations('Relation_Info.json')
-    print(f"Загружено {len(relations)} отношений")
-    
-    print("Генерируем nodes.tsv...")
-    entity_id_mapping = generate_nodes_tsv(entities, entity_mapping)
-    print(f"Сгенерировано {len(entity_id_mapping)} узлов")
+    # Сущности и отношения читаются потоком и сразу идут в генерацию TSV
+    print(f"Генерируем {nodes_path} из Entity_Info.json...")
+    entity_table = generate_nodes_tsv(stream_entities('Entity_Info.json'), entity_mapping, nodes_path)
+    print(f"Сгенерировано {len(entity_table)} узлов")
     
-    print("Генерируем edges.tsv...")
-    generate_edges_tsv(relations, entity_id_mapping, relationship_mapping)
+    print(f"Генерируем {edges_path} из Relation_Info.json...")
+    generate_edges_tsv(stream_relations('Relation_Info.json'), entity_table, relationship_mapping,
+                       workers=workers, shard_size=args.shard_size, columnar=args.columnar, edges_path=edges_path)
     
-    print("Готово! Файлы nodes.tsv и edges.tsv созданы в формате, совместимом с PloverDB.")
+    print(f"Готово! Файлы {nodes_path} и {edges_path} созданы в формате, совместимом с PloverDB.")
 
 if __name__ == "__main__":
     main()
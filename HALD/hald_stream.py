@@ -0,0 +1,355 @@
+"""
+Потоковое чтение Entity_Info.json / Relation_Info.json датасета HALD.
+
+Файл отображается в память (mmap) и читается скользящим окном текста
+фиксированного размера (RECORD_WINDOW_BYTES). Внешние контейнеры
+(обёртки вида {"data": [...]}) разбираются по событиям — открытие и
+закрытие объекта/массива, ключи и скаляры, — без построения дерева.
+Каждый вложенный контейнер, который целиком помещается в окно, декодируется
+json.JSONDecoder.raw_decode и обходится так же, как рекурсивные
+extract_entities/extract_relations: объект на глубине не больше MAX_DEPTH
+с нужными ключами считается записью, внутрь записи обход не идёт.
+Записи выдаются по одной, память ограничена размером окна.
+
+Контейнер больше окна разбирается по событиям и сам записью не считается.
+
+По первым SCHEMA_SAMPLE_SIZE записям выводится схема: глубина, на которой
+лежат записи, и для каждого встреченного набора ключей записи (не больше
+SCHEMA_MAX_VARIANTS) — имена нужных полей. Дальше контейнер с записями
+(массив или объект) читается отдельным циклом: элемент декодируется и, если его набор ключей известен,
+разбирается без перебора вариантов ключей — поля берутся по готовым именам.
+Остальные объекты (и все объекты, если записи в выборке лежат на разной
+глубине) обрабатываются общим рекурсивным обходом.
+"""
+import re
+import json
+import mmap
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Максимальная глубина вложенности, на которой ищутся записи (как в extract_entities)
+MAX_DEPTH = 3
+
+# Размер окна чтения: контейнеры крупнее разбираются по событиям
+RECORD_WINDOW_BYTES = 1 << 20
+
+# Ключи полей отношения в порядке приоритета
+SOURCE_KEYS = ('source entity', 'source_entity', 'source', 'from', 'subject')
+TARGET_KEYS = ('target entity', 'target_entity', 'target', 'to', 'object')
+RELATIONSHIP_KEYS = ('relationship', 'relation', 'predicate', 'type')
+
+# Сколько первых записей используется для вывода схемы
+SCHEMA_SAMPLE_SIZE = 100
+# Сколько разных наборов ключей записи допускает схема
+SCHEMA_MAX_VARIANTS = 8
+
+# Пробелы, затем один токен: пунктуация, строка, число или литерал
+TOKEN_RE = re.compile(
+    r'[ \t\n\r]*(?:([{}\[\],:])|"[^"\\]*(?:\\.[^"\\]*)*"'
+    r'|-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?|true|false|null)',
+    re.S
+)
+WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+# Что стоит перед значением элемента: в массиве — запятая, в объекте — ещё ключ и двоеточие
+ARRAY_ITEM_PREFIX_RE = re.compile(r'[ \t\n\r]*(?:,[ \t\n\r]*)?')
+OBJECT_ITEM_PREFIX_RE = re.compile(r'[ \t\n\r]*(?:,[ \t\n\r]*)?"[^"\\]*(?:\\.[^"\\]*)*"[ \t\n\r]*:[ \t\n\r]*', re.S)
+
+_decoder = json.JSONDecoder()
+
+class _TextWindow:
+    """
+    Декодированный фрагмент буфера [byte_start, byte_start + размер) и позиция в нём.
+    """
+
+    def __init__(self, buf, size: int):
+        self.buf = buf
+        self.size = size
+        self.pos = 0
+        self._fill(0)
+
+    def _fill(self, byte_start: int):
+        end = min(len(self.buf), byte_start + self.size)
+        chunk = self.buf[byte_start:end]
+        if end < len(self.buf):
+            # Не разрезаем многобайтовый символ UTF-8 на границе окна
+            cut = len(chunk)
+            while cut and chunk[cut - 1] & 0xC0 == 0x80:
+                cut -= 1
+            if cut and chunk[cut - 1] >= 0xC0:
+                cut -= 1
+            chunk = chunk[:cut]
+        self.byte_start = byte_start
+        self.text = chunk.decode('utf-8')
+        self.eof = byte_start + len(chunk) >= len(self.buf)
+        self.pos = 0
+
+    def slide(self) -> bool:
+        """
+        Сдвигает окно так, чтобы оно начиналось с текущей позиции.
+        False — сдвигать некуда (конец файла или окно уже начинается с позиции).
+        """
+        if self.eof or self.pos == 0:
+            return False
+        head = self.text[:self.pos]
+        consumed = len(head) if head.isascii() else len(head.encode('utf-8'))
+        self._fill(self.byte_start + consumed)
+        return True
+
+class RecordSpec:
+    """
+    Описание записи: resolve(объект) возвращает имена ключей нужных полей или None,
+    build(*значения) собирает запись или возвращает None.
+    """
+
+    def __init__(self, resolve: Callable[[dict], Optional[Tuple[str, ...]]], build: Callable[..., Any]):
+        self.resolve = resolve
+        self.build = build
+
+    def extract(self, obj: dict) -> Any:
+        """
+        Общий путь: подбирает ключи по объекту и собирает запись.
+        """
+        keys = self.resolve(obj)
+        if keys is None:
+            return None
+        return self.build(*[obj[key] for key in keys])
+
+class RecordSchema:
+    """
+    Схема записей, выведенная по выборке: глубина записей и функции выборки полей
+    для каждого набора ключей объекта (в порядке ключей объекта).
+    """
+
+    def __init__(self, depth: int, getters: Dict[Tuple[str, ...], Callable[[dict], tuple]]):
+        self.depth = depth
+        self.getters = getters
+
+    @classmethod
+    def infer(cls, samples: List[Tuple[int, Tuple[str, ...], Tuple[str, ...]]]) -> Optional['RecordSchema']:
+        """
+        Схема по выборке (глубина, ключи объекта, ключи полей) или None, если записи
+        лежат на разной глубине или наборов ключей больше SCHEMA_MAX_VARIANTS.
+        """
+        if not samples or any(depth != samples[0][0] for depth, _, _ in samples):
+            return None
+        variants = {keys: fields for _, keys, fields in samples}
+        # itemgetter с одним полем вернул бы значение, а не кортеж
+        if len(variants) > SCHEMA_MAX_VARIANTS or any(len(fields) < 2 for fields in variants.values()):
+            return None
+        return cls(samples[0][0], {keys: itemgetter(*fields) for keys, fields in variants.items()})
+
+def walk_records(obj: Any, depth: int, extract: Callable[[dict], Any], max_depth: int = MAX_DEPTH) -> Iterator[Any]:
+    """
+    Рекурсивный поиск записей в декодированном контейнере, как в extract_entities:
+    extract(объект) возвращает запись или None.
+    """
+    if depth > max_depth:
+        return
+    if isinstance(obj, dict):
+        record = extract(obj)
+        if record is not None:
+            yield record
+        else:
+            for value in obj.values():
+                yield from walk_records(value, depth + 1, extract, max_depth)
+    elif isinstance(obj, list):
+        for item in obj:
+            yield from walk_records(item, depth + 1, extract, max_depth)
+
+def _iter_container_records(text: str, pos: int, container: str, depth: int, schema: RecordSchema,
+                            spec: RecordSpec, max_depth: int) -> Iterator[Any]:
+    """
+    Цикл по элементам-объектам контейнера с записями ('[' или '{'), начиная с pos,
+    по выведенной схеме. Останавливается на первом элементе, который не объект
+    или не декодируется в пределах окна, и возвращает позицию — дальше разбирает
+    общий цикл.
+    """
+    getters = schema.getters
+    build = spec.build
+    extract = spec.extract
+    raw_decode = _decoder.raw_decode
+    skip = (ARRAY_ITEM_PREFIX_RE if container == '[' else OBJECT_ITEM_PREFIX_RE).match
+    length = len(text)
+    while True:
+        m = skip(text, pos)
+        if m is None:
+            return pos
+        pos = m.end()
+        if pos == length or text[pos] != '{':
+            return pos
+        try:
+            obj, end = raw_decode(text, pos)
+        except json.JSONDecodeError:
+            return pos
+        getter = getters.get(tuple(obj))
+        record = build(*getter(obj)) if getter is not None else None
+        if record is not None:
+            yield record
+        else:
+            yield from walk_records(obj, depth, extract, max_depth)
+        pos = end
+
+def iter_records(buf, spec: RecordSpec, max_depth: int = MAX_DEPTH,
+                 window_bytes: Optional[int] = None) -> Iterator[Any]:
+    """
+    Выдаёт записи из JSON в буфере (bytes или mmap) в порядке документа.
+    """
+    window = _TextWindow(buf, window_bytes or RECORD_WINDOW_BYTES)
+    stack = []
+    top_level_done = False
+    extract = spec.extract
+    build = spec.build
+    resolve = spec.resolve
+    # Выборка для вывода схемы; None — выборка закончена
+    samples = []
+    schema = None
+    schema_depth = None
+    schema_getters = {}
+    while True:
+        text = window.text
+        m = TOKEN_RE.match(text, window.pos)
+        if m is None or (m.end() == len(text) and not window.eof):
+            # Токен мог оборваться на границе окна
+            if window.slide():
+                continue
+            if not window.eof:
+                raise ValueError(f"Токен длиннее окна чтения около байта {window.byte_start + window.pos}")
+            if not stack and WHITESPACE_RE.match(text, window.pos).end() == len(text):
+                return
+            raise ValueError(f"Некорректный JSON около байта {window.byte_start + window.pos}")
+        if top_level_done:
+            raise ValueError(f"Лишние данные после JSON около байта {window.byte_start + window.pos}")
+
+        punct = m.group(1)
+        if punct == '{' or punct == '[':
+            start = m.end() - 1
+            try:
+                obj, end = _decoder.raw_decode(text, start)
+            except json.JSONDecodeError as e:
+                if window.eof:
+                    raise ValueError(f"Некорректный JSON около байта {window.byte_start + e.pos}") from e
+                if start > 0:
+                    # Контейнер не поместился в остаток окна — начинаем окно с него
+                    window.pos = start
+                    window.slide()
+                    continue
+                # Не помещается и в целое окно — разбираем по событиям
+                stack.append(punct)
+                window.pos = m.end()
+                continue
+            depth = len(stack)
+            if 0 < depth <= max_depth and type(obj) is dict:
+                # Запись внутри контейнера, разбираемого по событиям: без генератора обхода
+                getter = schema_getters.get(tuple(obj)) if depth == schema_depth else None
+                if getter is not None:
+                    record = build(*getter(obj))
+                else:
+                    keys = resolve(obj)
+                    record = build(*[obj[key] for key in keys]) if keys is not None else None
+                    if record is not None and samples is not None:
+                        samples.append((depth, tuple(obj), keys))
+                        if len(samples) >= SCHEMA_SAMPLE_SIZE:
+                            schema = RecordSchema.infer(samples)
+                            samples = None
+                            if schema is not None:
+                                schema_depth, schema_getters = schema.depth, schema.getters
+                if record is not None:
+                    yield record
+                else:
+                    yield from walk_records(obj, depth, extract, max_depth)
+                if depth == schema_depth:
+                    # Остальные элементы контейнера с записями — специализированным циклом
+                    end = yield from _iter_container_records(text, end, stack[-1], depth, schema, spec, max_depth)
+            else:
+                yield from walk_records(obj, depth, extract, max_depth)
+            window.pos = end
+            top_level_done = not stack
+        elif punct == '}' or punct == ']':
+            if not stack:
+                raise ValueError(f"Лишняя закрывающая скобка около байта {window.byte_start + m.end() - 1}")
+            stack.pop()
+            window.pos = m.end()
+            top_level_done = not stack
+        else:
+            # Ключи и скаляры контейнеров, разбираемых по событиям, записями не являются
+            window.pos = m.end()
+            top_level_done = not stack
+
+def iter_file_records(filepath: str, spec: RecordSpec) -> Iterator[Any]:
+    """
+    iter_records по файлу, отображённому в память.
+    """
+    with open(filepath, 'rb') as f:
+        # Пустой файл отобразить нельзя
+        if f.seek(0, 2) == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            yield from iter_records(buf, spec)
+
+def _first_key(obj: dict, keys) -> Optional[str]:
+    for key in keys:
+        if key in obj:
+            return key
+    return None
+
+def resolve_entity_keys(obj: dict) -> Optional[Tuple[str, str]]:
+    """
+    Ключи имени и типа сущности или None, если у объекта нет ключей entity и type.
+    """
+    if 'entity' in obj and 'type' in obj:
+        return 'entity', 'type'
+    return None
+
+def build_entity(name: Any, entity_type: Any) -> Tuple[Any, Any]:
+    return name, entity_type
+
+def resolve_relation_keys(obj: dict) -> Optional[Tuple[str, str, str]]:
+    """
+    Первые по приоритету ключи source/target/relationship или None, если какого-то нет.
+    """
+    source_key = _first_key(obj, SOURCE_KEYS)
+    target_key = _first_key(obj, TARGET_KEYS)
+    relationship_key = _first_key(obj, RELATIONSHIP_KEYS)
+    if source_key is None or target_key is None or relationship_key is None:
+        return None
+    return source_key, target_key, relationship_key
+
+def build_relation(source: Any, target: Any, relationship: Any) -> Optional[Dict[str, str]]:
+    """
+    Отношение из значений полей или None, если какое-то из них пустое.
+    """
+    if source and target and relationship:
+        return {
+            'source_entity': str(source).strip(),
+            'target_entity': str(target).strip(),
+            'relationship': str(relationship).strip()
+        }
+    return None
+
+ENTITY_SPEC = RecordSpec(resolve_entity_keys, build_entity)
+RELATION_SPEC = RecordSpec(resolve_relation_keys, build_relation)
+
+def entity_from_object(obj: dict) -> Optional[Tuple[Any, Any]]:
+    """
+    Пара (entity_name, entity_type) или None, если у объекта нет ключей entity и type.
+    """
+    return ENTITY_SPEC.extract(obj)
+
+def relation_from_object(obj: dict) -> Optional[Dict[str, str]]:
+    """
+    Отношение из объекта или None, если source/target/relationship не заданы.
+    """
+    return RELATION_SPEC.extract(obj)
+
+def iter_entities(filepath: str) -> Iterator[Tuple[Any, Any]]:
+    """
+    Выдаёт пары (entity_name, entity_type) из Entity_Info.json.
+    """
+    return iter_file_records(filepath, ENTITY_SPEC)
+
+def iter_relations(filepath: str) -> Iterator[Dict[str, str]]:
+    """
+    Выдаёт отношения из Relation_Info.json — словари с ключами
+    source_entity, target_entity, relationship.
+    """
+    return iter_file_records(filepath, RELATION_SPEC)
@@ -0,0 +1,194 @@
+import os
+import json
+import glob
+import time
+import asyncio
+
+from config import CHUNK_MAX_CHARS, CHUNK_OVERLAP
+from chunking import split_article
+from extractor import (
+    Entity_Relationships_Recognition_chunked_async, Entity_Relationships_Recognition_stream_async,
+    KGXWriter, process_kgx_json, telemetry
+)
+
+GLOB_CHARS = set('*?[')
+
+def iter_inputs(source):
+    """
+    Перечисляет статьи из источника пакетного режима.
+    Источник может быть директорией (берутся все *.txt рекурсивно),
+    glob-шаблоном или JSONL-манифестом, в котором каждая строка —
+    объект с полями "id" (необязательно) и "text" или "path".
+
+    Тексты читаются лениво, по одному, чтобы не держать весь корпус в памяти.
+
+    :return: Генератор пар (article_id, article_text).
+    """
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, '**', '*.txt'), recursive=True))
+    elif source.endswith('.jsonl') and os.path.isfile(source):
+        yield from _iter_manifest(source)
+        return
+    elif GLOB_CHARS & set(source):
+        paths = sorted(glob.glob(source, recursive=True))
+    else:
+        paths = [source]
+
+    for path in paths:
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                yield path, file.read()
+        except FileNotFoundError:
+            print(f"Ошибка: Входной файл не найден по пути '{path}'")
+
+def _iter_manifest(manifest_path):
+    """
+    Читает JSONL-манифест. Относительные пути в поле "path" считаются
+    относительно директории манифеста.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Ошибка: строка {line_no} манифеста не является JSON: {e}")
+                continue
+
+            if 'text' in record:
+                yield record.get('id', f"{manifest_path}:{line_no}"), record['text']
+            elif 'path' in record:
+                path = os.path.join(base_dir, record['path'])
+                try:
+                    with open(path, 'r', encoding='utf-8') as file:
+                        yield record.get('id', record['path']), file.read()
+                except FileNotFoundError:
+                    print(f"Ошибка: Входной файл не найден по пути '{path}'")
+            else:
+                print(f"Ошибка: в строке {line_no} манифеста нет полей 'text' или 'path'")
+
+async def run_batch(inputs, nodes_filepath, edges_filepath, concurrency,
+                    chunk_size=CHUNK_MAX_CHARS, chunk_overlap=CHUNK_OVERLAP, stream=False, store=None,
+                    manifest=None):
+    """
+    Обрабатывает поток статей, удерживая одновременно не более `concurrency`
+    запросов к LLM. Результаты дозаписываются в nodes/edges по мере готовности,
+    порядок записи соответствует порядку завершения запросов.
+
+    :param inputs: Итерируемый источник пар (article_id, article_text).
+    :param nodes_filepath: Путь к выходному файлу для узлов (nodes.tsv).
+    :param edges_filepath: Путь к выходному файлу для ребер (edges.tsv).
+    :param concurrency: Максимальное число одновременных запросов (с учётом чанков).
+    :param chunk_size: Максимальный размер чанка в символах; 0 — не делить статьи.
+    :param chunk_overlap: Перекрытие соседних чанков в символах.
+    :param stream: Получать ответ потоком и писать строки по мере готовности
+                   (для статей, которые помещаются в один чанк).
+    :param store: graph_store.GraphStore — писать в дедуплицирующее хранилище вместо TSV.
+    :param manifest: run_manifest.RunManifest — пропускать уже обработанные статьи,
+                     писать строки каждой статьи атомарно и фиксировать результат.
+    :return: Словарь со статистикой прогона.
+    """
+    # Очередь ограничена, чтобы читать входные файлы не быстрее, чем идут запросы
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    request_slots = asyncio.Semaphore(concurrency)
+    stats = {'processed': 0, 'failed': 0, 'skipped': 0}
+    started = time.monotonic()
+    # С манифестом строки статьи пишутся одним блоком после её завершения
+    atomic = manifest is not None
+
+    if stream and store is None and not atomic:
+        # Писатели статей открываются одновременно, поэтому заголовки пишутся один раз заранее
+        # (в режиме atomic заголовок решается при дозаписи блока, см. sinks.BlockSink)
+        KGXWriter.prepare(nodes_filepath, edges_filepath)
+
+    async def producer():
+        for item in inputs:
+            await queue.put(item)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def stream_article(article_text):
+        counts = {'node': 0, 'edge': 0}
+        write_s = 0.0
+        async with request_slots:
+            with store.article() if store is not None else KGXWriter(nodes_filepath, edges_filepath, atomic=atomic) as writer:
+                # Неполный поток — ошибка статьи, как и в непотоковом режиме; пустой граф — нет
+                async for kind, graph_item in Entity_Relationships_Recognition_stream_async(article_text, strict=True):
+                    started = time.perf_counter()
+                    writer.write(kind, graph_item)
+                    write_s += time.perf_counter() - started
+                    counts[kind] = counts.get(kind, 0) + 1
+                # Выход из контекста (в режиме atomic — запись блока с fsync) тоже относится к записи
+                started = time.perf_counter()
+            write_s += time.perf_counter() - started
+        telemetry.add_span('tsv_write', write_s)
+        telemetry.record_items(counts['node'], counts['edge'])
+        return writer, counts['node'], counts['edge']
+
+    async def extract_article(article_text):
+        """
+        Извлекает граф статьи и записывает его; возвращает (writer, узлов, ребер) или None.
+        """
+        if stream:
+            chunks = split_article(article_text, chunk_size)
+            if len(chunks) == 1:
+                return await stream_article(chunks[0])
+        kgx_data = await Entity_Relationships_Recognition_chunked_async(
+            article_text, chunk_size, chunk_overlap, semaphore=request_slots)
+        if kgx_data is None:
+            return None
+        graph = kgx_data.get('graph', {})
+        writer = process_kgx_json(kgx_data, nodes_filepath, edges_filepath, store, atomic=atomic)
+        return writer, len(graph.get('nodes', [])), len(graph.get('edges', []))
+
+    async def worker():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            article_id, article_text = item
+            if manifest is not None and manifest.is_done(article_text):
+                stats['skipped'] += 1
+                continue
+
+            error = ''
+            with telemetry.article(article_id):
+                try:
+                    result = await extract_article(article_text)
+                except Exception as e:
+                    result = None
+                    error = str(e)
+                    print(f"Ошибка обработки статьи '{article_id}': {e}")
+                if result is None:
+                    telemetry.set_failed(error or 'не удалось извлечь граф')
+
+            if result is None:
+                stats['failed'] += 1
+                if not error:
+                    print(f"Статья '{article_id}' пропущена: не удалось извлечь граф.")
+                if manifest is not None:
+                    manifest.record_failed(article_id, article_text, error)
+                continue
+
+            stats['processed'] += 1
+            if manifest is not None:
+                writer, nodes, edges = result
+                manifest.record_done(article_id, article_text, nodes, edges,
+                                     getattr(writer, 'nodes_span', None), getattr(writer, 'edges_span', None))
+
+    await asyncio.gather(producer(), *(worker() for _ in range(concurrency)))
+
+    elapsed = time.monotonic() - started
+    stats['elapsed_s'] = round(elapsed, 2)
+    print(f"Пакетная обработка завершена: успешно {stats['processed']}, "
+          f"с ошибками {stats['failed']}, пропущено по манифесту {stats['skipped']}, за {elapsed:.1f} с.")
+    return stats
+
+def is_batch_source(source):
+    """
+    Проверяет, нужно ли обрабатывать источник в пакетном режиме.
+    """
+    return os.path.isdir(source) or source.endswith('.jsonl') or bool(GLOB_CHARS & set(source))
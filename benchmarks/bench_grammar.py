@@ -0,0 +1,306 @@
+"""
+Бенчмарк стоимости ограниченной грамматикой выборки: исходная грамматика
+SchemaConverter против оптимизированной grammar_optimizer.
+
+GPU-сервер не нужен: грамматика компилируется в упрощённую модель llama.cpp
+(группы и повторения — отдельные правила, литералы — последовательности
+символов), а ответ сопоставляется посимвольно набором стеков разбора, как
+в llama_grammar_accept. llama.cpp на каждом токене проверяет кандидатов по
+всем стекам, поэтому главная метрика — стеков на символ; время сопоставления
+на символ в Python — вспомогательная. Ответы генерируются по JSON-схеме
+экстрактора, поэтому подходят обеим грамматикам.
+
+Заодно проверяется, что оптимизация не изменила язык: целые ответы должны
+приниматься обеими грамматиками, а испорченные — отвергаться на том же
+символе. При расхождении код возврата 1. Запуск из корня репозитория:
+
+    python benchmarks/bench_grammar.py --samples 20 --nodes 8 --edges 6
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from grammar_optimizer import LITERAL_ESCAPE_RE, LITERAL_ESCAPES, optimize_grammar, parse_grammar
+
+# Слова для строковых значений и рассуждения в синтетических ответах
+WORDS = ['gene', 'FOXO3', 'metformin', 'longevity', 'risk', 'cohort', 'mTOR', 'ageing', 'biolink:Gene',
+         'снижает', 'ассоциирован', 'PMID:123456', 'p<0.05', 'dose "high"', 'path\\to']
+
+def _class_chars(body):
+    # Символы класса с признаком экранирования (экранированный '-' не задаёт диапазон)
+    chars = []
+    pos = 0
+    while pos < len(body):
+        match = LITERAL_ESCAPE_RE.match(body, pos)
+        if match:
+            escape = match.group(1)
+            chars.append((chr(int(escape[1:], 16)) if len(escape) > 1 else LITERAL_ESCAPES.get(escape, escape), True))
+            pos = match.end()
+        else:
+            chars.append((body[pos], False))
+            pos += 1
+    return chars
+
+def parse_class(raw):
+    """
+    '[^a-z\\n]' -> (((97, 122), (10, 10)), True); '.' — любой символ.
+    """
+    if raw == '.':
+        return ((0, 0x10FFFF),), False
+    body = raw[1:-1]
+    negated = body.startswith('^')
+    chars = _class_chars(body[1:] if negated else body)
+    ranges = []
+    i = 0
+    while i < len(chars):
+        if i + 2 < len(chars) and chars[i + 1] == ('-', False):
+            ranges.append((ord(chars[i][0]), ord(chars[i + 2][0])))
+            i += 3
+        else:
+            ranges.append((ord(chars[i][0]), ord(chars[i][0])))
+            i += 1
+    return tuple(ranges), negated
+
+class GrammarMatcher:
+    """
+    Посимвольное сопоставление по грамматике набором стеков разбора;
+    expansions — сколько раз раскрывались ссылки на правила (работа llama_grammar_advance_stack).
+    Стек — связный список (номер альтернативы, позиция, родитель); None — пустой стек (разбор завершён).
+    """
+
+    def __init__(self, text, root='root'):
+        self.root = root
+        self.rules = {}
+        self.expansions = 0
+        self._generated = 0
+        for name, alt in parse_grammar(text).items():
+            self.rules[name] = [self._compile_sequence(seq, name) for seq in alt]
+        # Альтернативы нумеруются: в стеке хранится номер, как указатель в llama.cpp
+        self.alternatives = []
+        self.rule_alternatives = {}
+        for name, alts in self.rules.items():
+            self.rule_alternatives[name] = list(range(len(self.alternatives), len(self.alternatives) + len(alts)))
+            self.alternatives.extend(alts)
+
+    def _new_rule(self, base, alternatives):
+        self._generated += 1
+        name = f'{base}_{self._generated}'
+        self.rules[name] = [tuple(alt) for alt in alternatives]
+        return ('ref', name)
+
+    def _compile_atom(self, kind, value, rule):
+        if kind == 'lit':
+            return [('char', ((ord(c), ord(c)),), False) for c in value]
+        if kind == 'cls':
+            return [('char', *parse_class(value))]
+        if kind == 'ref':
+            return [('ref', value)]
+        return [self._new_rule(rule, [self._compile_sequence(seq, rule) for seq in value])]
+
+    def _compile_sequence(self, seq, rule):
+        elements = []
+        for kind, value, quant in seq:
+            atom = self._compile_atom(kind, value, rule)
+            if not quant:
+                elements.extend(atom)
+                continue
+            if len(atom) != 1:
+                atom = [self._new_rule(rule, [atom])]
+            if quant == '?':
+                min_count, max_count = 0, 1
+            elif quant == '*':
+                min_count, max_count = 0, None
+            elif quant == '+':
+                min_count, max_count = 1, None
+            else:
+                bounds = quant[1:-1].split(',')
+                min_count = int(bounds[0] or 0)
+                max_count = int(bounds[-1]) if bounds[-1] else None
+            elements.extend(atom * min_count)
+            if max_count is None:
+                # x* -> star ::= x star | ()
+                self._generated += 1
+                star = f'{rule}_{self._generated}'
+                self.rules[star] = [tuple(atom + [('ref', star)]), ()]
+                elements.append(('ref', star))
+            elif max_count > min_count:
+                # x{0,n} -> вложенные необязательные: (x (x ...)?)?
+                optional = self._new_rule(rule, [atom, []])
+                for _ in range(max_count - min_count - 1):
+                    optional = self._new_rule(rule, [atom + [optional], []])
+                elements.append(optional)
+        return tuple(elements)
+
+    def _advance(self, stack, out):
+        # Раскрывает ссылки на правила, пока на вершине стека не окажется символ
+        alternatives = self.alternatives
+        while stack is not None and stack[1] == len(alternatives[stack[0]]):
+            stack = stack[2]
+        if stack is None:
+            out.add(None)
+            return
+        alt, pos, parent = stack
+        element = alternatives[alt][pos]
+        if element[0] == 'ref':
+            self.expansions += 1
+            # Как в llama.cpp: законченная альтернатива не остаётся в стеке под вложенным правилом
+            below = (alt, pos + 1, parent) if pos + 1 < len(alternatives[alt]) else parent
+            for sub in self.rule_alternatives[element[1]]:
+                self._advance((sub, 0, below), out)
+        else:
+            out.add(stack)
+
+    def initial(self):
+        stacks = set()
+        for alt in self.rule_alternatives[self.root]:
+            self._advance((alt, 0, None), stacks)
+        return stacks
+
+    def accept(self, stacks, c):
+        code = ord(c)
+        out = set()
+        for stack in stacks:
+            if stack is None:
+                continue
+            alt, pos, parent = stack
+            _, ranges, negated = self.alternatives[alt][pos]
+            if any(lo <= code <= hi for lo, hi in ranges) != negated:
+                self._advance((alt, pos + 1, parent), out)
+        return out
+
+    def match(self, text):
+        """
+        (принят ли текст целиком, позиция первого отвергнутого символа или None, стеков по символам).
+        """
+        stacks = self.initial()
+        counts = []
+        for i, c in enumerate(text):
+            counts.append(len(stacks))
+            stacks = self.accept(stacks, c)
+            if not stacks:
+                return False, i, counts
+        return None in stacks, None, counts
+
+def sample_value(schema, rng, sizes, name=''):
+    """
+    Случайное значение по JSON-схеме: обязательные свойства в порядке схемы, затем часть
+    необязательных (тот же порядок задаёт SchemaConverter); sizes — длины массивов по имени свойства.
+    """
+    if 'const' in schema:
+        return schema['const']
+    if 'enum' in schema:
+        return rng.choice(schema['enum'])
+    types = schema.get('type', 'object')
+    if isinstance(types, list):
+        non_null = [t for t in types if t != 'null']
+        types = rng.choice(non_null) if non_null and (rng.random() < 0.8 or 'null' not in types) else 'null'
+    if types == 'null':
+        return None
+    if types == 'object':
+        properties = schema.get('properties', {})
+        required = schema.get('required', [])
+        names = [key for key in properties if key in required] + \
+                [key for key in properties if key not in required and rng.random() < 0.5]
+        return {key: sample_value(properties[key], rng, sizes, key) for key in names}
+    if types == 'array':
+        count = sizes.get(name, rng.randint(0, 3))
+        return [sample_value(schema.get('items', {}), rng, sizes) for _ in range(count)]
+    if types in ('number', 'integer'):
+        return round(rng.uniform(0, 1), 2) if types == 'number' else rng.randint(0, 100)
+    if types == 'boolean':
+        return rng.random() < 0.5
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+
+def sample_response(schema, rng, nodes, edges, thinking_chars):
+    thinking = ' '.join(rng.choice(WORDS) for _ in range(thinking_chars)).replace('<', '≤')[:thinking_chars]
+    graph = sample_value(schema, rng, {'nodes': nodes, 'edges': edges})
+    return f"<thinking>{thinking}</thinking>\n" + json.dumps(graph, ensure_ascii=False)
+
+def corrupt(text, rng):
+    pos = rng.randrange(len(text))
+    return text[:pos] + rng.choice('{}[]",:0a \\<') + text[pos + 1:]
+
+def measure(matcher, samples, runs):
+    """
+    Медиана времени сопоставления на символ (мкс), стеки на символ (среднее и максимум)
+    и раскрытия правил на символ.
+    """
+    chars = sum(len(sample) for sample in samples)
+    timings = []
+    counts = []
+    for _ in range(runs):
+        counts = []
+        matcher.expansions = 0
+        started = time.perf_counter()
+        for sample in samples:
+            accepted, _, sample_counts = matcher.match(sample)
+            if not accepted:
+                raise ValueError("Синтетический ответ не соответствует грамматике")
+            counts.extend(sample_counts)
+        timings.append((time.perf_counter() - started) / chars * 1e6)
+    return {
+        'us_per_char': round(statistics.median(timings), 2),
+        'stacks_mean': round(statistics.mean(counts), 2),
+        'stacks_max': max(counts),
+        'expansions': round(matcher.expansions / chars, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк выборки по исходной и оптимизированной грамматике.')
+    parser.add_argument('--samples', type=int, default=20, help='Число синтетических ответов (по умолчанию: 20)')
+    parser.add_argument('--nodes', type=int, default=8, help='Узлов в ответе (по умолчанию: 8)')
+    parser.add_argument('--edges', type=int, default=6, help='Ребер в ответе (по умолчанию: 6)')
+    parser.add_argument('--thinking-chars', type=int, default=400, help='Длина рассуждения (по умолчанию: 400)')
+    parser.add_argument('--runs', type=int, default=3, help='Число повторов замера (по умолчанию: 3)')
+    parser.add_argument('--seed', type=int, default=0, help='Зерно генератора ответов')
+    parser.add_argument('--show', action='store_true', help='Напечатать оптимизированную грамматику')
+    args = parser.parse_args()
+
+    import extractor
+    schema = extractor.get_main_extractor_schema()
+    original = extractor.convert_schema_to_grammar(schema, optimize=False)
+    optimized, stats = optimize_grammar(original)
+    if args.show:
+        print(optimized)
+    print(f"Правил: {stats['rules_before']} -> {stats['rules_after']} (слито {stats.get('deduplicated', 0)}, "
+          f"подставлено {stats.get('inlined', 0)}, удалено {stats.get('removed', 0)}, "
+          f"альтернатив с общим префиксом {stats.get('factored', 0)})")
+
+    rng = random.Random(args.seed)
+    samples = [sample_response(schema, rng, args.nodes, args.edges, args.thinking_chars) for _ in range(args.samples)]
+    matchers = {'original': GrammarMatcher(original), 'optimized': GrammarMatcher(optimized)}
+
+    # Одинаковый язык: те же решения на целых, обрезанных и испорченных ответах
+    mismatches = 0
+    for sample in samples:
+        for text in [sample, sample[:rng.randrange(len(sample))]] + [corrupt(sample, rng) for _ in range(20)]:
+            verdicts = {name: matcher.match(text)[:2] for name, matcher in matchers.items()}
+            if verdicts['original'] != verdicts['optimized']:
+                mismatches += 1
+                print(f"Расхождение грамматик: {verdicts} на {text[:80]!r}...")
+
+    results = {name: measure(matcher, samples, args.runs) for name, matcher in matchers.items()}
+    chars = sum(len(sample) for sample in samples)
+    print(f"{args.samples} ответов, {chars} символов")
+    print(f"{'грамматика':<12}{'правил':>8}{'стеков/симв.':>15}{'макс. стеков':>14}"
+          f"{'раскрытий/симв.':>17}{'мкс/симв.':>11}")
+    for name, result in results.items():
+        rules = stats['rules_before'] if name == 'original' else stats['rules_after']
+        print(f"{name:<12}{rules:>8}{result['stacks_mean']:>15}{result['stacks_max']:>14}"
+              f"{result['expansions']:>17}{result['us_per_char']:>11}")
+    base, new = results['original'], results['optimized']
+    for title, key in (('стеков на символ', 'stacks_mean'), ('раскрытий правил', 'expansions'), ('время', 'us_per_char')):
+        print(f"{title}: {(new[key] / base[key] - 1) * 100:+.1f}%")
+    if mismatches:
+        print(f"Грамматики расходятся на {mismatches} текстах")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Бенчмарк стоимости импорта extractor и первой сборки грамматики.
+
+Каждое измерение выполняется в отдельном процессе интерпретатора, чтобы
+модули не были закэшированы в sys.modules. Запуск из корня репозитория:
+
+    python benchmarks/bench_import.py --runs 10 --max-import-ms 150
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Время импорта и сборки грамматики измеряется внутри дочернего процесса
+MEASURE_SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+import extractor
+t1 = time.perf_counter()
+extractor.get_grammar()
+t2 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "grammar_ms": (t2 - t1) * 1000}))
+"""
+
+def run_once(grammar_cache_dir):
+    env = dict(os.environ, GRAMMAR_CACHE_DIR=grammar_cache_dir)
+    result = subprocess.run(
+        [sys.executable, '-c', MEASURE_SNIPPET],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def top_imports(limit):
+    """
+    Самые дорогие модули по данным python -X importtime (накопительное время, мкс).
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import extractor'],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк времени импорта extractor и сборки грамматики.')
+    parser.add_argument('--runs', type=int, default=10, help='Число запусков (по умолчанию: 10)')
+    parser.add_argument('--top', type=int, default=10, help='Сколько самых дорогих импортов показать')
+    parser.add_argument('--max-import-ms', type=float, default=None,
+                        help='Порог медианы времени импорта; при превышении код возврата 1')
+    args = parser.parse_args()
+
+    cache_dir = tempfile.mkdtemp(prefix='grammar_cache_')
+    try:
+        cold = run_once(cache_dir)  # первый запуск собирает грамматику и кладёт её в кэш
+        warm = [run_once(cache_dir) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    import_ms = statistics.median(r['import_ms'] for r in warm)
+    print(f"import extractor: медиана {import_ms:.1f} мс "
+          f"(мин {min(r['import_ms'] for r in warm):.1f}, макс {max(r['import_ms'] for r in warm):.1f}), запусков: {args.runs}")
+    print(f"get_grammar(): без кэша {cold['grammar_ms']:.1f} мс, "
+          f"из кэша {statistics.median(r['grammar_ms'] for r in warm):.1f} мс")
+
+    print("\nСамые дорогие импорты (накопительно, мс):")
+    for cumulative_us, self_us, name in top_imports(args.top):
+        print(f"  {cumulative_us / 1000:8.1f}  {name}")
+
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print(f"\nРегрессия: медиана импорта {import_ms:.1f} мс больше порога {args.max_import_ms} мс")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+"""
+Сквозной бенчмарк пайплайна извлечения на локальном mock-сервере.
+
+Поднимает benchmarks/mock_server.py в отдельном процессе (его CPU не
+попадает в измерения), генерирует синтетический корпус и прогоняет стадии:
+
+- recognition — Entity_Relationships_Recognition по статьям последовательно;
+- process_kgx_json — запись полученных графов в TSV;
+- batch — run_batch (то, что выполняет txt2KGX для директории) для каждой
+  комбинации размера корпуса и concurrency;
+- txt2KGX — запуск CLI отдельным процессом на самом большом корпусе.
+
+Для каждой стадии печатаются статей/с, p50/p95 задержки на статью,
+процессорное время и пиковый RSS. Запуск из корня репозитория:
+
+    python benchmarks/bench_pipeline.py --sizes 20,100 --concurrency 1,8,32 --latency-ms 200 --tokens-per-s 300
+
+С --json результаты сохраняются, с --baseline сравниваются с прошлым
+сохранённым прогоном: падение статей/с больше --tolerance даёт код возврата 1.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Шаблон абзаца синтетической статьи
+PARAGRAPH = ("Исследование {i} показало, что ген FOXO3 ассоциирован с продолжительностью жизни, "
+             "а приём метформина снижает риск возрастных заболеваний у пациентов группы {j}. ")
+
+def percentile(values, q):
+    """
+    Перцентиль по ближайшему рангу; q в диапазоне 0..100.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def make_corpus(directory, size, article_chars):
+    os.makedirs(directory, exist_ok=True)
+    for i in range(size):
+        text, j = '', 0
+        while len(text) < article_chars:
+            text += PARAGRAPH.format(i=i, j=j)
+            j += 1
+        with open(os.path.join(directory, f'article_{i:05d}.txt'), 'w', encoding='utf-8') as f:
+            f.write(f'# Статья {i}\n\n{text}\n')
+    return directory
+
+def start_mock(args):
+    command = [sys.executable, os.path.join(REPO_ROOT, 'benchmarks', 'mock_server.py'), '--port', '0',
+               '--latency-ms', str(args.latency_ms), '--tokens-per-s', str(args.tokens_per_s),
+               '--error-rate', str(args.error_rate), '--capacity', str(args.capacity),
+               '--nodes', str(args.nodes), '--edges', str(args.edges)]
+    if args.responses:
+        command += ['--responses', args.responses]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line:
+        raise RuntimeError('mock-сервер не запустился')
+    return process, line.rsplit(' ', 1)[-1].strip()
+
+class StageMeter:
+    """
+    Замеряет стену, процессорное время и память стадии.
+    """
+
+    def __init__(self, name, trace_memory=False):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.latencies = []
+        self.articles = 0
+        self.failed = 0
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall_s = time.perf_counter() - self._wall
+        self.cpu_s = time.process_time() - self._cpu
+        self.heap_peak_mb = None
+        if self.trace_memory:
+            self.heap_peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        # ru_maxrss в Linux — в КБ
+        self.rss_peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def result(self, **extra):
+        return {
+            'stage': self.name,
+            **extra,
+            'articles': self.articles,
+            'failed': self.failed,
+            'wall_s': round(self.wall_s, 3),
+            'articles_per_s': round(self.articles / self.wall_s, 2) if self.wall_s else 0.0,
+            'p50_ms': round(percentile(self.latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(self.latencies, 95) * 1000, 1),
+            'cpu_s': round(self.cpu_s, 3),
+            'cpu_ms_per_article': round(self.cpu_s / self.articles * 1000, 2) if self.articles else 0.0,
+            'rss_peak_mb': round(self.rss_peak_mb, 1),
+            'heap_peak_mb': round(self.heap_peak_mb, 1) if self.heap_peak_mb is not None else None,
+        }
+
+def bench_recognition(articles, trace_memory):
+    import extractor
+    graphs = []
+    with StageMeter('recognition', trace_memory) as meter:
+        for _, text in articles:
+            started = time.perf_counter()
+            result = extractor.Entity_Relationships_Recognition(text)
+            meter.latencies.append(time.perf_counter() - started)
+            meter.articles += 1
+            if result is None:
+                meter.failed += 1
+            else:
+                graphs.append(result)
+    return meter.result(size=len(articles), concurrency=1), graphs
+
+def bench_process_kgx_json(graphs, workdir, trace_memory):
+    import extractor
+    nodes_file, edges_file = os.path.join(workdir, 'pk_nodes.tsv'), os.path.join(workdir, 'pk_edges.tsv')
+    with open(os.devnull, 'w') as devnull, StageMeter('process_kgx_json', trace_memory) as meter:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            for graph in graphs:
+                started = time.perf_counter()
+                extractor.process_kgx_json(graph, nodes_file, edges_file)
+                meter.latencies.append(time.perf_counter() - started)
+                meter.articles += 1
+        finally:
+            sys.stdout = stdout
+    return meter.result(size=len(graphs), concurrency=1)
+
+def bench_batch(corpus_dir, size, concurrency, stream, workdir, trace_memory):
+    import batch
+    from extractor import Entity_Relationships_Recognition_chunked_async
+
+    meter = StageMeter('batch', trace_memory)
+
+    # Задержка на статью — время извлечения графа, включая ожидание слота
+    async def timed_recognition(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await Entity_Relationships_Recognition_chunked_async(*args, **kwargs)
+        finally:
+            meter.latencies.append(time.perf_counter() - started)
+
+    async def timed_stream(article_text, strict=False):
+        started = time.perf_counter()
+        try:
+            async for item in stream_async(article_text, strict=strict):
+                yield item
+        finally:
+            meter.latencies.append(time.perf_counter() - started)
+
+    stream_async = batch.Entity_Relationships_Recognition_stream_async
+    patched = {'Entity_Relationships_Recognition_chunked_async': timed_recognition,
+               'Entity_Relationships_Recognition_stream_async': timed_stream}
+    originals = {name: getattr(batch, name) for name in patched}
+    nodes_file = os.path.join(workdir, f'batch_{size}_{concurrency}_nodes.tsv')
+    edges_file = os.path.join(workdir, f'batch_{size}_{concurrency}_edges.tsv')
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        for name, func in patched.items():
+            setattr(batch, name, func)
+        try:
+            with meter:
+                stats = asyncio.run(batch.run_batch(batch.iter_inputs(corpus_dir), nodes_file, edges_file,
+                                                    concurrency, stream=stream))
+        finally:
+            sys.stdout = stdout
+            for name, func in originals.items():
+                setattr(batch, name, func)
+    meter.articles = stats['processed'] + stats['failed']
+    meter.failed = stats['failed']
+    return meter.result(size=size, concurrency=concurrency, stream=stream)
+
+def bench_cli(corpus_dir, size, concurrency, stream, workdir, env):
+    """
+    Сквозной запуск txt2KGX.py отдельным процессом (с импортом модулей и сборкой грамматики).
+    """
+    command = [sys.executable, os.path.join(REPO_ROOT, 'txt2KGX.py'), corpus_dir,
+               '--nodes-file', os.path.join(workdir, 'cli_nodes.tsv'),
+               '--edges-file', os.path.join(workdir, 'cli_edges.tsv'),
+               '--concurrency', str(concurrency), '--no-cache']
+    if stream:
+        command.append('--stream')
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.perf_counter()
+    subprocess.run(command, cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, check=True)
+    wall_s = time.perf_counter() - started
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_s = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return {
+        'stage': 'txt2KGX', 'size': size, 'concurrency': concurrency, 'stream': stream,
+        'articles': size, 'failed': None, 'wall_s': round(wall_s, 3),
+        'articles_per_s': round(size / wall_s, 2), 'p50_ms': None, 'p95_ms': None,
+        'cpu_s': round(cpu_s, 3), 'cpu_ms_per_article': round(cpu_s / size * 1000, 2),
+        'rss_peak_mb': round(after.ru_maxrss / 1024, 1), 'heap_peak_mb': None,
+    }
+
+def print_results(results):
+    header = (f"{'стадия':<17}{'статей':>7}{'conc':>6}{'ошибок':>8}{'стат/с':>9}{'p50 мс':>9}{'p95 мс':>9}"
+              f"{'CPU мс/ст':>11}{'RSS МБ':>9}{'heap МБ':>9}")
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        def fmt(value, width, digits=1):
+            return f"{'—':>{width}}" if value is None else f"{value:>{width}.{digits}f}"
+        print(f"{r['stage']:<17}{r['size']:>7}{r['concurrency']:>6}{'—' if r['failed'] is None else r['failed']:>8}"
+              f"{fmt(r['articles_per_s'], 9, 2)}{fmt(r['p50_ms'], 9)}{fmt(r['p95_ms'], 9)}"
+              f"{fmt(r['cpu_ms_per_article'], 11, 2)}{fmt(r['rss_peak_mb'], 9)}{fmt(r['heap_peak_mb'], 9)}")
+
+def compare_with_baseline(results, baseline_path, tolerance):
+    """
+    Возвращает список регрессий статей/с относительно сохранённого прогона.
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(r['stage'], r['size'], r['concurrency']): r for r in json.load(f)['results']}
+    regressions = []
+    for r in results:
+        old = baseline.get((r['stage'], r['size'], r['concurrency']))
+        if old and old['articles_per_s'] and r['articles_per_s'] < old['articles_per_s'] * (1 - tolerance):
+            regressions.append(f"{r['stage']} (статей {r['size']}, concurrency {r['concurrency']}): "
+                               f"{r['articles_per_s']} < {old['articles_per_s']} статей/с")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Сквозной бенчмарк пайплайна на локальном mock-сервере.')
+    parser.add_argument('--sizes', type=str, default='20,100', help='Размеры корпуса через запятую')
+    parser.add_argument('--concurrency', type=str, default='1,8,32', help='Уровни concurrency через запятую')
+    parser.add_argument('--article-chars', type=int, default=3000, help='Длина синтетической статьи, символов')
+    parser.add_argument('--sequential', type=int, default=10,
+                        help='Сколько статей прогнать через recognition/process_kgx_json последовательно')
+    parser.add_argument('--stream', action='store_true', help='Потоковый режим в batch и txt2KGX')
+    parser.add_argument('--latency-ms', type=float, default=200.0, help='Задержка mock-сервера до первого токена')
+    parser.add_argument('--tokens-per-s', type=float, default=0.0, help='Скорость генерации mock-сервера')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 503 mock-сервера')
+    parser.add_argument('--capacity', type=int, default=0,
+                        help='Ёмкость mock-сервера (одновременных запросов, сверх — 429); 0 — без ограничения')
+    parser.add_argument('--nodes', type=int, default=8, help='Узлов в синтетическом ответе')
+    parser.add_argument('--edges', type=int, default=6, help='Ребер в синтетическом ответе')
+    parser.add_argument('--responses', type=str, default=None, help='JSONL с записанными ответами модели')
+    parser.add_argument('--no-cli', action='store_true', help='Не запускать txt2KGX.py отдельным процессом')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Пик памяти Python-кучи по стадиям через tracemalloc (замедляет прогон)')
+    parser.add_argument('--json', type=str, default=None, help='Сохранить результаты в JSON')
+    parser.add_argument('--baseline', type=str, default=None, help='JSON прошлого прогона для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Допустимое падение статей/с (доля)')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    levels = [int(c) for c in args.concurrency.split(',')]
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    mock, base_url = start_mock(args)
+    try:
+        # Конфигурация читается при импорте, поэтому окружение задаётся до импорта extractor
+        os.environ.update(OAI_COMPATIBLE_BASE_URL=base_url, OAI_COMPATIBLE_API_KEY='mock', MODEL_NAME='mock',
+                          LLM_CACHE_DISABLED='1', PROMPT_CACHE='')
+        import extractor
+        # Прогрев: импорт openai, создание клиента и сборка грамматики не входят в замеры
+        extractor.Entity_Relationships_Recognition('прогрев')
+
+        results = []
+        corpora = {size: make_corpus(os.path.join(workdir, f'corpus_{size}'), size, args.article_chars)
+                   for size in sizes}
+        from batch import iter_inputs
+        sample = list(iter_inputs(corpora[min(sizes)]))[:args.sequential]
+        recognition, graphs = bench_recognition(sample, args.trace_memory)
+        results.append(recognition)
+        results.append(bench_process_kgx_json(graphs, workdir, args.trace_memory))
+        for size in sizes:
+            for concurrency in levels:
+                results.append(bench_batch(corpora[size], size, concurrency, args.stream, workdir, args.trace_memory))
+        if not args.no_cli:
+            results.append(bench_cli(corpora[max(sizes)], max(sizes), max(levels), args.stream, workdir,
+                                     dict(os.environ)))
+    finally:
+        mock.terminate()
+        mock.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"mock: задержка {args.latency_ms} мс, {args.tokens_per_s or '∞'} ток/с, ошибок {args.error_rate:.0%}, "
+          f"поток: {'да' if args.stream else 'нет'}\n")
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        if regressions:
+            print("\nРегрессия пропускной способности:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Бенчмарк генератора грамматик на схеме с большими перечислениями.
+
+Схема экстрактора дополняется enum на category узла и predicate ребра
+размером со списки классов и предикатов Biolink (синтетические термины
+biolink:..., с общими префиксами, как у настоящих). Печатаются время
+SchemaConverter и grammar_optimizer, размер грамматики (правил и байт) и
+стоимость выборки по модели сопоставления из bench_grammar.py: стеков
+разбора на символ и их максимум — большое перечисление без вынесения
+префиксов держит по стеку на каждое значение в начале поля. Запуск из
+корня репозитория:
+
+    python benchmarks/bench_schema.py --categories 1000 --predicates 300
+"""
+import os
+import sys
+import copy
+import time
+import random
+import argparse
+import statistics
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from grammar_optimizer import optimize_grammar
+from bench_grammar import GrammarMatcher, measure, sample_response
+
+CLASS_WORDS = ['Gene', 'Genetic', 'Gene', 'Protein', 'Chemical', 'Clinical', 'Disease', 'Drug', 'Molecular',
+               'Organism', 'Anatomical', 'Cellular', 'Biological', 'Phenotypic', 'Population', 'Exposure',
+               'Entity', 'Process', 'Activity', 'Feature', 'Product', 'Variant', 'Mixture', 'Attribute']
+PREDICATE_WORDS = ['positively', 'negatively', 'regulates', 'affects', 'associated', 'with', 'increased',
+                   'decreased', 'likelihood', 'of', 'causes', 'treats', 'has', 'part', 'expression',
+                   'activity', 'abundance', 'response', 'to', 'in', 'correlated', 'contributes']
+
+def synthetic_terms(words, count, rng, joiner):
+    # Термины из 1–4 слов; повторяющиеся начала дают общие префиксы, как у Biolink
+    terms = {}
+    while len(terms) < count:
+        parts = [rng.choice(words) for _ in range(rng.randint(1, 4))]
+        term = 'biolink:' + joiner.join(parts)
+        terms.setdefault(term, None)
+    return list(terms)
+
+def large_enum_schema(schema, categories, predicates):
+    schema = copy.deepcopy(schema)
+    graph = schema['properties']['graph']['properties']
+    graph['nodes']['items']['properties']['category'] = {'type': 'string', 'enum': categories}
+    graph['edges']['items']['properties']['predicate'] = {'type': 'string', 'enum': predicates}
+    return schema
+
+def timed(fn, runs):
+    timings, result = [], None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк генератора грамматик на больших перечислениях.')
+    parser.add_argument('--categories', type=int, default=1000, help='Значений enum категории узла (по умолчанию: 1000)')
+    parser.add_argument('--predicates', type=int, default=300, help='Значений enum предиката ребра (по умолчанию: 300)')
+    parser.add_argument('--samples', type=int, default=10, help='Число синтетических ответов (по умолчанию: 10)')
+    parser.add_argument('--nodes', type=int, default=8, help='Узлов в ответе (по умолчанию: 8)')
+    parser.add_argument('--edges', type=int, default=6, help='Ребер в ответе (по умолчанию: 6)')
+    parser.add_argument('--runs', type=int, default=3, help='Число повторов замера (по умолчанию: 3)')
+    parser.add_argument('--seed', type=int, default=0, help='Зерно генератора терминов и ответов')
+    args = parser.parse_args()
+
+    import extractor
+    rng = random.Random(args.seed)
+    schema = large_enum_schema(extractor.get_main_extractor_schema(),
+                               synthetic_terms(CLASS_WORDS, args.categories, rng, ''),
+                               synthetic_terms(PREDICATE_WORDS, args.predicates, rng, '_'))
+    root_rule = extractor.thinking_root_rule('unbounded')
+
+    original, convert_ms = timed(
+        lambda: extractor.convert_schema_to_grammar(schema, optimize=False, root_rule=root_rule), args.runs)
+    (optimized, stats), optimize_ms = timed(lambda: optimize_grammar(original), args.runs)
+    print(f"enum: {args.categories} категорий, {args.predicates} предикатов")
+    print(f"SchemaConverter: {convert_ms:.1f} мс, правил {stats['rules_before']}, {len(original.encode('utf-8'))} байт")
+    print(f"grammar_optimizer: {optimize_ms:.1f} мс, правил {stats['rules_after']}, {len(optimized.encode('utf-8'))} байт")
+
+    samples = [sample_response(schema, rng, args.nodes, args.edges, 200) for _ in range(args.samples)]
+    print(f"{'грамматика':<12}{'стеков/симв.':>15}{'макс. стеков':>14}{'раскрытий/симв.':>17}{'мкс/симв.':>11}")
+    for name, grammar in (('original', original), ('optimized', optimized)):
+        result = measure(GrammarMatcher(grammar), samples, args.runs)
+        print(f"{name:<12}{result['stacks_mean']:>15}{result['stacks_max']:>14}"
+              f"{result['expansions']:>17}{result['us_per_char']:>11}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""
+Локальный заменитель OpenAI-совместимого сервера (llama.cpp) для бенчмарков.
+
+Отвечает на POST /v1/chat/completions ответами вида
+<thinking>...</thinking>{json} — синтетическими или записанными заранее
+(JSONL, по строке {"content": "..."} на ответ). Задержка до первого токена,
+скорость генерации, доля ошибок, ёмкость (число одновременно обслуживаемых
+запросов, сверх неё — 429) и потоковая выдача настраиваются, поэтому
+пропускную способность пайплайна можно измерять без GPU-сервера:
+
+    python benchmarks/mock_server.py --port 18080 --latency-ms 300 --tokens-per-s 200 --error-rate 0.02 --capacity 4
+"""
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Грубая оценка длины токена в символах для имитации скорости генерации
+CHARS_PER_TOKEN = 4
+
+def synthetic_content(article_text, nodes=8, edges=6, thinking_chars=400):
+    """
+    Детерминированный по тексту статьи ответ модели с заданным числом узлов и ребер.
+    """
+    seed = int(hashlib.sha256(article_text.encode('utf-8')).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    categories = ['biolink:Gene', 'biolink:Disease', 'biolink:ChemicalEntity', 'biolink:PhenotypicFeature']
+    predicates = ['biolink:causes', 'biolink:treats', 'biolink:associated_with', 'biolink:affects']
+    graph_nodes = [{
+        "id": f"MOCK:{seed % 100000}_{i}",
+        "name": f"entity {seed % 1000}-{i}",
+        "category": rng.choice(categories),
+        "description": "synthetic node",
+        "confidence_score": round(rng.uniform(0.5, 1.0), 2),
+        "additional_fields": {"evidence_publication": [f"PMID:{rng.randint(1, 10 ** 7)}"]},
+    } for i in range(nodes)]
+    graph_edges = [{
+        "subject": graph_nodes[rng.randrange(nodes)]["id"],
+        "object": graph_nodes[rng.randrange(nodes)]["id"],
+        "predicate": rng.choice(predicates),
+        "confidence_score": round(rng.uniform(0.5, 1.0), 2),
+        "provided_by": "mock",
+        "evidence_publication": [f"PMID:{rng.randint(1, 10 ** 7)}"],
+    } for _ in range(edges if nodes else 0)]
+    thinking = ('x' * thinking_chars)
+    return f"<thinking>{thinking}</thinking>\n" + json.dumps({"graph": {"nodes": graph_nodes, "edges": graph_edges}},
+                                                            ensure_ascii=False)
+
+def load_recorded(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line)['content'] for line in f if line.strip()]
+
+class MockSettings:
+    """
+    Параметры имитации; поля можно менять на лету между прогонами.
+    """
+
+    def __init__(self, latency_ms=200.0, tokens_per_s=0.0, error_rate=0.0, nodes=8, edges=6,
+                 thinking_chars=400, recorded=None, seed=0, capacity=0):
+        self.latency_ms = latency_ms
+        self.tokens_per_s = tokens_per_s
+        self.error_rate = error_rate
+        self.nodes = nodes
+        self.edges = edges
+        self.thinking_chars = thinking_chars
+        self.recorded = recorded or []
+        # 0 — без ограничения одновременных запросов
+        self.capacity = capacity
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.rejected = 0
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def next_content(self, article_text):
+        if self.recorded:
+            with self.lock:
+                return self.recorded[self.requests % len(self.recorded)]
+        return synthetic_content(article_text, self.nodes, self.edges, self.thinking_chars)
+
+    def enter(self):
+        """
+        Занимает место обслуживания запроса; False — сервер перегружен.
+        """
+        with self.lock:
+            if self.capacity and self.in_flight >= self.capacity:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def should_fail(self):
+        with self.lock:
+            self.requests += 1
+            failed = self.rng.random() < self.error_rate
+            self.errors += failed
+            return failed
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    settings: MockSettings = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # /health и /v1/models — для проверки готовности
+        self._send_json(200, {"status": "ok", "data": [{"id": "mock", "object": "model"}]})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        settings = self.settings
+        if not settings.enter():
+            self._send_json(429, {"error": {"message": "mock capacity exceeded", "type": "rate_limit_error"}})
+            return
+        try:
+            self._complete(request, settings)
+        finally:
+            settings.leave()
+
+    def _complete(self, request, settings):
+        messages = request.get('messages') or [{}]
+        article_text = messages[-1].get('content', '')
+
+        time.sleep(settings.latency_ms / 1000)
+        if settings.should_fail():
+            self._send_json(503, {"error": {"message": "mock overload", "type": "server_error"}})
+            return
+
+        content = settings.next_content(article_text)
+        completion_tokens = max(1, len(content) // CHARS_PER_TOKEN)
+        prompt_tokens = max(1, sum(len(m.get('content', '')) for m in messages) // CHARS_PER_TOKEN)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        timings = {"prompt_n": prompt_tokens, "prompt_ms": settings.latency_ms,
+                   "predicted_n": completion_tokens,
+                   "predicted_ms": completion_tokens / settings.tokens_per_s * 1000 if settings.tokens_per_s else 0.0}
+        model = request.get('model') or 'mock'
+
+        if not request.get('stream'):
+            if settings.tokens_per_s:
+                time.sleep(completion_tokens / settings.tokens_per_s)
+            self._send_json(200, {
+                "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage, "timings": timings,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        # Пачки по ~10 мс генерации, чтобы не упираться в число системных вызовов
+        step_tokens = max(1, int(settings.tokens_per_s / 100)) if settings.tokens_per_s else 16
+        step = step_tokens * CHARS_PER_TOKEN
+        for i in range(0, len(content), step):
+            if settings.tokens_per_s:
+                time.sleep(step_tokens / settings.tokens_per_s)
+            self._send_event({"id": "mock", "object": "chat.completion.chunk", "created": 0, "model": model,
+                              "choices": [{"index": 0, "delta": {"content": content[i:i + step]},
+                                           "finish_reason": None}]})
+        self._send_event({"id": "mock", "object": "chat.completion.chunk", "created": 0, "model": model,
+                          "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                          "usage": usage, "timings": timings})
+        self._send_chunk(b'data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def _send_event(self, payload):
+        self._send_chunk(('data: ' + json.dumps(payload) + '\n\n').encode('utf-8'))
+
+    def _send_chunk(self, data):
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+def make_server(port, settings, host='127.0.0.1'):
+    """
+    Создаёт сервер (port=0 — любой свободный порт); запуск — serve_forever().
+    """
+    handler = type('BoundMockHandler', (MockHandler,), {'settings': settings})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Заменитель OpenAI-совместимого сервера для бенчмарков.')
+    parser.add_argument('--port', type=int, default=18080, help='Порт (по умолчанию: 18080)')
+    parser.add_argument('--latency-ms', type=float, default=200.0, help='Задержка до первого токена, мс')
+    parser.add_argument('--tokens-per-s', type=float, default=0.0, help='Скорость генерации; 0 — без задержки')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 503 (0..1)')
+    parser.add_argument('--capacity', type=int, default=0,
+                        help='Сколько запросов обслуживается одновременно, остальным — 429; 0 — без ограничения')
+    parser.add_argument('--nodes', type=int, default=8, help='Узлов в синтетическом ответе')
+    parser.add_argument('--edges', type=int, default=6, help='Ребер в синтетическом ответе')
+    parser.add_argument('--thinking-chars', type=int, default=400, help='Длина блока <thinking> в синтетическом ответе')
+    parser.add_argument('--responses', type=str, default=None,
+                        help='JSONL с записанными ответами ({"content": ...}); отдаются по кругу')
+    args = parser.parse_args()
+
+    settings = MockSettings(args.latency_ms, args.tokens_per_s, args.error_rate, args.nodes, args.edges,
+                            args.thinking_chars, load_recorded(args.responses) if args.responses else None,
+                            capacity=args.capacity)
+    server = make_server(args.port, settings)
+    print(f"Mock-сервер слушает http://127.0.0.1:{server.server_address[1]}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Запросов: {settings.requests}, ошибок: {settings.errors}, отклонено по ёмкости: {settings.rejected}, "
+              f"максимум одновременных: {settings.peak_in_flight}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+import re
+from typing import Dict, List, Optional
+
+# Заголовки разделов: markdown (# Methods), нумерованные (2.1 Results),
+# а также типовые названия разделов научной статьи отдельной строкой
+HEADING_RE = re.compile(
+    r'^(#{1,6}\s+\S.*'
+    r'|\d+(\.\d+)*\.?\s+[A-ZА-ЯЁ].{0,100}'
+    r'|(abstract|introduction|background|methods?|materials and methods|results|discussion|'
+    r'conclusions?|references|аннотация|введение|методы|материалы и методы|результаты|'
+    r'обсуждение|выводы|заключение|список литературы)\s*:?)$',
+    re.IGNORECASE
+)
+PARAGRAPH_SPLIT_RE = re.compile(r'\n\s*\n')
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+
+def _is_heading(paragraph: str) -> bool:
+    return '\n' not in paragraph and len(paragraph) <= 120 and bool(HEADING_RE.match(paragraph))
+
+def _split_long_paragraph(paragraph: str, max_chars: int) -> List[str]:
+    """
+    Делит слишком длинный абзац по границам предложений,
+    а предложения длиннее max_chars — жёстко по символам.
+    """
+    parts = []
+    current = ''
+    for sentence in SENTENCE_SPLIT_RE.split(paragraph):
+        while len(sentence) > max_chars:
+            if current:
+                parts.append(current)
+                current = ''
+            parts.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            parts.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        parts.append(current)
+    return parts
+
+def _overlap_tail(paragraphs: List[str], overlap: int) -> List[str]:
+    """
+    Возвращает хвост чанка для перекрытия: целые абзацы с конца,
+    суммарно не длиннее overlap; если последний абзац длиннее —
+    его окончание, начинающееся с границы слова.
+    """
+    if overlap <= 0 or not paragraphs:
+        return []
+    tail = []
+    size = 0
+    for paragraph in reversed(paragraphs):
+        if size + len(paragraph) > overlap:
+            break
+        tail.insert(0, paragraph)
+        size += len(paragraph) + 2
+    if not tail:
+        last = paragraphs[-1][-overlap:]
+        space = last.find(' ')
+        tail = [last[space + 1:] if space != -1 else last]
+    return tail
+
+def split_article(text: str, max_chars: int, overlap: int = 0) -> List[str]:
+    """
+    Делит текст статьи на чанки не длиннее max_chars (без учёта перекрытия)
+    по границам разделов и абзацев. Каждый следующий чанк начинается
+    с последних overlap символов предыдущего, чтобы связи на стыке
+    абзацев не терялись.
+
+    :param text: Текст статьи.
+    :param max_chars: Максимальный размер чанка в символах; 0 — не делить.
+    :param overlap: Размер перекрытия соседних чанков в символах.
+    :return: Список чанков (один элемент, если текст короче max_chars).
+    """
+    text = text.strip()
+    if max_chars <= 0 or len(text) <= max_chars:
+        return [text]
+
+    paragraphs = []
+    for paragraph in PARAGRAPH_SPLIT_RE.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) > max_chars:
+            paragraphs.extend(_split_long_paragraph(paragraph, max_chars))
+        else:
+            paragraphs.append(paragraph)
+
+    chunks = []
+    current: List[str] = []
+    size = 0
+    for paragraph in paragraphs:
+        # Новый раздел начинаем с нового чанка, если текущий уже заполнен наполовину
+        starts_section = _is_heading(paragraph) and size >= max_chars // 2
+        if current and (size + len(paragraph) > max_chars or starts_section):
+            # Заголовок не отрываем от следующего за ним текста
+            carried = [current.pop()] if _is_heading(current[-1]) and not starts_section else []
+            if current:
+                chunks.append(current)
+            current = carried
+            size = sum(len(p) + 2 for p in current)
+        current.append(paragraph)
+        size += len(paragraph) + 2
+    if current:
+        chunks.append(current)
+
+    result = ['\n\n'.join(chunks[0])]
+    for previous, chunk in zip(chunks, chunks[1:]):
+        result.append('\n\n'.join(_overlap_tail(previous, overlap) + chunk))
+    return result
+
+def normalize_name(name: Optional[str]) -> str:
+    """
+    Нормализует название сущности для дедупликации: регистр и пробелы.
+    """
+    return ' '.join((name or '').lower().split())
+
+def union_lists(first, second):
+    """
+    Объединяет два списка (None допустим) с сохранением порядка и без повторов.
+    """
+    if not isinstance(first, list):
+        return list(second) if isinstance(second, list) else first
+    if not isinstance(second, list):
+        return first
+    return first + [item for item in second if item not in first]
+
+def combine_confidence(first, second):
+    """
+    Объединяет confidence_score двух извлечений одного и того же факта.
+    """
+    # Чанки перекрываются, поэтому один и тот же факт может быть извлечён дважды
+    # из одного и того же текста — берём максимум, а не «шумное ИЛИ»
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return max(first, second)
+
+def merge_graphs(graphs: List[Optional[Dict]]) -> Optional[Dict]:
+    """
+    Объединяет графы, извлечённые из чанков одной статьи.
+
+    Узлы сливаются по id и по нормализованному названию (повторный узел
+    получает id первого, рёбра переадресуются), рёбра — по тройке
+    (subject, predicate, object). Списки evidence_publication объединяются,
+    confidence_score берётся максимальный.
+
+    :param graphs: Список ответов модели (None для неудачных чанков пропускаются).
+    :return: Объединённый JSON в формате ответа модели или None, если все чанки неудачны.
+    """
+    graphs = [g for g in graphs if g]
+    if not graphs:
+        return None
+    if len(graphs) == 1:
+        return graphs[0]
+
+    nodes: Dict[str, Dict] = {}
+    id_by_name: Dict[str, str] = {}
+    id_alias: Dict[str, str] = {}
+    edges: Dict[tuple, Dict] = {}
+    clarifications = []
+    seen_clarifications = set()
+
+    for data in graphs:
+        graph = data.get('graph', {})
+
+        for node in graph.get('nodes', []):
+            node_id = node.get('id')
+            name_key = normalize_name(node.get('name'))
+            canonical_id = node_id if node_id in nodes else id_by_name.get(name_key, node_id)
+            id_alias[node_id] = canonical_id
+
+            existing = nodes.get(canonical_id)
+            if existing is None:
+                nodes[canonical_id] = {**node, 'additional_fields': dict(node.get('additional_fields') or {})}
+                if name_key:
+                    id_by_name.setdefault(name_key, canonical_id)
+                continue
+
+            existing['confidence_score'] = combine_confidence(
+                existing.get('confidence_score'), node.get('confidence_score'))
+            fields = existing['additional_fields']
+            for key, value in (node.get('additional_fields') or {}).items():
+                if key == 'evidence_publication':
+                    fields[key] = union_lists(fields.get(key), value)
+                elif fields.get(key) is None:
+                    fields[key] = value
+
+        for edge in graph.get('edges', []):
+            subject = id_alias.get(edge.get('subject'), edge.get('subject'))
+            obj = id_alias.get(edge.get('object'), edge.get('object'))
+            key = (subject, edge.get('predicate'), obj)
+
+            existing = edges.get(key)
+            if existing is None:
+                edges[key] = {**edge, 'subject': subject, 'object': obj}
+                continue
+
+            existing['confidence_score'] = combine_confidence(
+                existing.get('confidence_score'), edge.get('confidence_score'))
+            existing['evidence_publication'] = union_lists(
+                existing.get('evidence_publication'), edge.get('evidence_publication'))
+
+        for clarification in graph.get('clarifications') or []:
+            key = (clarification.get('entity'), clarification.get('question'))
+            if key not in seen_clarifications:
+                seen_clarifications.add(key)
+                clarifications.append(clarification)
+
+    merged = {'nodes': list(nodes.values()), 'edges': list(edges.values())}
+    if clarifications:
+        merged['clarifications'] = clarifications
+    return {'graph': merged}
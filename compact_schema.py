@@ -0,0 +1,168 @@
+"""
+Компактный формат ответа модели: короткие ключи вместо имён полей схемы.
+
+Ключи вроде additional_fields, evidence_publication и research_direction
+повторяются в каждом узле и ребре и занимают заметную долю выходных токенов.
+CompactCodec строит по схеме экстрактора «проводную» схему с короткими
+псевдонимами (additional_fields -> af, confidence_score -> cs, ...), по
+которой собирается грамматика, и разворачивает ответ модели обратно в
+исходную структуру, так что дальше (проверка, process_kgx_json, кэш графа)
+всё работает с полными именами. Легенда псевдонимов добавляется к
+системному промпту.
+
+Псевдонимы детерминированы: назначаются в порядке обхода схемы из
+инициалов слов имени (или первых букв), при совпадении — с добавлением
+букв или номера.
+"""
+import re
+import copy
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from stream_parser import DEFAULT_ITEM_PATHS
+from response_validator import item_schema
+
+WORD_SPLIT_RE = re.compile(r'[^0-9A-Za-z]+|(?<=[a-z])(?=[A-Z])')
+
+# Ключи схемы, внутри которых лежат подсхемы (списком, словарём или одной схемой)
+SCHEMA_LISTS = ('anyOf', 'oneOf', 'allOf', 'prefixItems')
+SCHEMA_MAPS = ('definitions', '$defs')
+SCHEMA_SINGLE = ('items', 'additionalProperties', 'not')
+
+def _property_names(schema: Any, names: Dict[str, None]):
+    # Имена свойств в порядке обхода схемы (словарь как упорядоченное множество)
+    if not isinstance(schema, dict):
+        return
+    for name, sub in (schema.get('properties') or {}).items():
+        names.setdefault(name, None)
+        _property_names(sub, names)
+    for key in SCHEMA_SINGLE:
+        _property_names(schema.get(key), names)
+    for key in SCHEMA_LISTS:
+        for sub in schema.get(key) or []:
+            _property_names(sub, names)
+    for key in SCHEMA_MAPS:
+        for sub in (schema.get(key) or {}).values():
+            _property_names(sub, names)
+
+def _candidates(name: str):
+    words = [word for word in WORD_SPLIT_RE.split(name) if word]
+    if len(name) <= 2 or not words:
+        yield name
+    if len(words) > 1:
+        yield ''.join(word[0] for word in words).lower()
+    for length in range(1, len(name) + 1):
+        yield name[:length].lower()
+    base = ''.join(word[0] for word in words).lower() or name
+    i = 2
+    while True:
+        yield f'{base}{i}'
+        i += 1
+
+def build_aliases(schema: dict) -> Dict[str, str]:
+    """
+    Короткие уникальные псевдонимы для всех имён свойств схемы: имя -> псевдоним.
+    """
+    names: Dict[str, None] = {}
+    _property_names(schema, names)
+    aliases, used = {}, set()
+    for name in names:
+        alias = next(candidate for candidate in _candidates(name) if candidate not in used)
+        aliases[name] = alias
+        used.add(alias)
+    return aliases
+
+def rename_schema(schema: Any, aliases: Dict[str, str]) -> Any:
+    """
+    Копия схемы, в которой свойства (properties и required) названы псевдонимами.
+    """
+    if not isinstance(schema, dict):
+        return copy.deepcopy(schema)
+    result = {}
+    for key, value in schema.items():
+        if key == 'properties' and isinstance(value, dict):
+            result[key] = {aliases.get(name, name): rename_schema(sub, aliases) for name, sub in value.items()}
+        elif key == 'required' and isinstance(value, list):
+            result[key] = [aliases.get(name, name) for name in value]
+        elif key in SCHEMA_SINGLE:
+            result[key] = rename_schema(value, aliases)
+        elif key in SCHEMA_LISTS and isinstance(value, list):
+            result[key] = [rename_schema(sub, aliases) for sub in value]
+        elif key in SCHEMA_MAPS and isinstance(value, dict):
+            result[key] = {name: rename_schema(sub, aliases) for name, sub in value.items()}
+        else:
+            result[key] = copy.deepcopy(value)
+    return result
+
+class CompactCodec:
+    """
+    Перевод между проводной (с псевдонимами) и исходной схемой ответа.
+
+        codec = CompactCodec(schema)
+        codec.wire_schema         # схема для грамматики
+        codec.legend()            # текст для системного промпта
+        codec.expand(parsed)      # разобранный ответ -> исходные имена
+        codec.item_paths          # пути массивов для GraphStreamParser
+        codec.expand_items(items) # пары (тип, объект) потокового режима -> исходные имена
+    """
+
+    def __init__(self, schema: dict, item_paths: Optional[Dict[Tuple[str, ...], str]] = None):
+        self.schema = schema
+        self.aliases = build_aliases(schema)
+        self.wire_schema = rename_schema(schema, self.aliases)
+        canonical_paths = item_paths or DEFAULT_ITEM_PATHS
+        self.item_paths = {tuple(self.aliases.get(key, key) for key in path): kind
+                           for path, kind in canonical_paths.items()}
+        self._item_schemas = {kind: item_schema(schema, path) for path, kind in canonical_paths.items()}
+
+    def legend(self) -> str:
+        lines = ["#### Компактный формат ответа",
+                 "В JSON ответа вместо имён полей из схемы пиши короткие ключи, структура и значения те же:"]
+        lines.extend(f"- `{alias}` — `{name}`" for name, alias in self.aliases.items() if alias != name)
+        return '\n\n' + '\n'.join(lines) + '\n'
+
+    def _object_properties(self, schema: Any) -> Optional[Dict[str, Any]]:
+        # Свойства объекта по схеме (с учётом anyOf/oneOf/allOf); None — объект без описанных свойств
+        if not isinstance(schema, dict):
+            return None
+        properties = dict(schema.get('properties') or {})
+        for key in SCHEMA_LISTS:
+            for sub in schema.get(key) or []:
+                properties.update(self._object_properties(sub) or {})
+        return properties or None
+
+    def _array_items(self, schema: Any) -> Any:
+        if not isinstance(schema, dict):
+            return None
+        if isinstance(schema.get('items'), dict):
+            return schema['items']
+        for key in SCHEMA_LISTS:
+            for sub in schema.get(key) or []:
+                items = self._array_items(sub)
+                if items is not None:
+                    return items
+        return None
+
+    def _expand(self, value: Any, schema: Any) -> Any:
+        if isinstance(value, dict):
+            properties = self._object_properties(schema)
+            if properties is None:
+                return value
+            by_alias = {self.aliases.get(name, name): (name, sub) for name, sub in properties.items()}
+            result = {}
+            for key, item in value.items():
+                name, sub = by_alias.get(key, (key, None))
+                result[name] = self._expand(item, sub)
+            return result
+        if isinstance(value, list):
+            items = self._array_items(schema)
+            return [self._expand(item, items) for item in value] if items is not None else value
+        return value
+
+    def expand(self, data: Any) -> Any:
+        """
+        Ответ модели в проводной схеме -> та же структура с исходными именами полей.
+        """
+        return self._expand(data, self.schema)
+
+    def expand_items(self, items: Iterable[Tuple[str, Any]]) -> List[Tuple[str, Any]]:
+        return [(kind, self._expand(item, self._item_schemas.get(kind))) for kind, item in items]
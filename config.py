@@ -4,4 +4,78 @@ from dotenv import load_dotenv
 load_dotenv()
 OAI_COMPATIBLE_API_KEY = os.getenv("OAI_COMPATIBLE_API_KEY")
 OAI_COMPATIBLE_BASE_URL = os.getenv("OAI_COMPATIBLE_BASE_URL")
-MODEL_NAME = os.getenv("MODEL_NAME")
\ No newline at end of file
+MODEL_NAME = os.getenv("MODEL_NAME")
+
+# Пул серверов (endpoint_pool.py): OAI_COMPATIBLE_BASE_URLS — адреса через запятую
+# (по умолчанию — один OAI_COMPATIBLE_BASE_URL); LLM_ROUTING — least_outstanding или latency
+# (наименьшее число выполняющихся запросов, взвешенное на задержку сервера);
+# LLM_HEALTH_INTERVAL_S — период проверки доступности серверов, 0 — не проверять
+OAI_COMPATIBLE_BASE_URLS = [url.strip() for url in os.getenv("OAI_COMPATIBLE_BASE_URLS", "").split(",")
+                            if url.strip()] or [OAI_COMPATIBLE_BASE_URL]
+LLM_ROUTING = os.getenv("LLM_ROUTING", "latency")
+LLM_HEALTH_INTERVAL_S = float(os.getenv("LLM_HEALTH_INTERVAL_S", "10"))
+
+# Максимальное число одновременных запросов к LLM в пакетном режиме
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "8"))
+
+# Управление запросами к LLM (request_controller.py): окно одновременных запросов
+# адаптируется между LLM_MIN_CONCURRENCY и --concurrency/MAX_CONCURRENCY по задержке
+# и ответам 429/503/тайм-аутам; повторы с экспоненциальной задержкой со случайным разбросом;
+# бюджет прогона на запросы и токены (0 — без ограничения)
+LLM_MIN_CONCURRENCY = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+LLM_LATENCY_TOLERANCE = float(os.getenv("LLM_LATENCY_TOLERANCE", "2.0"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "1.0"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "60"))
+LLM_REQUEST_TIMEOUT_S = float(os.getenv("LLM_REQUEST_TIMEOUT_S", "600"))
+LLM_MAX_REQUESTS = int(os.getenv("LLM_MAX_REQUESTS", "0"))
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "0"))
+
+# Разбиение длинных статей на чанки (в символах); 0 — отправлять статью целиком
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "16000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "1000"))
+
+# Кэш ответов LLM (SQLite); LLM_CACHE_DISABLED=1 — не читать и не записывать кэш
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite")
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "1024"))
+LLM_CACHE_MAX_AGE_DAYS = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "0"))
+LLM_CACHE_DISABLED = os.getenv("LLM_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+
+# Схема ответа экстрактора (по умолчанию prompts_and_shemes/main_extractor_shema.json). Вариант
+# с перечислениями категорий и предикатов Biolink строит schema_enums.py
+# (prompts_and_shemes/main_extractor_shema.enums.json): по нему строятся грамматика и проверка ответов
+EXTRACTOR_SCHEMA_PATH = os.getenv("EXTRACTOR_SCHEMA_PATH", "")
+
+# Директория кэша скомпилированных GBNF-грамматик; пустое значение отключает кэш
+GRAMMAR_CACHE_DIR = os.getenv("GRAMMAR_CACHE_DIR", ".grammar_cache")
+
+# Оптимизация грамматики (grammar_optimizer.py): слияние одинаковых правил, подстановка
+# правил с одним использованием, удаление недостижимых и вынесение общих префиксов альтернатив;
+# GRAMMAR_OPTIMIZE=0 — отправлять грамматику в том виде, в каком её строит SchemaConverter
+GRAMMAR_OPTIMIZE = os.getenv("GRAMMAR_OPTIMIZE", "1").lower() in ("1", "true", "yes")
+
+# Блок рассуждения <thinking> перед JSON: off — модель сразу пишет JSON, bounded — не длиннее
+# THINKING_MAX_CHARS символов (ограничение задаёт грамматика; токен — примерно 3–4 символа),
+# unbounded — без ограничения
+THINKING_MODE = os.getenv("THINKING_MODE", "unbounded")
+THINKING_MAX_CHARS = int(os.getenv("THINKING_MAX_CHARS", "1500"))
+
+# COMPACT_OUTPUT=1 — компактный ответ модели: короткие ключи вместо имён полей схемы и JSON
+# без пробелов и переводов строк (меньше выходных токенов); ответ разворачивается обратно
+# в исходную структуру до проверки и записи
+COMPACT_OUTPUT = os.getenv("COMPACT_OUTPUT", "0").lower() in ("1", "true", "yes")
+
+# Повторное использование KV-кэша llama.cpp для системного промпта (cache_prompt)
+# и число слотов сервера для закрепления запросов (id_slot); 0 — слот выбирает сервер
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "").lower() in ("1", "true", "yes")
+LLAMA_SLOTS = int(os.getenv("LLAMA_SLOTS", "0"))
+
+# Телеметрия по статьям: JSONL с временем стадий и токенами и Prometheus textfile
+# с агрегатами прогона; пустое значение отключает соответствующий вывод
+TELEMETRY_PATH = os.getenv("TELEMETRY_PATH", "")
+TELEMETRY_PROMETHEUS_PATH = os.getenv("TELEMETRY_PROMETHEUS_PATH", "")
+
+# Проверка элементов графа в ответах модели по JSON-схеме; невалидные отбрасываются,
+# а при заданном VALIDATION_QUARANTINE_PATH дозаписываются туда (JSONL) с ошибками по полям
+RESPONSE_VALIDATION_DISABLED = os.getenv("RESPONSE_VALIDATION_DISABLED", "").lower() in ("1", "true", "yes")
+VALIDATION_QUARANTINE_PATH = os.getenv("VALIDATION_QUARANTINE_PATH", "")
@@ -0,0 +1,235 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Set
+
+from response_fields import response_field
+from request_controller import classify_error
+
+# Политики выбора сервера: наименьшее число выполняющихся запросов или оно же,
+# взвешенное на сглаженную задержку сервера
+ROUTING_POLICIES = ('least_outstanding', 'latency')
+
+# Вес нового замера в сглаженной задержке
+LATENCY_EWMA_ALPHA = 0.2
+
+# Тайм-аут проверки доступности сервера (GET {base_url}/models)
+HEALTH_PROBE_TIMEOUT_S = 5.0
+
+class Endpoint:
+    """
+    Один OpenAI-совместимый сервер пула: клиенты, число выполняющихся запросов,
+    свободные слоты llama.cpp, сглаженная задержка, доступность и статистика.
+    """
+
+    def __init__(self, base_url: Optional[str], api_key: Optional[str], timeout_s: float):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout_s = timeout_s
+        self.healthy = True
+        self.outstanding = 0
+        self.slots = 0
+        self._free_slots = []
+        self.latency_s = None
+        self.requests = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.tokens = 0
+        self.first_request = None
+        self.last_response = None
+        self._client = None
+        self._async_client = None
+        self._async_loop = None
+
+    def acquire_slot(self, slots: int) -> Optional[int]:
+        # Вызывается под блокировкой пула; при смене числа слотов (--slots) список строится заново
+        if slots != self.slots:
+            self.slots = slots
+            self._free_slots = list(range(slots))
+        return self._free_slots.pop(0) if self._free_slots else None
+
+    def release_slot(self, slot_id: Optional[int]):
+        # Вызывается под блокировкой пула. Освобождённый слот ставим в начало: в нём свежий префикс
+        if slot_id is not None and slot_id < self.slots:
+            self._free_slots.insert(0, slot_id)
+
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            # Повторы выполняет request_controller, собственные повторы клиента отключены
+            self._client = OpenAI(base_url=self.base_url, api_key=self.api_key,
+                                  max_retries=0, timeout=self.timeout_s)
+        return self._client
+
+    def async_client(self):
+        # Асинхронный клиент привязан к циклу событий: для нового цикла (новый asyncio.run) создаётся заново
+        import asyncio
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(base_url=self.base_url, api_key=self.api_key,
+                                             max_retries=0, timeout=self.timeout_s)
+            self._async_loop = loop
+        return self._async_client
+
+    def stats(self) -> dict:
+        elapsed = (self.last_response - self.first_request) if self.first_request and self.last_response else 0.0
+        return {
+            'healthy': self.healthy,
+            'requests': self.requests,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'outstanding': self.outstanding,
+            'tokens': self.tokens,
+            'latency_ms': round(self.latency_s * 1000, 2) if self.latency_s is not None else None,
+            'requests_per_s': round(self.succeeded / elapsed, 2) if elapsed > 0 else None,
+            'tokens_per_s': round(self.tokens / elapsed, 1) if elapsed > 0 else None,
+        }
+
+class EndpointPool:
+    """
+    Пул OpenAI-совместимых серверов (OAI_COMPATIBLE_BASE_URLS).
+
+    route() выбирает для запроса доступный сервер: при policy='least_outstanding' —
+    с наименьшим числом выполняющихся запросов, при 'latency' — с наименьшим
+    (выполняющихся + 1) × сглаженная задержка на токен completion. Ошибка
+    соединения или тайм-аут помечает сервер недоступным; фоновая проверка
+    (GET {base_url}/models раз в health_interval_s) возвращает его в пул.
+
+    Переключение при отказе: сервер, на котором запрос не удался, попадает
+    в множество avoid, и повтор запроса (request_controller) уходит на другой
+    сервер; запросы статей, выполнявшиеся на упавшем сервере, повторяются так же.
+    Если недоступны все серверы, запросы распределяются по всем.
+
+    Слоты llama.cpp (id_slot) нумеруются на каждом сервере отдельно, поэтому
+    route() занимает свободный слот выбранного сервера и освобождает его по
+    завершении запроса; повтор на другом сервере получает слот уже там.
+    """
+
+    def __init__(self, base_urls: List[Optional[str]], api_key: Optional[str] = None,
+                 timeout_s: float = 600.0, policy: str = 'latency', health_interval_s: float = 10.0):
+        if policy not in ROUTING_POLICIES:
+            raise ValueError(f"Неизвестная политика маршрутизации: {policy} (допустимы: {', '.join(ROUTING_POLICIES)})")
+        self.endpoints = [Endpoint(base_url, api_key, timeout_s) for base_url in (base_urls or [None])]
+        self.policy = policy
+        self.health_interval_s = health_interval_s
+        self._lock = threading.Lock()
+        self._prober = None
+        self._stop = threading.Event()
+
+    def _score(self, endpoint: Endpoint, default_latency: float) -> float:
+        if self.policy == 'least_outstanding':
+            return endpoint.outstanding
+        latency = endpoint.latency_s if endpoint.latency_s is not None else default_latency
+        return (endpoint.outstanding + 1) * latency
+
+    def _choose(self, avoid: Set[str]) -> Endpoint:
+        # Вызывается под self._lock
+        candidates = [e for e in self.endpoints if e.healthy and e.base_url not in avoid]
+        if not candidates:
+            candidates = [e for e in self.endpoints if e.healthy] or self.endpoints
+        known = [e.latency_s for e in candidates if e.latency_s is not None]
+        # Серверы без замеров считаются не медленнее самого быстрого, чтобы получить запросы
+        default_latency = min(known) if known else 1.0
+        return min(candidates, key=lambda e: (self._score(e, default_latency), e.requests))
+
+    @contextmanager
+    def route(self, avoid: Optional[Set[str]] = None, slots: int = 0):
+        """
+        Выбирает сервер на время одного запроса и учитывает его результат.
+        Возвращает пару (сервер, слот): слот — свободный слот сервера, если
+        slots > 0 (см. PrefixCacheMode.pinned_slots()), иначе или если все
+        слоты заняты — None.
+        При ошибке сервер добавляется в avoid, чтобы повтор ушёл на другой.
+        Задержку и токены передаёт request_controller через record().
+        """
+        avoid = avoid if avoid is not None else set()
+        self._start_prober()
+        with self._lock:
+            endpoint = self._choose(avoid)
+            slot_id = endpoint.acquire_slot(slots) if slots > 0 else None
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+            if endpoint.first_request is None:
+                endpoint.first_request = time.monotonic()
+        try:
+            yield endpoint, slot_id
+        except Exception as e:
+            reason = classify_error(e)
+            with self._lock:
+                endpoint.release_slot(slot_id)
+                endpoint.outstanding -= 1
+                endpoint.failed += 1
+                if reason in ('connection', 'timeout'):
+                    if endpoint.healthy and len(self.endpoints) > 1:
+                        print(f"\nСервер {endpoint.base_url} недоступен ({reason}), запросы переключаются на другие.")
+                    endpoint.healthy = False
+            if len(self.endpoints) > 1:
+                avoid.add(endpoint.base_url)
+            raise
+        except BaseException:
+            with self._lock:
+                endpoint.release_slot(slot_id)
+                endpoint.outstanding -= 1
+            raise
+        else:
+            with self._lock:
+                endpoint.release_slot(slot_id)
+                endpoint.outstanding -= 1
+                endpoint.succeeded += 1
+                endpoint.last_response = time.monotonic()
+
+    def record(self, endpoint: Endpoint, latency_s: Optional[float], response=None):
+        """
+        Учитывает задержку (на токен completion или до первого токена) и токены ответа сервера.
+        """
+        tokens = response_field(response_field(response, 'usage'), 'total_tokens') or 0
+        with self._lock:
+            endpoint.tokens += tokens
+            if latency_s is not None:
+                endpoint.latency_s = latency_s if endpoint.latency_s is None else \
+                    endpoint.latency_s + (latency_s - endpoint.latency_s) * LATENCY_EWMA_ALPHA
+
+    def probe(self, endpoint: Endpoint) -> bool:
+        """
+        Проверяет доступность сервера: GET {base_url}/models отвечает 200.
+        """
+        if not endpoint.base_url:
+            return True
+        import urllib.request
+        request = urllib.request.Request(endpoint.base_url.rstrip('/') + '/models',
+                                         headers={'Authorization': f'Bearer {endpoint.api_key or ""}'})
+        try:
+            with urllib.request.urlopen(request, timeout=HEALTH_PROBE_TIMEOUT_S) as response:
+                return response.status == 200
+        except Exception:
+            return False
+
+    def probe_all(self):
+        for endpoint in self.endpoints:
+            healthy = self.probe(endpoint)
+            with self._lock:
+                if healthy and not endpoint.healthy:
+                    print(f"\nСервер {endpoint.base_url} снова доступен.")
+                endpoint.healthy = healthy
+
+    def _start_prober(self):
+        # Фоновая проверка нужна только при нескольких серверах
+        if self._prober is not None or len(self.endpoints) < 2 or self.health_interval_s <= 0:
+            return
+        with self._lock:
+            if self._prober is not None:
+                return
+            self._prober = threading.Thread(target=self._probe_loop, name='endpoint-health', daemon=True)
+            self._prober.start()
+
+    def _probe_loop(self):
+        while not self._stop.wait(self.health_interval_s):
+            self.probe_all()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {endpoint.base_url: endpoint.stats() for endpoint in self.endpoints}
+
+    def close(self):
+        self._stop.set()
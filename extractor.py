@@ -1,108 +1,783 @@
 import os
 import json
-import csv
-import uuid
-from openai import OpenAI
-from config import OAI_COMPATIBLE_API_KEY, OAI_COMPATIBLE_BASE_URL, MODEL_NAME
-import json_schema_to_grammar
+import time
+import hashlib
+from functools import lru_cache
+from config import (
+    OAI_COMPATIBLE_API_KEY, OAI_COMPATIBLE_BASE_URLS, LLM_ROUTING, LLM_HEALTH_INTERVAL_S, MODEL_NAME, CHUNK_MAX_CHARS, CHUNK_OVERLAP,
+    LLM_CACHE_PATH, LLM_CACHE_MAX_MB, LLM_CACHE_MAX_AGE_DAYS, LLM_CACHE_DISABLED, GRAMMAR_CACHE_DIR, GRAMMAR_OPTIMIZE,
+    EXTRACTOR_SCHEMA_PATH, THINKING_MODE, THINKING_MAX_CHARS, COMPACT_OUTPUT,
+    PROMPT_CACHE, LLAMA_SLOTS, TELEMETRY_PATH, TELEMETRY_PROMETHEUS_PATH,
+    RESPONSE_VALIDATION_DISABLED, VALIDATION_QUARANTINE_PATH, MAX_CONCURRENCY, LLM_MIN_CONCURRENCY,
+    LLM_LATENCY_TOLERANCE, LLM_MAX_RETRIES, LLM_BACKOFF_BASE_S, LLM_BACKOFF_MAX_S, LLM_REQUEST_TIMEOUT_S,
+    LLM_MAX_REQUESTS, LLM_MAX_TOKENS
+)
+from chunking import split_article, merge_graphs
+from llm_cache import ResponseCache
+from prefix_cache import PrefixCacheMode
+from response_fields import response_field
+from stream_parser import GraphStreamParser
+from telemetry import Telemetry, split_response_lengths
+from response_validator import ResponseValidator
+from request_controller import BudgetExceededError, RequestController
+from endpoint_pool import EndpointPool
+from sinks import BlockSink, open_sink
+from kgx_rows import NODE_HEADERS, EDGE_HEADERS, NODE_COLUMN_TYPES, EDGE_COLUMN_TYPES, node_to_row, edge_to_row
+from compact_schema import CompactCodec
+
+TEMPERATURE = 0.5
+
+class IncompleteResponseError(Exception):
+    """
+    Поток ответа модели оборвался до конца JSON (в строгом режиме потоковых функций).
+    """
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prompts_and_shemes')
+MAIN_EXTRACTOR_PROMPT_PATH = os.path.join(PROMPTS_DIR, 'main_extractor_prompt.txt')
+MAIN_EXTRACTOR_SCHEMA_PATH = EXTRACTOR_SCHEMA_PATH or os.path.join(PROMPTS_DIR, 'main_extractor_shema.json')
+
+# Режимы блока <thinking> перед JSON: off — без рассуждения, bounded — не длиннее
+# thinking_max_chars символов, unbounded — без ограничения
+THINKING_MODES = ('off', 'bounded', 'unbounded')
+
+# llama.cpp не принимает повторения {m,n} больше 2000 раз
+GRAMMAR_MAX_REPETITION = 2000
+
+# Текущий режим рассуждения (THINKING_MODE или --thinking), см. set_thinking_policy
+thinking_mode = THINKING_MODE
+thinking_max_chars = THINKING_MAX_CHARS
+
+# Компактный формат ответа (COMPACT_OUTPUT или --compact), см. set_compact_output
+compact_output = COMPACT_OUTPUT
+
+def _bounded_repetition(item: str, minimum: int, maximum: int) -> str:
+    # item{minimum,maximum} из частей не длиннее GRAMMAR_MAX_REPETITION. Следующая часть
+    # начинается, только если предыдущая заполнена целиком: при перекрывающихся частях
+    # llama.cpp держал бы по стеку разбора на каждое разбиение уже выданного текста
+    if maximum <= GRAMMAR_MAX_REPETITION:
+        return f'{item}{{{minimum},{maximum}}}'
+    limit = GRAMMAR_MAX_REPETITION
+    return f'({item}{{{minimum},{limit - 1}}} | {item}{{{limit}}} {_bounded_repetition(item, 0, maximum - limit)})'
+
+def thinking_root_rule(mode: str, max_chars: int = 0) -> str:
+    """
+    Правило root поверх грамматики схемы: <thinking>...</thinking> перед JSON
+    в режиме mode (см. THINKING_MODES).
+    """
+    if mode == 'off':
+        return "\nroot ::= json-schema\n"
+    if mode == 'bounded':
+        if max_chars < 1:
+            raise ValueError("Для режима рассуждения bounded граница THINKING_MAX_CHARS должна быть не меньше 1")
+        body = _bounded_repetition('[^<]', 1, max_chars)
+    elif mode == 'unbounded':
+        body = '[^<]+'
+    else:
+        raise ValueError(f"Неизвестный режим рассуждения: {mode} (допустимы: {', '.join(THINKING_MODES)})")
+    return f'\nroot ::= "<thinking>" {body} "</thinking>" [\\n]* json-schema\n'
+
+def set_thinking_policy(mode: str = None, max_chars: int = None):
+    """
+    Задаёт режим рассуждения (например, по --thinking); грамматика пересобирается при следующем запросе.
+    """
+    global thinking_mode, thinking_max_chars
+    if mode is not None:
+        thinking_mode = mode
+    if max_chars is not None:
+        thinking_max_chars = max_chars
+    thinking_root_rule(thinking_mode, thinking_max_chars)
+    get_grammar.cache_clear()
+
+def set_compact_output(enabled: bool):
+    """
+    Включает или выключает компактный формат ответа (например, по --compact);
+    промпт и грамматика пересобираются при следующем запросе.
+    """
+    global compact_output
+    compact_output = enabled
+    get_system_prompt.cache_clear()
+    get_grammar.cache_clear()
 
-def convert_schema_to_grammar(json_schema: dict) -> str:
+def convert_schema_to_grammar(json_schema: dict, optimize: bool = GRAMMAR_OPTIMIZE, root_rule: str = None,
+                              compact: bool = False) -> str:
     """
     Конвертирует JSON-схему в формат грамматики GBNF для llama.cpp.
-    Добавляет обработку тегов <thinking>...</thinking>.
+    Добавляет обработку тегов <thinking>...</thinking> по правилу root_rule
+    (по умолчанию — для текущего режима рассуждения).
+    При compact JSON допускается только без пробелов между токенами.
+    При optimize грамматика проходит через grammar_optimizer (язык не меняется).
     """
+    import json_schema_to_grammar
+
     converter = json_schema_to_grammar.SchemaConverter(
         prop_order={},
         allow_fetch=False,
         dotall=False,
-        raw_pattern=False
+        raw_pattern=False,
+        compact=compact
     )
     
     converter.visit(json_schema, 'json-schema')
     json_grammar = converter.format_grammar()
     
     # Add <thinking> before JSON
-    base_rules = """
-root ::= "<thinking>" [^<]+ "</thinking>" [\\n]* json-schema
-"""
-    return base_rules + json_grammar
-
-try:
-    with open('prompts_and_shemes/main_extractor_prompt.txt', 'r', encoding='utf-8') as file:
-        main_extractor_prompt = file.read()
-except FileNotFoundError:
-    print("Ошибка: Файл не найден! ")
-
-try:
-    with open('prompts_and_shemes/main_extractor_shema.json', 'r', encoding='utf-8') as f:
-        main_extractor_schema = json.load(f)
-except FileNotFoundError:
-    print(f"Ошибка: файл схемы не найден ")
-
-client = OpenAI(
-    base_url=OAI_COMPATIBLE_BASE_URL,
-    api_key=OAI_COMPATIBLE_API_KEY
+    if root_rule is None:
+        root_rule = thinking_root_rule(thinking_mode, thinking_max_chars)
+    grammar = root_rule + json_grammar
+    if optimize:
+        from grammar_optimizer import optimize_grammar
+        try:
+            grammar, stats = optimize_grammar(grammar)
+        except ValueError as e:
+            print(f"Предупреждение: грамматика не оптимизирована: {e}")
+        else:
+            print(f"Грамматика оптимизирована: правил {stats['rules_before']} -> {stats['rules_after']}")
+    return grammar
+
+def load_or_build_grammar(json_schema: dict, cache_dir: str = GRAMMAR_CACHE_DIR, compact: bool = False) -> str:
+    """
+    Возвращает GBNF-грамматику для схемы, используя кэш на диске.
+    Ключ кэша — хэш схемы, версий конвертера и оптимизатора, правила root
+    (режима рассуждения) и compact, так что изменение любого из них приводит к пересборке.
+    """
+    import json_schema_to_grammar
+    import grammar_optimizer
+
+    root_rule = thinking_root_rule(thinking_mode, thinking_max_chars)
+    key_source = json.dumps(
+        [json_schema, json_schema_to_grammar.CONVERTER_VERSION, root_rule,
+         grammar_optimizer.OPTIMIZER_VERSION if GRAMMAR_OPTIMIZE else None, compact],
+        sort_keys=True, ensure_ascii=False
+    )
+    key = hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+    cache_path = os.path.join(cache_dir, f'{key}.gbnf') if cache_dir else None
+
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    grammar = convert_schema_to_grammar(json_schema, root_rule=root_rule, compact=compact)
+    if cache_path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Пишем через временный файл, чтобы параллельные процессы не прочитали половину
+            tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(grammar)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"Предупреждение: не удалось сохранить грамматику в кэш: {e}")
+    return grammar
+
+# Промпт, схема, грамматика и клиенты создаются при первом обращении, а не при импорте:
+# импорт модуля для постобработки (process_kgx_json) не должен читать файлы и импортировать openai,
+# asyncio и генератор грамматик — они импортируются внутри функций, которым нужны
+
+@lru_cache(maxsize=None)
+def get_main_extractor_prompt() -> str:
+    try:
+        with open(MAIN_EXTRACTOR_PROMPT_PATH, 'r', encoding='utf-8') as file:
+            return file.read()
+    except FileNotFoundError:
+        print("Ошибка: Файл не найден! ")
+        raise
+
+@lru_cache(maxsize=None)
+def get_main_extractor_schema() -> dict:
+    try:
+        with open(MAIN_EXTRACTOR_SCHEMA_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"Ошибка: файл схемы не найден ")
+        raise
+
+@lru_cache(maxsize=None)
+def get_compact_codec() -> CompactCodec:
+    return CompactCodec(get_main_extractor_schema())
+
+@lru_cache(maxsize=None)
+def get_system_prompt() -> str:
+    # В компактном режиме к промпту добавляется легенда коротких ключей
+    if compact_output:
+        return get_main_extractor_prompt() + get_compact_codec().legend()
+    return get_main_extractor_prompt()
+
+@lru_cache(maxsize=None)
+def get_grammar() -> str:
+    # Создание грамматики на основе схемы (в компактном режиме — схемы с короткими ключами)
+    if compact_output:
+        return load_or_build_grammar(get_compact_codec().wire_schema, compact=True)
+    return load_or_build_grammar(get_main_extractor_schema())
+
+def new_stream_parser() -> GraphStreamParser:
+    """
+    Разборщик потокового ответа для текущего формата (в компактном режиме — по коротким ключам).
+    """
+    return GraphStreamParser(get_compact_codec().item_paths if compact_output else None)
+
+# Серверы LLM; клиенты OpenAI/AsyncOpenAI каждого сервера создаются при первом запросе к нему
+endpoint_pool = EndpointPool(
+    OAI_COMPATIBLE_BASE_URLS,
+    api_key=OAI_COMPATIBLE_API_KEY,
+    timeout_s=LLM_REQUEST_TIMEOUT_S,
+    policy=LLM_ROUTING,
+    health_interval_s=LLM_HEALTH_INTERVAL_S
+)
+
+# Кэш ответов модели; соединение с SQLite открывается при первом запросе
+response_cache = ResponseCache(
+    LLM_CACHE_PATH,
+    max_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024) if LLM_CACHE_MAX_MB > 0 else None,
+    max_age_s=LLM_CACHE_MAX_AGE_DAYS * 86400 if LLM_CACHE_MAX_AGE_DAYS > 0 else None,
+    enabled=not LLM_CACHE_DISABLED
+)
+
+# Повторное использование KV-кэша llama.cpp для системного промпта и статистика prefill
+prefix_cache = PrefixCacheMode(enabled=PROMPT_CACHE, slots=LLAMA_SLOTS)
+
+# Адаптивное окно одновременных запросов, повторы с задержкой и бюджет прогона
+request_controller = RequestController(
+    max_limit=MAX_CONCURRENCY,
+    min_limit=LLM_MIN_CONCURRENCY,
+    max_retries=LLM_MAX_RETRIES,
+    backoff_base_s=LLM_BACKOFF_BASE_S,
+    backoff_max_s=LLM_BACKOFF_MAX_S,
+    latency_tolerance=LLM_LATENCY_TOLERANCE,
+    max_requests=LLM_MAX_REQUESTS,
+    max_tokens=LLM_MAX_TOKENS
+)
+
+# Время стадий и токены по статьям (JSONL / Prometheus textfile)
+telemetry = Telemetry(TELEMETRY_PATH or None, TELEMETRY_PROMETHEUS_PATH or None)
+
+# Проверка узлов и ребер ответа по схеме; функции проверки компилируются из схемы при первом ответе
+response_validator = ResponseValidator(
+    get_main_extractor_schema,
+    quarantine_path=VALIDATION_QUARANTINE_PATH or None,
+    enabled=not RESPONSE_VALIDATION_DISABLED
 )
 
-# Создание грамматики на основе схемы
-grammar = convert_schema_to_grammar(main_extractor_schema)
+def _current_article_id():
+    record = telemetry.current()
+    return record.article_id if record is not None else None
+
+def validate_items(items, node_status=None):
+    """
+    Оставляет элементы потокового ответа (пары (тип, объект)), прошедшие проверку по схеме.
+    В компактном режиме элементы сначала разворачиваются к исходным именам полей.
+
+    :param node_status: Общий для всех фрагментов статьи словарь принятых/отброшенных узлов
+                        (см. ResponseValidator.filter_items).
+    """
+    if compact_output:
+        items = get_compact_codec().expand_items(items)
+    return list(response_validator.filter_items(items, _current_article_id(), node_status))
+
+def build_request_kwargs(article_text, slot_id=None):
+    """
+    Формирует параметры запроса chat.completions для одной статьи.
+    Общие для синхронного и асинхронного клиентов.
+
+    :param slot_id: Слот llama.cpp, за которым закрепляется запрос (режим prefix_cache).
+                    Обычно не задаётся: слот выбранного сервера добавляет _pin_slot().
+    """
+    with telemetry.span('prompt_assembly'):
+        return _build_request_kwargs(article_text, slot_id)
+
+def _pin_slot(request_kwargs, slot_id):
+    """
+    Параметры запроса с закреплением за слотом сервера, который занял EndpointPool.route().
+    """
+    if slot_id is None:
+        return request_kwargs
+    return {**request_kwargs, 'extra_body': {**request_kwargs['extra_body'], **prefix_cache.extra_body(slot_id)}}
+
+def _build_request_kwargs(article_text, slot_id):
+    return dict(
+        model=MODEL_NAME,
+        messages=[
+            {
+                "role": "system",
+                "content": get_system_prompt(),
+            },
+            {
+                "role": "user",
+                "content": article_text,
+            },
+        ],
+        temperature=TEMPERATURE,
+        extra_body={
+            "grammar": get_grammar(),
+            **prefix_cache.extra_body(slot_id)
+        }
+    )
+
+def parse_response_content(response_content, cache_hit=False):
+    """
+    Извлекает JSON из ответа модели, игнорируя часть с <thinking>.
+    Компактный ответ разворачивается к исходным именам полей (см. compact_schema).
+    Узлы и ребра, не прошедшие проверку по схеме, отбрасываются (см. response_validator).
+    Возвращает распарсенный словарь или None, если JSON извлечь не удалось.
+    """
+    if telemetry.current() is not None:
+        telemetry.record_content(*split_response_lengths(response_content), cache_hit=cache_hit)
+    with telemetry.span('json_extraction'):
+        parsed_json = _parse_response_content(response_content)
+        if parsed_json is not None:
+            if compact_output:
+                parsed_json = get_compact_codec().expand(parsed_json)
+            parsed_json = response_validator.filter_graph(parsed_json, _current_article_id())
+        return parsed_json
+
+def _parse_response_content(response_content):
+    closing_tag = "</thinking>"
+    try:
+        think_end_pos = response_content.rfind(closing_tag)
+        if think_end_pos != -1:
+            search_start_pos = think_end_pos + len(closing_tag)
+            json_start_index = response_content.find('{', search_start_pos)
+            if json_start_index != -1:
+                json_string = response_content[json_start_index:]
+                parsed_json = json.loads(json_string)
+                return parsed_json
+            else:
+                print("\nНе удалось найти JSON после тега </thinking>.")
+        else:
+            print("\nПредупреждение: тег </thinking> не найден. Попытка найти JSON с начала ответа.")
+            json_start_index = response_content.find('{')
+            if json_start_index != -1:
+                json_string = response_content[json_start_index:]
+                parsed_json = json.loads(json_string)
+                print("\nИзвлеченный и распарсенный JSON (запасной метод):")
+                print(json.dumps(parsed_json, indent=2, ensure_ascii=False))
+                return parsed_json
+            else:
+                print("\nНе удалось найти JSON в ответе.")
+    except json.JSONDecodeError as e:
+        print(f"\nОшибка декодирования JSON: {e}")
+        print("Проверьте, что модель вернула корректный JSON.")
+    except Exception as e:
+        print(f"\nПроизошла непредвиденная ошибка при обработке ответа: {e}")
+
+def _cache_key(article_text):
+    return ResponseCache.make_key(get_system_prompt(), get_grammar(), MODEL_NAME, TEMPERATURE, article_text)
+
+def _parse_and_cache(cache_key, response_content):
+    parsed_json = parse_response_content(response_content)
+    # Кэшируем только ответы, из которых удалось извлечь JSON, чтобы неудачные повторялись
+    if parsed_json is not None:
+        response_cache.put(cache_key, response_content)
+    return parsed_json
+
+def _record_attempt(attempt, endpoint, response):
+    """
+    Передаёт задержку и токены ответа контроллеру запросов и пулу серверов.
+    """
+    # Базовая задержка для адаптивного окна своя у каждого сервера
+    attempt.key = endpoint.base_url
+    attempt.record(response)
+    endpoint_pool.record(endpoint, attempt.latency_s, response)
+
+def _record_completion(response):
+    """
+    Учитывает usage/timings ответа в статистике prefill и телеметрии.
+    Время декодирования для непотокового ответа берётся из timings llama.cpp.
+    """
+    prefix_cache.record(response)
+    telemetry.record_response(response)
+    predicted_ms = response_field(response_field(response, 'timings'), 'predicted_ms')
+    if predicted_ms:
+        telemetry.add_span('decoding', predicted_ms / 1000)
 
 def Entity_Relationships_Recognition(article_text):
+    cache_key = _cache_key(article_text)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return parse_response_content(cached, cache_hit=True)
     try:
-        chat_completion = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {
-                    "role": "system",
-                    "content": main_extractor_prompt,
-                },
-                {
-                    "role": "user",
-                    "content": article_text,
-                },
-            ],
-            temperature=0.5,
-            extra_body={
-                "grammar": grammar
-            }
-        )
-        
+        request_kwargs = build_request_kwargs(article_text)
+        # Серверы, на которых запрос не удался: повтор уходит на другой
+        avoid = set()
+        for attempt in request_controller.attempts():
+            with attempt, endpoint_pool.route(avoid, prefix_cache.pinned_slots()) as (endpoint, slot_id):
+                with telemetry.span('http_request'):
+                    chat_completion = endpoint.client().chat.completions.create(**_pin_slot(request_kwargs, slot_id))
+                _record_attempt(attempt, endpoint, chat_completion)
+        _record_completion(chat_completion)
         response_content = chat_completion.choices[0].message.content
-        
-        # Извлекаем JSON из ответа, игнорируя часть с <thinking>
-        closing_tag = "</thinking>"
-        try:
-            think_end_pos = response_content.rfind(closing_tag)
-            if think_end_pos != -1:
-                search_start_pos = think_end_pos + len(closing_tag)
-                json_start_index = response_content.find('{', search_start_pos)
-                if json_start_index != -1:
-                    json_string = response_content[json_start_index:]
-                    parsed_json = json.loads(json_string)
-                    return parsed_json
-                else:
-                    print("\nНе удалось найти JSON после тега </thinking>.")
-            else:
-                print("\nПредупреждение: тег </thinking> не найден. Попытка найти JSON с начала ответа.")
-                json_start_index = response_content.find('{')
-                if json_start_index != -1:
-                    json_string = response_content[json_start_index:]
-                    parsed_json = json.loads(json_string)
-                    print("\nИзвлеченный и распарсенный JSON (запасной метод):")
-                    print(json.dumps(parsed_json, indent=2, ensure_ascii=False))
-                    return parsed_json
-                else:
-                    print("\nНе удалось найти JSON в ответе.")
-        except json.JSONDecodeError as e:
-            print(f"\nОшибка декодирования JSON: {e}")
-            print("Проверьте, что модель вернула корректный JSON.")
-        except Exception as e:
-            print(f"\nПроизошла непредвиденная ошибка при обработке ответа: {e}")
-            
+        return _parse_and_cache(cache_key, response_content)
+    except BudgetExceededError:
+        raise
+    except Exception as e:
+        print(f"\nПроизошла ошибка при выполнении запроса: {e}")
+
+async def Entity_Relationships_Recognition_async(article_text):
+    """
+    Асинхронный вариант Entity_Relationships_Recognition для пакетного режима:
+    не блокирует цикл событий, пока модель генерирует ответ.
+    """
+    cache_key = _cache_key(article_text)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return parse_response_content(cached, cache_hit=True)
+    try:
+        request_kwargs = build_request_kwargs(article_text)
+        avoid = set()
+        async for attempt in request_controller.attempts_async():
+            async with attempt:
+                with endpoint_pool.route(avoid, prefix_cache.pinned_slots()) as (endpoint, slot_id):
+                    with telemetry.span('http_request'):
+                        chat_completion = await endpoint.async_client().chat.completions.create(
+                            **_pin_slot(request_kwargs, slot_id))
+                    _record_attempt(attempt, endpoint, chat_completion)
+        _record_completion(chat_completion)
+        response_content = chat_completion.choices[0].message.content
+        return _parse_and_cache(cache_key, response_content)
+    except BudgetExceededError:
+        raise
     except Exception as e:
         print(f"\nПроизошла ошибка при выполнении запроса: {e}")
 
-def process_kgx_json(json_data, nodes_filepath, edges_filepath):
+def Entity_Relationships_Recognition_chunked(article_text, max_chars=CHUNK_MAX_CHARS, overlap=CHUNK_OVERLAP):
+    """
+    Извлекает граф из длинной статьи: делит её на перекрывающиеся чанки,
+    обрабатывает их параллельно и объединяет результаты (см. chunking.merge_graphs).
+    Короткие статьи обрабатываются одним запросом, как в Entity_Relationships_Recognition.
+    """
+    chunks = split_article(article_text, max_chars, overlap)
+    if len(chunks) == 1:
+        return Entity_Relationships_Recognition(chunks[0])
+
+    print(f"Статья разбита на {len(chunks)} чанков.")
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor
+    # Потоков не больше окна запросов (MAX_CONCURRENCY или --concurrency): остальные чанки ждут в очереди
+    with ThreadPoolExecutor(max_workers=min(len(chunks), request_controller.max_limit)) as executor:
+        # Копия контекста на каждый чанк, чтобы телеметрия попала в запись статьи
+        futures = [executor.submit(contextvars.copy_context().run, Entity_Relationships_Recognition, chunk)
+                   for chunk in chunks]
+        results = [future.result() for future in futures]
+    return _merge_chunk_results(results)
+
+async def Entity_Relationships_Recognition_chunked_async(article_text, max_chars=CHUNK_MAX_CHARS,
+                                                         overlap=CHUNK_OVERLAP, semaphore=None):
+    """
+    Асинхронный вариант Entity_Relationships_Recognition_chunked.
+
+    :param semaphore: Общий asyncio.Semaphore пакетного режима — ограничивает число
+                      одновременных запросов с учётом чанков всех статей.
+    """
+    async def recognize(chunk):
+        if semaphore is None:
+            return await Entity_Relationships_Recognition_async(chunk)
+        async with semaphore:
+            return await Entity_Relationships_Recognition_async(chunk)
+
+    chunks = split_article(article_text, max_chars, overlap)
+    if len(chunks) == 1:
+        return await recognize(chunks[0])
+
+    print(f"Статья разбита на {len(chunks)} чанков.")
+    import asyncio
+    results = await asyncio.gather(*(recognize(chunk) for chunk in chunks))
+    return _merge_chunk_results(results)
+
+def _merge_chunk_results(results):
+    failed = sum(1 for result in results if result is None)
+    if failed:
+        print(f"\nПредупреждение: не удалось обработать {failed} из {len(results)} чанков.")
+    return merge_graphs(results)
+
+def Entity_Relationships_Recognition_stream(article_text, strict=False):
+    """
+    Потоковый вариант Entity_Relationships_Recognition: запрашивает ответ с stream=True
+    и выдаёт узлы и ребра (пары (тип, объект)) по мере того, как модель их дописывает.
+    При обрыве соединения уже выданные элементы остаются у потребителя.
+
+    :param strict: В конце неполного потока выбросить IncompleteResponseError
+                   (чтобы атомарная запись отбросила частичный результат).
+    """
+    cache_key = _cache_key(article_text)
+    parser = new_stream_parser()
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        yield from validate_items(parser.feed(cached))
+        telemetry.record_content(parser.thinking_chars, parser.json_chars, cache_hit=True)
+        return
+
+    parts = []
+    last_chunk = None
+    timer = _StreamTimer()
+    try:
+        request_kwargs = build_request_kwargs(article_text)
+        avoid = set()
+        for attempt in request_controller.attempts():
+            with attempt, endpoint_pool.route(avoid, prefix_cache.pinned_slots()) as (endpoint, slot_id):
+                timer.start()
+                stream = endpoint.client().chat.completions.create(
+                    **_pin_slot(request_kwargs, slot_id), stream=True, stream_options={"include_usage": True})
+                for chunk in stream:
+                    last_chunk = chunk
+                    text = chunk.choices[0].delta.content if chunk.choices else None
+                    if text:
+                        # После первого токена запрос не повторяется: элементы уже выданы
+                        attempt.progress()
+                        timer.token()
+                        if response_cache.enabled:
+                            parts.append(text)
+                        yield from timer.parse(parser, text)
+                if last_chunk is not None:
+                    _record_attempt(attempt, endpoint, last_chunk)
+    except BudgetExceededError:
+        raise
+    except Exception as e:
+        print(f"\nПроизошла ошибка при получении потока ответа: {e}")
+    timer.stop()
+    _finish_stream(cache_key, parser, parts, last_chunk, strict)
+
+async def Entity_Relationships_Recognition_stream_async(article_text, strict=False):
+    """
+    Асинхронный вариант Entity_Relationships_Recognition_stream (асинхронный генератор).
+    """
+    cache_key = _cache_key(article_text)
+    parser = new_stream_parser()
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        for item in validate_items(parser.feed(cached)):
+            yield item
+        telemetry.record_content(parser.thinking_chars, parser.json_chars, cache_hit=True)
+        return
+
+    parts = []
+    last_chunk = None
+    timer = _StreamTimer()
+    try:
+        request_kwargs = build_request_kwargs(article_text)
+        avoid = set()
+        async for attempt in request_controller.attempts_async():
+            async with attempt:
+                with endpoint_pool.route(avoid, prefix_cache.pinned_slots()) as (endpoint, slot_id):
+                    timer.start()
+                    stream = await endpoint.async_client().chat.completions.create(
+                        **_pin_slot(request_kwargs, slot_id), stream=True, stream_options={"include_usage": True})
+                    async for chunk in stream:
+                        last_chunk = chunk
+                        text = chunk.choices[0].delta.content if chunk.choices else None
+                        if text:
+                            # После первого токена запрос не повторяется: элементы уже выданы
+                            attempt.progress()
+                            timer.token()
+                            if response_cache.enabled:
+                                parts.append(text)
+                            for item in timer.parse(parser, text):
+                                yield item
+                    if last_chunk is not None:
+                        _record_attempt(attempt, endpoint, last_chunk)
+    except BudgetExceededError:
+        raise
+    except Exception as e:
+        print(f"\nПроизошла ошибка при получении потока ответа: {e}")
+    timer.stop()
+    _finish_stream(cache_key, parser, parts, last_chunk, strict)
+
+class _StreamTimer:
+    """
+    Время стадий потокового запроса для телеметрии: http_request — от отправки
+    до конца потока, ttft — до первого токена, decoding — от первого токена
+    до конца, thinking — часть decoding до начала JSON, json_extraction — разбор
+    фрагментов GraphStreamParser.
+    Время, которое потребитель генератора тратит на запись, входит в http_request.
+    """
+
+    def __init__(self):
+        self.started = None
+        self.first_token = None
+        self.json_started = None
+        self.parse_s = 0.0
+        # Узлы статьи для проверки концов ребер между фрагментами ответа
+        self.node_status = {}
+
+    def start(self):
+        self.started = time.perf_counter()
+
+    def token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+
+    def parse(self, parser, text):
+        started = time.perf_counter()
+        items = validate_items(parser.feed(text), self.node_status)
+        if self.json_started is None and parser.json_started:
+            self.json_started = started
+        self.parse_s += time.perf_counter() - started
+        return items
+
+    def stop(self):
+        if self.started is None:
+            return
+        finished = time.perf_counter()
+        telemetry.add_span('http_request', finished - self.started)
+        if self.first_token is not None:
+            telemetry.add_span('ttft', self.first_token - self.started)
+            telemetry.add_span('decoding', finished - self.first_token)
+            if self.json_started is not None:
+                telemetry.add_span('thinking', self.json_started - self.first_token)
+        telemetry.add_span('json_extraction', self.parse_s)
+
+def _finish_stream(cache_key, parser, parts, last_chunk=None, strict=False):
+    # usage и timings llama.cpp приходят в последнем чанке потока
+    if last_chunk is not None:
+        prefix_cache.record(last_chunk)
+        telemetry.record_response(last_chunk)
+    telemetry.record_content(parser.thinking_chars, parser.json_chars)
+    if parser.complete:
+        if parts:
+            response_cache.put(cache_key, ''.join(parts))
+    elif strict:
+        raise IncompleteResponseError("JSON ответа получен не полностью")
+    else:
+        print("\nПредупреждение: JSON ответа получен не полностью, записаны только завершённые элементы.")
+
+class KGXWriter:
+    """
+    Дозаписывает узлы и ребра в nodes.tsv/edges.tsv по одному, по мере их
+    поступления (например, из потокового ответа модели). Заголовок пишется,
+    только если файл пуст. Каждая строка сразу сбрасывается на диск, чтобы
+    уже полученные элементы сохранились при обрыве соединения.
+
+    Формат файлов определяется расширением (см. sinks.py): .tsv, .tsv.gz,
+    .tsv.zst или .jsonl; Parquet дозаписывать нельзя, он доступен только
+    через выгрузку хранилища (graph_store).
+
+    В режиме atomic=True строки накапливаются в памяти и дозаписываются
+    одним блоком на файл с fsync при успешном выходе из контекста (при
+    исключении не пишется ничего); диапазоны записанных байтов доступны
+    в nodes_span/edges_span — их фиксирует манифест прогона (run_manifest).
+    """
+
+    def __init__(self, nodes_filepath, edges_filepath, atomic=False):
+        self.nodes_filepath = nodes_filepath
+        self.edges_filepath = edges_filepath
+        self.atomic = atomic
+        self.nodes_written = 0
+        self.edges_written = 0
+        self.nodes_span = None
+        self.edges_span = None
+        self._sinks = []
+
+    @staticmethod
+    def prepare(nodes_filepath, edges_filepath):
+        """
+        Заранее пишет заголовки в пустые файлы. Нужен, когда несколько писателей
+        открываются одновременно (пакетный потоковый режим): каждый проверяет,
+        пуст ли файл, до первой записи, и иначе заголовок записал бы каждый.
+        """
+        for filepath, headers, types in ((nodes_filepath, NODE_HEADERS, NODE_COLUMN_TYPES),
+                                         (edges_filepath, EDGE_HEADERS, EDGE_COLUMN_TYPES)):
+            open_sink(filepath, headers, types, append=True).close()
+
+    def _open(self, filepath, headers, types):
+        if self.atomic:
+            sink = BlockSink(filepath, headers, types)
+        else:
+            sink = open_sink(filepath, headers, types, append=True)
+        self._sinks.append(sink)
+        return sink
+
+    def __enter__(self):
+        self._nodes_sink = self._open(self.nodes_filepath, NODE_HEADERS, NODE_COLUMN_TYPES)
+        self._edges_sink = self._open(self.edges_filepath, EDGE_HEADERS, EDGE_COLUMN_TYPES)
+        return self
+
+    def write(self, kind, item):
+        """
+        Записывает элемент графа; kind — 'node', 'edge' или 'clarification'
+        (уточняющие вопросы в TSV не пишутся).
+        """
+        if kind == 'node':
+            row = node_to_row(item)
+            self._nodes_sink.write([row[header] for header in NODE_HEADERS])
+            self._nodes_sink.flush()
+            self.nodes_written += 1
+        elif kind == 'edge':
+            row = edge_to_row(item)
+            self._edges_sink.write([row[header] for header in EDGE_HEADERS])
+            self._edges_sink.flush()
+            self.edges_written += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.atomic and exc_type is None:
+            self.nodes_span = self._nodes_sink.commit()
+            self.edges_span = self._edges_sink.commit()
+        for sink in self._sinks:
+            sink.close()
+        self._sinks = []
+
+def iter_graph_items(json_data):
+    """
+    Перечисляет элементы графа из разобранного ответа модели
+    в том же виде, что и GraphStreamParser: пары (тип, объект).
+    """
+    graph = json_data.get('graph', {})
+    for node in graph.get('nodes', []):
+        yield 'node', node
+    for edge in graph.get('edges', []):
+        yield 'edge', edge
+
+def write_graph_items(writer, items):
+    """
+    Пишет элементы (пары (тип, объект)) в KGXWriter или статью хранилища внутри их контекста.
+    Для телеметрии учитывает время записи (без ожидания следующего элемента
+    потока) и число записанных узлов и ребер.
+
+    :return: Словарь с числом записанных элементов по типам.
+    """
+    counts = {'node': 0, 'edge': 0}
+    waiting_s = 0.0
+    started = time.perf_counter()
+    with writer as target:
+        iterator = iter(items)
+        while True:
+            wait_started = time.perf_counter()
+            item = next(iterator, None)
+            waiting_s += time.perf_counter() - wait_started
+            if item is None:
+                break
+            kind, graph_item = item
+            target.write(kind, graph_item)
+            counts[kind] = counts.get(kind, 0) + 1
+    telemetry.add_span('tsv_write', time.perf_counter() - started - waiting_s)
+    telemetry.record_items(counts['node'], counts['edge'])
+    return counts
+
+def process_kgx_stream(items, nodes_filepath, edges_filepath, store=None, atomic=False):
+    """
+    Дозаписывает поток элементов графа (пары (тип, объект)) в TSV-файлы,
+    не дожидаясь конца потока.
+
+    :param items: Итерируемый источник пар (тип, объект), например
+                  Entity_Relationships_Recognition_stream().
+    :param nodes_filepath: Путь к выходному файлу для узлов (nodes.tsv).
+    :param edges_filepath: Путь к выходному файлу для ребер (edges.tsv).
+    :param store: graph_store.GraphStore; если задан, элементы добавляются в хранилище
+                  с дедупликацией, а TSV выгружаются из него отдельно.
+    :param atomic: Записать строки статьи одним блоком после окончания потока (см. KGXWriter).
+    :return: KGXWriter (или graph_store.ArticleWriter) со счётчиками записанных узлов и ребер.
+    """
+    if store is not None:
+        writer = store.article()
+        write_graph_items(writer, items)
+        print(f"Данные графа добавлены в хранилище {store.path}")
+        return writer
+
+    writer = KGXWriter(nodes_filepath, edges_filepath, atomic=atomic)
+    write_graph_items(writer, items)
+
+    print(f"Данные узлов успешно дозаписаны в {nodes_filepath}")
+    print(f"Данные ребер успешно дозаписаны в {edges_filepath}")
+    return writer
+
+def process_kgx_json(json_data, nodes_filepath, edges_filepath, store=None, atomic=False):
     """
     Обрабатывает JSON-данные, извлекает узлы и ребра и дозаписывает их в TSV-файлы
     в формате, совместимом с PloverDB и Biolink-моделью.
@@ -110,81 +785,7 @@ def process_kgx_json(json_data, nodes_filepath, edges_filepath):
     :param json_data: Словарь, содержащий данные графа.
     :param nodes_filepath: Путь к выходному файлу для узлов (nodes.tsv).
     :param edges_filepath: Путь к выходному файлу для ребер (edges.tsv).
+    :param store: graph_store.GraphStore для записи с дедупликацией вместо дозаписи в TSV.
+    :param atomic: Записать строки статьи одним блоком с fsync (см. KGXWriter).
     """
-    graph = json_data.get('graph', {})
-    nodes = graph.get('nodes', [])
-    edges = graph.get('edges', [])
-
-    # --- Обработка и дозапись узлов в nodes.tsv (совместимо с PloverDB) ---
-    node_headers = [
-        'id', 'name', 'all_categories', 'confidence_score', 'research_direction',
-        'impact_score', 'source_type', 'maturity_level',
-        'evidence_publication', 'explanation'
-    ]
-
-    # Проверяем, нужно ли записывать заголовок
-    write_node_header = not os.path.exists(nodes_filepath) or os.path.getsize(nodes_filepath) == 0
-
-    with open(nodes_filepath, 'a', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=node_headers, delimiter='\t')
-        
-        if write_node_header:
-            writer.writeheader()
-
-        for node in nodes:
-            additional_fields = node.get('additional_fields', {})
-            evidence_pub = additional_fields.get('evidence_publication')
-            
-            # Преобразование списка публикаций в строку, разделенную '|'
-            evidence_pub_str = '|'.join(evidence_pub) if isinstance(evidence_pub, list) else ''
-
-            row = {
-                'id': node.get('id'),
-                'name': node.get('name'),
-                'all_categories': node.get('category'),  # Переименовано для совместимости с PloverDB
-                'confidence_score': node.get('confidence_score'),
-                'research_direction': additional_fields.get('research_direction'),
-                'impact_score': additional_fields.get('impact_score'),
-                'source_type': additional_fields.get('source_type'),
-                'maturity_level': additional_fields.get('maturity_level'),
-                'evidence_publication': evidence_pub_str,
-                'explanation': additional_fields.get('explanation')
-            }
-            writer.writerow(row)
-
-    print(f"Данные узлов успешно дозаписаны в {nodes_filepath}")
-
-    # --- Обработка и дозапись ребер в edges.tsv (совместимо с PloverDB) ---
-    edge_headers = [
-        'id', 'subject', 'object', 'predicate', 'confidence_score',
-        'provided_by', 'evidence_publication', 'primary_knowledge_source'
-    ]
-
-    # Проверяем, нужно ли записывать заголовок
-    write_edge_header = not os.path.exists(edges_filepath) or os.path.getsize(edges_filepath) == 0
-
-    with open(edges_filepath, 'a', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=edge_headers, delimiter='\t')
-        
-        if write_edge_header:
-            writer.writeheader()
-
-        for edge in edges:
-            evidence_pub = edge.get('evidence_publication')
-            
-            # Преобразование списка публикаций в строку
-            evidence_pub_str = '|'.join(evidence_pub) if isinstance(evidence_pub, list) else ''
-
-            row = {
-                'id': str(uuid.uuid4()),  # Уникальный идентификатор ребра
-                'subject': edge.get('subject'),
-                'object': edge.get('object'),
-                'predicate': edge.get('predicate'),
-                'confidence_score': edge.get('confidence_score'),
-                'provided_by': edge.get('provided_by'),
-                'evidence_publication': evidence_pub_str,
-                'primary_knowledge_source': 'infores:mygraph'  # Источник знаний для PloverDB
-            }
-            writer.writerow(row)
-
-    print(f"Данные ребер успешно дозаписаны в {edges_filepath}")
+    return process_kgx_stream(iter_graph_items(json_data), nodes_filepath, edges_filepath, store, atomic)
@@ -0,0 +1,496 @@
+"""
+Оптимизация GBNF-грамматик, которые строит SchemaConverter, перед отправкой в llama.cpp.
+
+Стоимость ограниченной грамматикой выборки в llama.cpp растёт с числом
+стеков разбора, которые приходится продвигать на каждом токене, а оно —
+с глубиной вложенности правил и шириной альтернатив. Проходы оптимизатора
+не меняют язык грамматики:
+
+- слияние одинаковых правил (например, все поля ["string", "null"]
+  additional_fields получают одно правило) и правил-синонимов (a ::= b);
+- подстановка правил, используемых один раз, если для этого не нужна
+  новая группа (в llama.cpp каждая группа — то же анонимное правило),
+  и удаление пустых правил (space ::= "" компактного режима);
+- удаление правил, недостижимых из root;
+- вынесение общих префиксов альтернатив, в том числе общих начал
+  литералов: "\\"effect_type\\"" | "\\"effect_unit\\"" превращается в
+  "\\"effect_" ("type\\"" | "unit\\""), поэтому до расхождения ключей
+  продвигается один стек, а не по одному на альтернативу.
+
+Проходы повторяются, пока грамматика меняется. Запуск отдельно:
+
+    python grammar_optimizer.py grammar.gbnf > optimized.gbnf
+"""
+import os
+import re
+import sys
+import copy
+import argparse
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+# Версия оптимизатора: увеличивать при любом изменении вывода, иначе закэшированные
+# на диске грамматики не будут пересобраны (входит в ключ кэша extractor.load_or_build_grammar)
+OPTIMIZER_VERSION = '2'
+
+# Глубина раскрытия правил при поиске первого терминала альтернативы
+MAX_HEAD_DEPTH = 16
+
+# Правило, используемое несколько раз, раскрывается в начале альтернативы ради общего
+# префикса, только если оно не длиннее стольких элементов и без групп: иначе тело дублируется
+MAX_EXPAND_ITEMS = 8
+
+# Предел повторов проходов (на практике хватает двух-трёх)
+MAX_ROUNDS = 20
+
+TOKEN_RE = re.compile(r'''
+    (?P<space>\s+|\#[^\n]*)
+  | (?P<define>::=)
+  | (?P<name>[a-zA-Z0-9_-]+)
+  | (?P<literal>"(?:[^"\\]|\\.)*")
+  | (?P<cls>\[(?:[^\]\\]|\\.)*\])
+  | (?P<dot>\.)
+  | (?P<quant>[*+?]|\{\d*(?:,\d*)?\})
+  | (?P<op>[()|])
+''', re.VERBOSE | re.DOTALL)
+
+LITERAL_ESCAPE_RE = re.compile(r'\\(x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}|.)', re.DOTALL)
+LITERAL_ESCAPES = {'n': '\n', 'r': '\r', 't': '\t'}
+LITERAL_FORMAT = {'"': '\\"', '\\': '\\\\', '\n': '\\n', '\r': '\\r', '\t': '\\t'}
+LITERAL_FORMAT_RE = re.compile(r'["\\\x00-\x1f\x7f]')
+
+# Грамматика представлена списками: правило — альтернатива (список последовательностей),
+# последовательность — список элементов (вид, значение, квантификатор), где вид —
+# 'lit' (значение — строка), 'cls' (класс символов или '.' как в тексте), 'ref' (имя
+# правила) или 'group' (значение — вложенная альтернатива)
+Item = Tuple[str, object, str]
+Sequence = List[Item]
+Alternation = List[Sequence]
+
+def _decode_literal(raw: str) -> str:
+    def replace(match):
+        escape = match.group(1)
+        if len(escape) > 1:
+            return chr(int(escape[1:], 16))
+        return LITERAL_ESCAPES.get(escape, escape)
+    return LITERAL_ESCAPE_RE.sub(replace, raw)
+
+def _format_char(match) -> str:
+    c = match.group(0)
+    return LITERAL_FORMAT.get(c) or f'\\x{ord(c):02X}'
+
+def format_literal(value: str) -> str:
+    return '"' + LITERAL_FORMAT_RE.sub(_format_char, value) + '"'
+
+def format_item(item: Item) -> str:
+    kind, value, quant = item
+    if kind == 'lit':
+        text = format_literal(value)
+    elif kind == 'group':
+        text = f'({format_alternation(value)})'
+    else:
+        text = value
+    return text + quant
+
+def format_sequence(seq: Sequence) -> str:
+    return ' '.join(format_item(item) for item in seq)
+
+def format_alternation(alt: Alternation) -> str:
+    if len(alt) == 1 and not alt[0]:
+        return '""'
+    return ' | '.join(format_sequence(seq) for seq in alt)
+
+def _tokenize(text: str) -> List[Tuple[str, str]]:
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = TOKEN_RE.match(text, pos)
+        if not match:
+            raise ValueError(f"Не удалось разобрать грамматику в позиции {pos}: {text[pos:pos + 40]!r}")
+        if match.lastgroup != 'space':
+            tokens.append((match.lastgroup, match.group()))
+        pos = match.end()
+    return tokens
+
+class _Parser:
+    def __init__(self, text: str):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def _peek(self, offset: int = 0) -> Tuple[Optional[str], Optional[str]]:
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def _expect(self, kind: str, value: Optional[str] = None) -> str:
+        token_kind, token_value = self._peek()
+        if token_kind != kind or (value is not None and token_value != value):
+            raise ValueError(f"Ошибка в грамматике: ожидалось {value or kind}, получено {token_value!r}")
+        self.pos += 1
+        return token_value
+
+    def rules(self) -> Dict[str, Alternation]:
+        rules = {}
+        while self._peek()[0] is not None:
+            name = self._expect('name')
+            self._expect('define')
+            rules[name] = self.alternation()
+        return rules
+
+    def alternation(self) -> Alternation:
+        alt = [self.sequence()]
+        while self._peek() == ('op', '|'):
+            self.pos += 1
+            alt.append(self.sequence())
+        return alt
+
+    def sequence(self) -> Sequence:
+        seq = []
+        while True:
+            kind, value = self._peek()
+            if kind is None or (kind == 'op' and value in '|)') or (kind == 'name' and self._peek(1)[0] == 'define'):
+                return seq
+            self.pos += 1
+            if kind == 'literal':
+                item_kind, item_value = 'lit', _decode_literal(value[1:-1])
+            elif kind in ('cls', 'dot'):
+                item_kind, item_value = 'cls', value
+            elif kind == 'name':
+                item_kind, item_value = 'ref', value
+            elif (kind, value) == ('op', '('):
+                item_kind, item_value = 'group', self.alternation()
+                self._expect('op', ')')
+            else:
+                raise ValueError(f"Ошибка в грамматике: неожиданный {value!r}")
+            quant = ''
+            if self._peek()[0] == 'quant':
+                quant = self._peek()[1]
+                self.pos += 1
+            seq.append((item_kind, item_value, quant))
+
+def parse_grammar(text: str) -> Dict[str, Alternation]:
+    """
+    Разбирает текст GBNF в словарь имя правила -> альтернатива (в порядке объявления).
+    """
+    return _Parser(text).rules()
+
+def _walk(alternations):
+    # Альтернативы вместе со вложенными группами
+    stack = list(alternations)
+    while stack:
+        alt = stack.pop()
+        yield alt
+        for seq in alt:
+            for kind, value, _ in seq:
+                if kind == 'group':
+                    stack.append(value)
+
+def _references(alternations) -> Counter:
+    counts = Counter()
+    for alt in _walk(alternations):
+        for seq in alt:
+            for kind, value, _ in seq:
+                if kind == 'ref':
+                    counts[value] += 1
+    return counts
+
+class GrammarOptimizer:
+    """
+    Оптимизатор грамматики (см. описание модуля). stats — число правил до и после
+    и сколько правил слито, подставлено и удалено, сколько альтернатив объединено
+    вынесением общего префикса.
+    """
+
+    def __init__(self, rules: Dict[str, Alternation], root: str = 'root'):
+        self.rules = rules
+        self.root = root
+        self.stats = Counter(rules_before=len(rules))
+        self._counts = Counter()
+
+    @classmethod
+    def from_text(cls, text: str, root: str = 'root') -> 'GrammarOptimizer':
+        return cls(parse_grammar(text), root)
+
+    def optimize(self) -> 'GrammarOptimizer':
+        self._normalize()
+        previous, text = None, self.format()
+        for _ in range(MAX_ROUNDS):
+            if text == previous:
+                break
+            self._prune()
+            self._deduplicate()
+            self._inline()
+            self._factor()
+            self._normalize()
+            previous, text = text, self.format()
+        self.stats['rules_after'] = len(self.rules)
+        return self
+
+    def format(self) -> str:
+        names = sorted(self.rules, key=lambda name: (name != self.root, name))
+        return '\n'.join(f'{name} ::= {format_alternation(self.rules[name])}' for name in names) + '\n'
+
+    # --- Упрощение ---
+
+    def _normalize(self):
+        for name, alt in self.rules.items():
+            self.rules[name] = self._normalize_alternation(alt)
+
+    def _normalize_alternation(self, alt: Alternation) -> Alternation:
+        result, seen = [], set()
+        for seq in alt:
+            seq = self._normalize_sequence(seq)
+            # Альтернатива из одной группы без квантификатора раскрывается в альтернативы группы
+            if len(seq) == 1 and seq[0][0] == 'group' and not seq[0][2]:
+                candidates = seq[0][1]
+            else:
+                candidates = [seq]
+            for candidate in candidates:
+                text = format_sequence(candidate)
+                if text not in seen:
+                    seen.add(text)
+                    result.append(candidate)
+        return result
+
+    def _flatten(self, seq: Sequence):
+        for kind, value, quant in seq:
+            if kind == 'group':
+                value = self._normalize_alternation(value)
+                if all(not s for s in value):
+                    continue
+                if not quant and len(value) == 1:
+                    yield from self._flatten(value[0])
+                    continue
+                if len(value) == 1 and len(value[0]) == 1 and not value[0][0][2]:
+                    kind, value, _ = value[0][0]
+            if kind == 'lit' and not value:
+                continue
+            yield kind, value, quant
+
+    def _normalize_sequence(self, seq: Sequence) -> Sequence:
+        result = []
+        for item in self._flatten(seq):
+            # Соседние литералы склеиваются: общий префикс ищется по символам
+            if item[0] == 'lit' and not item[2] and result and result[-1][0] == 'lit' and not result[-1][2]:
+                result[-1] = ('lit', result[-1][1] + item[1], '')
+            else:
+                result.append(item)
+        return result
+
+    def _rename(self, renames: Dict[str, str]):
+        for alt in _walk(self.rules.values()):
+            for seq in alt:
+                for i, (kind, value, quant) in enumerate(seq):
+                    if kind == 'ref' and value in renames:
+                        seq[i] = (kind, renames[value], quant)
+
+    # --- Проходы ---
+
+    def _prune(self):
+        if self.root not in self.rules:
+            return
+        reachable, queue = {self.root}, [self.root]
+        while queue:
+            for name in _references([self.rules[queue.pop()]]):
+                if name in self.rules and name not in reachable:
+                    reachable.add(name)
+                    queue.append(name)
+        for name in [name for name in self.rules if name not in reachable]:
+            del self.rules[name]
+            self.stats['removed'] += 1
+
+    def _deduplicate(self):
+        while True:
+            # Из одинаковых правил остаётся root или правило с самым коротким именем
+            canonical, renames = {}, {}
+            for name in sorted(self.rules, key=lambda name: (name != self.root, len(name), name)):
+                body = format_alternation(self.rules[name])
+                canonical.setdefault(body, name)
+                if canonical[body] != name:
+                    renames[name] = canonical[body]
+            if not renames:
+                break
+            for name in renames:
+                del self.rules[name]
+            self._rename(renames)
+            self.stats['deduplicated'] += len(renames)
+        # Правила-синонимы (a ::= b) заменяются правилом, на которое ссылаются
+        for name in list(self.rules):
+            alt = self.rules[name]
+            if name != self.root and len(alt) == 1 and len(alt[0]) == 1:
+                kind, value, quant = alt[0][0]
+                if kind == 'ref' and not quant and value != name and value in self.rules:
+                    del self.rules[name]
+                    self._rename({name: value})
+                    self.stats['deduplicated'] += 1
+
+    def _inline(self):
+        # Правило, допускающее только пустую строку, просто убирается из всех ссылок
+        empty = {name for name, alt in self.rules.items() if name != self.root and alt == [[]]}
+        if empty:
+            for alt in _walk(self.rules.values()):
+                for seq in alt:
+                    seq[:] = [item for item in seq if not (item[0] == 'ref' and item[1] in empty)]
+            for name in empty:
+                del self.rules[name]
+            self.stats['inlined'] += len(empty)
+        # Подстановка не меняет числа ссылок, поэтому они считаются один раз за проход, а для
+        # правил с одной ссылкой запоминается правило, где она стоит: искать её по всей
+        # грамматике (с большими перечислениями — десятки тысяч элементов) не нужно
+        counts = _references(self.rules.values())
+        referrers = {}
+        for rule, alt in self.rules.items():
+            for name in _references([alt]):
+                referrers[name] = rule
+        for name in sorted(self.rules):
+            parent = referrers.get(name)
+            if name == self.root or counts[name] != 1 or parent == name:
+                continue
+            body = self.rules[name]
+            if self._inline_once(name, parent):
+                del self.rules[name]
+                for inner in _references([body]):
+                    referrers[inner] = parent
+                self.stats['inlined'] += 1
+
+    def _inline_once(self, name: str, parent: str) -> bool:
+        body = self.rules[name]
+        for alt in _walk([self.rules[parent]]):
+            for seq_index, seq in enumerate(alt):
+                for i, (kind, value, quant) in enumerate(seq):
+                    if kind != 'ref' or value != name:
+                        continue
+                    if not quant and len(body) == 1:
+                        seq[i:i + 1] = copy.deepcopy(body[0])
+                    elif not quant and len(seq) == 1:
+                        alt[seq_index:seq_index + 1] = copy.deepcopy(body)
+                    elif len(body) == 1 and len(body[0]) == 1 and not body[0][0][2]:
+                        inner_kind, inner_value, _ = body[0][0]
+                        seq[i] = (inner_kind, copy.deepcopy(inner_value), quant)
+                    else:
+                        # Подстановка потребовала бы новой группы — выигрыша нет
+                        return False
+                    return True
+        return False
+
+    def _expandable(self, name: str, rule: str) -> bool:
+        alt = self.rules.get(name)
+        if alt is None or len(alt) != 1 or name in (self.root, rule):
+            return False
+        return self._counts[name] == 1 or (len(alt[0]) <= MAX_EXPAND_ITEMS
+                                           and all(kind != 'group' for kind, _, _ in alt[0]))
+
+    def _head_key(self, seq: Sequence, rule: str, depth: int = 0):
+        # Первый терминал альтернативы (первый символ литерала) или первый нераскрываемый элемент
+        if not seq:
+            return None
+        kind, value, quant = seq[0]
+        if not quant and depth < MAX_HEAD_DEPTH:
+            if kind == 'lit':
+                return ('char', value[0]) if value else self._head_key(seq[1:], rule, depth)
+            if kind == 'ref' and self._expandable(value, rule):
+                return self._head_key(self.rules[value][0] + seq[1:], rule, depth + 1)
+            if kind == 'group' and len(value) == 1:
+                return self._head_key(value[0] + seq[1:], rule, depth + 1)
+        return ('item', format_item(seq[0]))
+
+    def _expand_head(self, seq: Sequence, rule: str) -> Sequence:
+        seq = list(seq)
+        for _ in range(MAX_HEAD_DEPTH):
+            if not seq:
+                break
+            kind, value, quant = seq[0]
+            if kind == 'lit' and not value:
+                seq = seq[1:]
+            elif not quant and kind == 'ref' and self._expandable(value, rule):
+                seq = copy.deepcopy(self.rules[value][0]) + seq[1:]
+            elif not quant and kind == 'group' and len(value) == 1:
+                seq = copy.deepcopy(value[0]) + seq[1:]
+            else:
+                break
+        return seq
+
+    def _factor(self):
+        self._counts = _references(self.rules.values())
+        for name, alt in list(self.rules.items()):
+            self.rules[name] = self._factor_alternation(alt, name)
+
+    def _factor_alternation(self, alt: Alternation, rule: str) -> Alternation:
+        alt = [[(kind, self._factor_alternation(value, rule), quant) if kind == 'group' else (kind, value, quant)
+                for kind, value, quant in seq] for seq in alt]
+        # Альтернативы группируются по первому терминалу, порядок первых появлений сохраняется
+        buckets, ordered = {}, []
+        for seq in alt:
+            key = self._head_key(seq, rule)
+            if key is None or key not in buckets:
+                bucket = [seq]
+                ordered.append(bucket)
+                if key is not None:
+                    buckets[key] = bucket
+            else:
+                buckets[key].append(seq)
+        result = []
+        for bucket in ordered:
+            if len(bucket) == 1:
+                result.append(bucket[0])
+            else:
+                self.stats['factored'] += len(bucket) - 1
+                result.append(self._factor_bucket(bucket, rule))
+        return result
+
+    def _factor_bucket(self, bucket: Alternation, rule: str) -> Sequence:
+        seqs = [self._expand_head(seq, rule) for seq in bucket]
+        prefix = []
+        while all(seqs):
+            firsts = [seq[0] for seq in seqs]
+            if len({format_item(item) for item in firsts}) == 1:
+                prefix.append(firsts[0])
+                seqs = [seq[1:] for seq in seqs]
+                continue
+            if all(kind == 'lit' and not quant for kind, _, quant in firsts):
+                common = os.path.commonprefix([value for _, value, _ in firsts])
+                if common:
+                    prefix.append(('lit', common, ''))
+                    seqs = [([('lit', value[len(common):], '')] if value != common else []) + seq[1:]
+                            for (_, value, _), seq in zip(firsts, seqs)]
+            break
+        rest, seen, optional = [], set(), False
+        for seq in seqs:
+            text = format_sequence(seq)
+            if not seq:
+                optional = True
+            elif text not in seen:
+                seen.add(text)
+                rest.append(seq)
+        if not rest:
+            return prefix
+        rest = self._factor_alternation(rest, rule)
+        if len(rest) == 1 and not optional:
+            return prefix + rest[0]
+        return prefix + [('group', rest, '?' if optional else '')]
+
+def optimize_grammar(text: str, root: str = 'root') -> Tuple[str, Dict[str, int]]:
+    """
+    Оптимизирует текст GBNF-грамматики. Возвращает (грамматика, статистика проходов).
+    """
+    optimizer = GrammarOptimizer.from_text(text, root).optimize()
+    return optimizer.format(), dict(optimizer.stats)
+
+def main():
+    parser = argparse.ArgumentParser(description='Оптимизация GBNF-грамматики без изменения её языка.')
+    parser.add_argument('grammar', help='Файл грамматики ("-" — stdin)')
+    parser.add_argument('--root', default='root', help='Начальное правило (по умолчанию: root)')
+    args = parser.parse_args()
+
+    if args.grammar == '-':
+        text = sys.stdin.read()
+    else:
+        with open(args.grammar, 'r', encoding='utf-8') as f:
+            text = f.read()
+    grammar, stats = optimize_grammar(text, args.root)
+    sys.stdout.write(grammar)
+    print(f"Правил: {stats['rules_before']} -> {stats['rules_after']} (слито {stats.get('deduplicated', 0)}, "
+          f"подставлено {stats.get('inlined', 0)}, удалено {stats.get('removed', 0)}, "
+          f"альтернатив с общим префиксом {stats.get('factored', 0)})", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
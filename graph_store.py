@@ -0,0 +1,259 @@
+import os
+import csv
+import uuid
+import sqlite3
+import argparse
+import threading
+
+from chunking import union_lists, combine_confidence
+from kgx_rows import NODE_HEADERS, EDGE_HEADERS, NODE_COLUMN_TYPES, EDGE_COLUMN_TYPES, node_to_row, edge_to_row
+from sinks import open_sink, open_text, parse_format
+
+# Пространство имён для детерминированных id рёбер: одно и то же ребро
+# (subject, predicate, object) получает одинаковый id при каждом экспорте
+EDGE_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'infores:mygraph/edges')
+
+NODE_FIELDS = [h for h in NODE_HEADERS if h != 'id']
+EDGE_FIELDS = [h for h in EDGE_HEADERS if h not in ('id', 'subject', 'object', 'predicate')]
+
+def _split_evidence(value):
+    return [pub for pub in value.split('|') if pub] if value else []
+
+def edge_id(subject, predicate, obj):
+    """
+    Детерминированный идентификатор ребра по тройке (subject, predicate, object).
+    """
+    return str(uuid.uuid5(EDGE_ID_NAMESPACE, f'{subject}\t{predicate}\t{obj}'))
+
+class GraphStore:
+    """
+    Индексированное хранилище графа в SQLite с семантикой upsert.
+
+    Узлы уникальны по id, рёбра — по (subject, predicate, object). Повторное
+    извлечение того же узла или ребра (перезапуск, пересекающиеся статьи)
+    не добавляет строк: списки evidence_publication объединяются,
+    confidence_score объединяется так же, как при слиянии чанков, пустые
+    поля заполняются новыми значениями. TSV для PloverDB выгружается
+    по запросу (export_tsv), поэтому размер итоговых файлов пропорционален
+    числу различных фактов, а не числу прогонов.
+
+    Статьи пишутся через article(): контекст с тем же интерфейсом write(kind, item),
+    что и KGXWriter.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS nodes (id TEXT PRIMARY KEY, '
+            + ', '.join(NODE_FIELDS) + ')'
+        )
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS edges (subject TEXT NOT NULL, object TEXT NOT NULL, predicate TEXT NOT NULL, '
+            + ', '.join(EDGE_FIELDS)
+            + ', PRIMARY KEY (subject, predicate, object))'
+        )
+        self.conn.commit()
+        self._lock = threading.Lock()
+
+    def article(self) -> 'ArticleWriter':
+        """
+        Контекст записи одной статьи (см. ArticleWriter).
+        """
+        return ArticleWriter(self)
+
+    def write_rows(self, rows):
+        """
+        Добавляет строки узлов и ребер (пары ('node' или 'edge', строка TSV)) одной транзакцией.
+        """
+        with self._lock:
+            try:
+                for kind, row in rows:
+                    if kind == 'node':
+                        self.upsert_node_row(row)
+                    else:
+                        self.upsert_edge_row(row)
+            except BaseException:
+                # Под блокировкой незафиксированы только строки этого вызова
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
+    def upsert_node_row(self, row):
+        """
+        Добавляет или обновляет узел по id. row — строка в формате nodes.tsv.
+        """
+        row = {**row, 'confidence_score': _to_float(row.get('confidence_score')),
+               'impact_score': _to_float(row.get('impact_score'))}
+        existing = self.conn.execute(
+            f'SELECT {", ".join(NODE_FIELDS)} FROM nodes WHERE id = ?', (row['id'],)
+        ).fetchone()
+        if existing is None:
+            self.conn.execute(
+                f'INSERT INTO nodes (id, {", ".join(NODE_FIELDS)}) VALUES ({", ".join("?" * (len(NODE_FIELDS) + 1))})',
+                [row['id']] + [row.get(field) for field in NODE_FIELDS]
+            )
+            return
+
+        merged = dict(zip(NODE_FIELDS, existing))
+        for field in NODE_FIELDS:
+            value = row.get(field)
+            if field == 'confidence_score':
+                merged[field] = combine_confidence(merged[field], _to_float(value))
+            elif field == 'evidence_publication':
+                merged[field] = '|'.join(union_lists(_split_evidence(merged[field]), _split_evidence(value)))
+            elif merged[field] in (None, '') and value not in (None, ''):
+                merged[field] = value
+        self.conn.execute(
+            f'UPDATE nodes SET {", ".join(f"{field} = ?" for field in NODE_FIELDS)} WHERE id = ?',
+            [merged[field] for field in NODE_FIELDS] + [row['id']]
+        )
+
+    def upsert_edge_row(self, row):
+        """
+        Добавляет или обновляет ребро по (subject, predicate, object). row — строка в формате edges.tsv;
+        её id игнорируется и вычисляется заново при экспорте.
+        """
+        row = {**row, 'confidence_score': _to_float(row.get('confidence_score'))}
+        key = (row['subject'], row['predicate'], row['object'])
+        existing = self.conn.execute(
+            f'SELECT {", ".join(EDGE_FIELDS)} FROM edges WHERE subject = ? AND predicate = ? AND object = ?', key
+        ).fetchone()
+        if existing is None:
+            self.conn.execute(
+                f'INSERT INTO edges (subject, predicate, object, {", ".join(EDGE_FIELDS)}) '
+                f'VALUES ({", ".join("?" * (len(EDGE_FIELDS) + 3))})',
+                list(key) + [row.get(field) for field in EDGE_FIELDS]
+            )
+            return
+
+        merged = dict(zip(EDGE_FIELDS, existing))
+        for field in EDGE_FIELDS:
+            value = row.get(field)
+            if field == 'confidence_score':
+                merged[field] = combine_confidence(merged[field], _to_float(value))
+            elif field == 'evidence_publication':
+                merged[field] = '|'.join(union_lists(_split_evidence(merged[field]), _split_evidence(value)))
+            elif merged[field] in (None, '') and value not in (None, ''):
+                merged[field] = value
+        self.conn.execute(
+            f'UPDATE edges SET {", ".join(f"{field} = ?" for field in EDGE_FIELDS)} '
+            f'WHERE subject = ? AND predicate = ? AND object = ?',
+            [merged[field] for field in EDGE_FIELDS] + list(key)
+        )
+
+    def commit(self):
+        self.conn.commit()
+
+    def import_tsv(self, nodes_filepath, edges_filepath):
+        """
+        Загружает в хранилище ранее записанные nodes.tsv/edges.tsv (в том числе .tsv.gz/.tsv.zst),
+        схлопывая повторы.
+        """
+        for filepath, upsert in ((nodes_filepath, self.upsert_node_row), (edges_filepath, self.upsert_edge_row)):
+            serialization, compression = parse_format(filepath)
+            if serialization != 'tsv':
+                raise ValueError(f"Импорт поддерживается только из TSV: {filepath}")
+            with open_text(filepath, 'r', compression) as f:
+                for row in csv.DictReader(f, delimiter='\t'):
+                    upsert(row)
+        self.commit()
+
+    def export_tsv(self, nodes_filepath, edges_filepath):
+        """
+        Выгружает граф в nodes.tsv/edges.tsv (файлы перезаписываются) в формате PloverDB.
+        Формат определяется расширением файлов (см. sinks.py): TSV, в том числе сжатый,
+        KGX JSON Lines или Parquet.
+        """
+        with open_sink(nodes_filepath, NODE_HEADERS, NODE_COLUMN_TYPES) as sink:
+            sink.write_many(self.conn.execute(f'SELECT {", ".join(NODE_HEADERS)} FROM nodes ORDER BY rowid'))
+
+        with open_sink(edges_filepath, EDGE_HEADERS, EDGE_COLUMN_TYPES) as sink:
+            columns = ['subject', 'object', 'predicate'] + EDGE_FIELDS
+            for values in self.conn.execute(f'SELECT {", ".join(columns)} FROM edges ORDER BY rowid'):
+                row = dict(zip(columns, values))
+                row['id'] = edge_id(row['subject'], row['predicate'], row['object'])
+                sink.write([row[header] for header in EDGE_HEADERS])
+
+        print(f"Граф выгружен из {self.path}: {self.count('nodes')} узлов в {nodes_filepath}, "
+              f"{self.count('edges')} ребер в {edges_filepath}")
+
+    def count(self, table):
+        return self.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+class ArticleWriter:
+    """
+    Элементы одной статьи для GraphStore. Статьи пакетного режима пишутся
+    одновременно через одно соединение SQLite, поэтому элементы копятся
+    в памяти и при успешном выходе из контекста добавляются и фиксируются
+    одним синхронным шагом (GraphStore.write_rows). При ошибке статьи буфер
+    отбрасывается, а общее соединение не откатывается: данные других статей
+    не теряются.
+    """
+
+    def __init__(self, store: GraphStore):
+        self.store = store
+        self.path = store.path
+        self.nodes_written = 0
+        self.edges_written = 0
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def write(self, kind, item):
+        """
+        Добавляет элемент из ответа модели; kind — 'node', 'edge' или 'clarification'.
+        """
+        if kind == 'node':
+            self._rows.append((kind, node_to_row(item)))
+            self.nodes_written += 1
+        elif kind == 'edge':
+            self._rows.append((kind, edge_to_row(item)))
+            self.edges_written += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        rows, self._rows = self._rows, []
+        if exc_type is None:
+            self.store.write_rows(rows)
+
+def _to_float(value):
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def main():
+    """
+    Импорт TSV в хранилище и выгрузка хранилища в TSV для PloverDB.
+    """
+    parser = argparse.ArgumentParser(description="Дедуплицирующее хранилище узлов и ребер графа (SQLite).")
+    parser.add_argument('command', choices=['import', 'export'],
+                        help='import — загрузить TSV в хранилище, export — выгрузить хранилище в TSV '
+                             '(или .tsv.gz, .tsv.zst, .jsonl, .parquet по расширению файлов)')
+    parser.add_argument('store', type=str, help='Путь к SQLite-файлу хранилища')
+    parser.add_argument('--nodes-file', type=str, default='nodes.tsv', help='Файл узлов (по умолчанию: nodes.tsv)')
+    parser.add_argument('--edges-file', type=str, default='edges.tsv', help='Файл ребер (по умолчанию: edges.tsv)')
+    args = parser.parse_args()
+
+    store = GraphStore(args.store)
+    try:
+        if args.command == 'import':
+            if not (os.path.exists(args.nodes_file) and os.path.exists(args.edges_file)):
+                print(f"Ошибка: не найдены файлы '{args.nodes_file}' и/или '{args.edges_file}'")
+                return
+            store.import_tsv(args.nodes_file, args.edges_file)
+            print(f"Импортировано в {args.store}: {store.count('nodes')} узлов, {store.count('edges')} ребер")
+        else:
+            store.export_tsv(args.nodes_file, args.edges_file)
+    finally:
+        store.close()
+
+if __name__ == '__main__':
+    main()
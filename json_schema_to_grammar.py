@@ -4,10 +4,14 @@ from __future__ import annotations
 import argparse
 import itertools
 import json
+import os
 import re
 import sys
 from typing import Any, List, Optional, Set, Tuple, Union
 
+# Bump on any change to SchemaConverter output, otherwise grammars cached on disk are not rebuilt
+CONVERTER_VERSION = '2'
+
 def _build_repetition(item_rule, min_items, max_items, separator_rule=None):
 
     if max_items == 0:
@@ -231,25 +235,31 @@ DOT = '[^\\x0A\\x0D]'
 RESERVED_NAMES = set(["root", "dot", *PRIMITIVE_RULES.keys(), *STRING_FORMAT_RULES.keys()])
 
 INVALID_RULE_CHARS_RE = re.compile(r'[^a-zA-Z0-9-]+')
-GRAMMAR_LITERAL_ESCAPE_RE = re.compile(r'[\r\n"]')
+GRAMMAR_LITERAL_ESCAPE_RE = re.compile(r'[\r\n"\\]')
 GRAMMAR_RANGE_LITERAL_ESCAPE_RE = re.compile(r'[\r\n"\]\-\\]')
-GRAMMAR_LITERAL_ESCAPES = {'\r': '\\r', '\n': '\\n', '"': '\\"', '-': '\\-', ']': '\\]'}
+GRAMMAR_LITERAL_ESCAPES = {'\r': '\\r', '\n': '\\n', '"': '\\"', '-': '\\-', ']': '\\]', '\\': '\\\\'}
 
 NON_LITERAL_SET = set('|.()[]{}*+?')
 ESCAPED_IN_REGEXPS_BUT_NOT_IN_LITERALS = set('^$.[]()|{}*+?')
 
 
 class SchemaConverter:
-    def __init__(self, *, prop_order, allow_fetch, dotall, raw_pattern):
+    def __init__(self, *, prop_order, allow_fetch, dotall, raw_pattern, compact=False):
         self._prop_order = prop_order
         self._allow_fetch = allow_fetch
         self._dotall = dotall
         self._raw_pattern = raw_pattern
         self._rules = {
-            'space': SPACE_RULE,
+            # Compact mode: no whitespace or newlines between JSON tokens
+            'space': '""' if compact else SPACE_RULE,
         }
         self._refs = {}
         self._refs_being_resolved = set()
+        # Rules of already converted sub-schemas by structural key, see visit
+        self._visited = {}
+        # Structural keys: id(schema) -> (schema, key), and children's keys -> key, see _schema_key
+        self._schema_keys = {}
+        self._interned_keys = {}
 
     def _format_literal(self, literal):
         escaped = GRAMMAR_LITERAL_ESCAPE_RE.sub(
@@ -558,7 +568,72 @@ class SchemaConverter:
     def _generate_constant_rule(self, value):
         return self._format_literal(json.dumps(value))
 
+    def _generate_enum_rule(self, values):
+        '''
+            Enum values as a prefix trie over their JSON text, so a shared
+            prefix is parsed by one stack instead of one stack per value.
+
+            _generate_enum_rule(["ab", "ac", "b"]) -> '"\\"" ("a" ("b\\"" | "c\\"") | "b\\"")'
+            _generate_enum_rule(["a"]) -> '"\\"a\\""'
+            _generate_enum_rule([]) -> ValueError (no value would match; JSON Schema
+                                       requires at least one enum value)
+        '''
+        if not values:
+            raise ValueError('enum must have at least one value')
+
+        def visit(strings):
+            # strings are sorted and distinct, so the common prefix of a group sharing
+            # the first character is the common prefix of its first and last string
+            optional = strings[0] == ''
+            alternatives = []
+            for _, group in itertools.groupby(strings[1:] if optional else strings, key=lambda s: s[0]):
+                group = list(group)
+                if len(group) == 1:
+                    alternatives.append(self._format_literal(group[0]))
+                else:
+                    prefix = os.path.commonprefix([group[0], group[-1]])
+                    rest = visit([s[len(prefix):] for s in group])
+                    alternatives.append(f'{self._format_literal(prefix)} {rest}')
+            rule = ' | '.join(alternatives)
+            if optional:
+                return f'({rule})?'
+            return f'({rule})' if len(alternatives) > 1 else rule
+
+        return visit(sorted({json.dumps(value) for value in values}))
+
+    def _schema_key(self, schema):
+        '''
+            Structural key of a sub-schema: equal schemas get the same integer.
+            A node's key is built from its children's keys and cached by id,
+            so every node is hashed once instead of re-serialising the whole
+            subtree at each level.
+        '''
+        cached = self._schema_keys.get(id(schema))
+        if cached is not None and cached[0] is schema:
+            return cached[1]
+        if isinstance(schema, dict):
+            parts = ('{', tuple(sorted((k, self._schema_key(v)) for k, v in schema.items())))
+        elif isinstance(schema, list):
+            parts = ('[', tuple(self._schema_key(v) for v in schema))
+        else:
+            # The type keeps 1, 1.0 and true apart, as json.dumps would
+            parts = (type(schema).__name__, schema)
+        key = self._interned_keys.setdefault(parts, len(self._interned_keys))
+        if isinstance(schema, (dict, list)):
+            # Holding the schema keeps its id from being reused by a temporary object
+            self._schema_keys[id(schema)] = (schema, key)
+        return key
+
     def visit(self, schema, name):
+        # Identical sub-schemas (e.g. one large enum used by several fields) are
+        # converted once: a repeated visit returns the rule created the first time
+        key = self._schema_key(schema)
+        rule_name = self._visited.get(key)
+        if rule_name is None:
+            rule_name = self._visited[key] = self._visit(schema, name)
+        return rule_name
+
+    def _visit(self, schema, name):
         schema_type = schema.get('type')
         schema_format = schema.get('format')
         rule_name = name + '-' if name in RESERVED_NAMES else name or 'root'
@@ -576,8 +651,7 @@ class SchemaConverter:
             return self._add_rule(rule_name, self._generate_constant_rule(schema['const']) + ' space')
 
         elif 'enum' in schema:
-            rule = '(' + ' | '.join((self._generate_constant_rule(v) for v in schema['enum'])) + ') space'
-            return self._add_rule(rule_name, rule)
+            return self._add_rule(rule_name, self._generate_enum_rule(schema['enum']) + ' space')
 
         elif schema_type in (None, 'object') and \
              ('properties' in schema or \
@@ -0,0 +1,65 @@
+"""
+Формат строк KGX (nodes.tsv/edges.tsv): заголовки, типы колонок и преобразование
+узлов и ребер ответа модели в строки. Общий для extractor и graph_store, без
+зависимостей от клиента LLM.
+"""
+import uuid
+
+# Заголовки TSV (совместимо с PloverDB)
+NODE_HEADERS = [
+    'id', 'name', 'all_categories', 'confidence_score', 'research_direction',
+    'impact_score', 'source_type', 'maturity_level',
+    'evidence_publication', 'explanation'
+]
+EDGE_HEADERS = [
+    'id', 'subject', 'object', 'predicate', 'confidence_score',
+    'provided_by', 'evidence_publication', 'primary_knowledge_source'
+]
+# Типы колонок для JSON Lines и Parquet (остальные — строки, см. sinks.py)
+NODE_COLUMN_TYPES = {
+    'all_categories': 'list', 'confidence_score': 'float', 'impact_score': 'float', 'evidence_publication': 'list'
+}
+EDGE_COLUMN_TYPES = {'confidence_score': 'float', 'evidence_publication': 'list'}
+
+def node_to_row(node):
+    """
+    Преобразует узел из ответа модели в строку nodes.tsv.
+    """
+    additional_fields = node.get('additional_fields') or {}
+    evidence_pub = additional_fields.get('evidence_publication')
+
+    # Преобразование списка публикаций в строку, разделенную '|'
+    evidence_pub_str = '|'.join(evidence_pub) if isinstance(evidence_pub, list) else ''
+
+    return {
+        'id': node.get('id'),
+        'name': node.get('name'),
+        'all_categories': node.get('category'),  # Переименовано для совместимости с PloverDB
+        'confidence_score': node.get('confidence_score'),
+        'research_direction': additional_fields.get('research_direction'),
+        'impact_score': additional_fields.get('impact_score'),
+        'source_type': additional_fields.get('source_type'),
+        'maturity_level': additional_fields.get('maturity_level'),
+        'evidence_publication': evidence_pub_str,
+        'explanation': additional_fields.get('explanation')
+    }
+
+def edge_to_row(edge):
+    """
+    Преобразует ребро из ответа модели в строку edges.tsv.
+    """
+    evidence_pub = edge.get('evidence_publication')
+
+    # Преобразование списка публикаций в строку
+    evidence_pub_str = '|'.join(evidence_pub) if isinstance(evidence_pub, list) else ''
+
+    return {
+        'id': str(uuid.uuid4()),  # Уникальный идентификатор ребра
+        'subject': edge.get('subject'),
+        'object': edge.get('object'),
+        'predicate': edge.get('predicate'),
+        'confidence_score': edge.get('confidence_score'),
+        'provided_by': edge.get('provided_by'),
+        'evidence_publication': evidence_pub_str,
+        'primary_knowledge_source': 'infores:mygraph'  # Источник знаний для PloverDB
+    }
@@ -0,0 +1,134 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+# Как часто (в записях) проверять лимиты размера и возраста кэша
+EVICT_EVERY_PUTS = 100
+
+class ResponseCache:
+    """
+    Персистентный кэш ответов LLM в SQLite.
+
+    Ключ — SHA-256 от всех входных данных запроса (промпт, грамматика, модель,
+    temperature, текст статьи), поэтому повторный прогон того же корпуса с тем же
+    промптом не обращается к модели. Хранится сырой ответ модели, так что
+    изменения в разборе JSON и записи TSV применяются к кэшированным ответам.
+
+    Соединение открывается лениво при первом обращении; при enabled=False
+    кэш ничего не читает и не записывает.
+    """
+
+    def __init__(self, path: str, max_bytes: Optional[int] = None,
+                 max_age_s: Optional[float] = None, enabled: bool = True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._puts = 0
+        # Кэш используется из потоков (параллельные чанки) — сериализуем доступ
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt: str, grammar: str, model: str, temperature: float, article_text: str) -> str:
+        """
+        Вычисляет ключ кэша по содержимому запроса.
+        """
+        payload = json.dumps([prompt, grammar, model, temperature, article_text], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                ' key TEXT PRIMARY KEY,'
+                ' response TEXT NOT NULL,'
+                ' size INTEGER NOT NULL,'
+                ' created_at REAL NOT NULL,'
+                ' accessed_at REAL NOT NULL)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)')
+            self._conn.commit()
+            self._evict()
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Возвращает закэшированный ответ или None. Обновляет время доступа (для LRU).
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute('SELECT response, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+            now = time.time()
+            if row is None or (self.max_age_s and now - row[1] > self.max_age_s):
+                self.misses += 1
+                return None
+            conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str):
+        """
+        Сохраняет ответ модели. Периодически применяет лимиты размера и возраста.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(
+                'INSERT OR REPLACE INTO responses (key, response, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (key, response, len(response.encode('utf-8')), now, now)
+            )
+            conn.commit()
+            self._puts += 1
+            if self._puts % EVICT_EVERY_PUTS == 0:
+                self._evict()
+
+    def _evict(self):
+        """
+        Удаляет записи старше max_age_s, затем наименее давно использованные,
+        пока суммарный размер не станет меньше max_bytes.
+        """
+        conn = self._conn
+        if self.max_age_s:
+            conn.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - self.max_age_s,))
+        if self.max_bytes:
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            excess = total - self.max_bytes
+            if excess > 0:
+                stale_keys = []
+                for key, size in conn.execute('SELECT key, size FROM responses ORDER BY accessed_at'):
+                    stale_keys.append((key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                conn.executemany('DELETE FROM responses WHERE key = ?', stale_keys)
+        conn.commit()
+
+    def stats(self) -> dict:
+        """
+        Счётчики попаданий и промахов за текущий процесс.
+        """
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total, 3) if total else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
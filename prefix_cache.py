@@ -0,0 +1,89 @@
+import threading
+from typing import Optional
+
+from response_fields import response_field
+
+class PrefixCacheMode:
+    """
+    Режим повторного использования KV-кэша llama.cpp для общего префикса запросов
+    (системного промпта main_extractor_prompt.txt).
+
+    Добавляет в extra_body подсказки сервера: cache_prompt=true и, если задано
+    число слотов сервера, закрепление запроса за свободным слотом (id_slot).
+    Слот, в котором уже лежит префикс, пропускает его prefill. Свободные слоты
+    у каждого сервера свои: слот занимает EndpointPool.route() на выбранном
+    сервере (см. pinned_slots()). Если свободного слота нет, запрос
+    отправляется без id_slot и слот выбирает сервер.
+
+    Также накапливает статистику prefill из ответов сервера: сколько токенов
+    промпта было реально вычислено, а сколько взято из кэша.
+    """
+
+    def __init__(self, enabled: bool = False, slots: int = 0):
+        self.enabled = enabled
+        self.prompt_tokens = 0
+        self.evaluated_tokens = 0
+        self.cached_tokens = 0
+        self.prompt_ms = 0.0
+        self.responses = 0
+        self._lock = threading.Lock()
+        self.set_slots(slots)
+
+    def set_slots(self, slots: int):
+        self.slots = max(0, slots)
+
+    def pinned_slots(self) -> int:
+        """
+        Число слотов сервера, за которыми закрепляются запросы; 0 — закрепление не используется.
+        """
+        return self.slots if self.enabled else 0
+
+    def extra_body(self, slot_id: Optional[int]) -> dict:
+        """
+        Подсказки llama.cpp для extra_body запроса.
+        """
+        if not self.enabled:
+            return {}
+        hints = {"cache_prompt": True}
+        if slot_id is not None:
+            hints["id_slot"] = slot_id
+        return hints
+
+    def record(self, response):
+        """
+        Учитывает usage и timings ответа (или последнего чанка потока).
+        llama.cpp возвращает timings.prompt_n — число реально вычисленных токенов
+        промпта; остальные токены промпта взяты из кэша.
+        """
+        usage = response_field(response, 'usage')
+        timings = response_field(response, 'timings')
+        if usage is None and timings is None:
+            return
+
+        prompt_tokens = response_field(usage, 'prompt_tokens')
+        evaluated = response_field(timings, 'prompt_n')
+        cached = response_field(timings, 'cache_n')
+        if cached is None:
+            cached = response_field(response_field(usage, 'prompt_tokens_details'), 'cached_tokens')
+        if cached is None and prompt_tokens is not None and evaluated is not None:
+            cached = max(0, prompt_tokens - evaluated)
+        if evaluated is None and prompt_tokens is not None and cached is not None:
+            evaluated = max(0, prompt_tokens - cached)
+
+        with self._lock:
+            self.responses += 1
+            self.prompt_tokens += prompt_tokens or 0
+            self.evaluated_tokens += evaluated or 0
+            self.cached_tokens += cached or 0
+            self.prompt_ms += response_field(timings, 'prompt_ms') or 0.0
+
+    def stats(self) -> dict:
+        total = self.evaluated_tokens + self.cached_tokens
+        return {
+            'responses': self.responses,
+            'prompt_tokens': self.prompt_tokens,
+            'evaluated_tokens': self.evaluated_tokens,
+            'cached_tokens': self.cached_tokens,
+            'cached_share': round(self.cached_tokens / total, 3) if total else 0.0,
+            'prompt_ms': round(self.prompt_ms, 1),
+        }
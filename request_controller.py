@@ -0,0 +1,341 @@
+import time
+import random
+import threading
+from collections import Counter
+from typing import Optional
+
+from response_fields import response_field
+
+# Коды ответа, означающие перегрузку сервера: окно запросов уменьшается
+OVERLOAD_STATUSES = {429, 503}
+# Остальные коды, при которых запрос имеет смысл повторить
+RETRY_STATUSES = {408, 500, 502, 504}
+
+class BudgetExceededError(Exception):
+    """
+    Исчерпан бюджет прогона на запросы или токены; новые запросы не отправляются.
+    """
+
+def _status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status if isinstance(status, int) else None
+
+def classify_error(error: BaseException) -> str:
+    """
+    Причина ошибки запроса: 'overload' (429/503), 'timeout', 'connection',
+    'server' (прочие повторяемые коды) или 'fatal' (повторять бессмысленно).
+    Ошибки клиента openai распознаются по коду ответа и имени класса, без импорта openai.
+    """
+    status = _status_code(error)
+    if status in OVERLOAD_STATUSES:
+        return 'overload'
+    # asyncio.TimeoutError (до Python 3.11 — отдельный класс) распознаётся по имени, без импорта asyncio
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if isinstance(error, TimeoutError) or any('Timeout' in name for name in names):
+        return 'timeout'
+    if status in RETRY_STATUSES or (status is not None and status >= 500):
+        return 'server'
+    if status is None and (isinstance(error, ConnectionError) or 'APIConnectionError' in names):
+        return 'connection'
+    return 'fatal'
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    value = headers.get('retry-after') if headers is not None else None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+class RequestController:
+    """
+    Управление запросами к LLM: адаптивное окно одновременных запросов (AIMD),
+    повторы с экспоненциальной задержкой и бюджет прогона.
+
+    Окно (limit) растёт на 1/limit за каждый успешный запрос (на единицу за
+    «круг» запросов) и умножается на decrease_ratio при перегрузке: ответе
+    429/503, тайм-ауте или задержке больше latency_tolerance × базовой.
+    Задержка — время ответа на токен completion (или до первого токена в
+    потоковом режиме), базовая — медленно плывущий минимум, отдельный для
+    каждого сервера (attempt.key), если их несколько. Уменьшение
+    выполняется не чаще раза на «поколение» запросов: запрос, начатый до
+    предыдущего уменьшения, окно повторно не уменьшает.
+
+    Повторяются перегрузка, тайм-ауты, ошибки соединения и 5xx — не более
+    max_retries раз, с задержкой random(0, min(backoff_max_s, backoff_base_s × 2^n))
+    (или не меньше Retry-After сервера). Бюджет (max_requests, max_tokens,
+    0 — без ограничения) проверяется перед каждой попыткой; при исчерпании
+    выбрасывается BudgetExceededError.
+
+    Использование (потоки и asyncio):
+        for attempt in controller.attempts():
+            with attempt:
+                response = client.chat.completions.create(...)
+                attempt.record(response)
+
+        async for attempt in controller.attempts_async():
+            async with attempt:
+                ...
+    В потоковом режиме attempt.progress() отмечает первый полученный токен:
+    после него запрос не повторяется, чтобы не выдать элементы дважды.
+    """
+
+    def __init__(self, max_limit: int = 8, min_limit: int = 1, initial_limit: Optional[int] = None,
+                 max_retries: int = 5, backoff_base_s: float = 1.0, backoff_max_s: float = 60.0,
+                 latency_tolerance: float = 2.0, decrease_ratio: float = 0.5,
+                 max_requests: int = 0, max_tokens: int = 0):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial_limit or self.max_limit)))
+        self.max_retries = max(0, max_retries)
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.latency_tolerance = latency_tolerance
+        self.decrease_ratio = decrease_ratio
+        self.max_requests = max_requests
+        self.max_tokens = max_tokens
+
+        self.in_flight = 0
+        self.requests = 0
+        self.succeeded = 0
+        self.retries = 0
+        self.failed = 0
+        self.tokens = 0
+        self.errors = Counter()
+        self.decreases = Counter()
+        self.peak_limit = self.limit
+        self.baselines = {}
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._async_waiters = []
+
+    def set_max_limit(self, max_limit: int):
+        """
+        Задаёт верхнюю границу окна (например, --concurrency пакетного режима).
+        """
+        with self._lock:
+            self.max_limit = max(self.min_limit, max_limit)
+            self.limit = min(self.limit, self.max_limit)
+            # Пик считается в новых границах, иначе в статистике остаётся начальное окно MAX_CONCURRENCY
+            self.peak_limit = min(self.peak_limit, self.max_limit)
+            self._wake()
+
+    @property
+    def window(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    def _check_budget(self):
+        if self.max_requests and self.requests >= self.max_requests:
+            raise BudgetExceededError(f"исчерпан бюджет запросов к LLM ({self.max_requests})")
+        if self.max_tokens and self.tokens >= self.max_tokens:
+            raise BudgetExceededError(f"исчерпан бюджет токенов LLM ({self.tokens} из {self.max_tokens})")
+
+    def _try_acquire(self) -> bool:
+        # Вызывается под self._lock
+        if self.in_flight >= self.window:
+            return False
+        self._check_budget()
+        self.in_flight += 1
+        self.requests += 1
+        return True
+
+    def acquire(self):
+        """
+        Ждёт места в окне запросов (потоки).
+        """
+        with self._available:
+            while not self._try_acquire():
+                self._available.wait()
+
+    async def acquire_async(self):
+        """
+        Ждёт места в окне запросов, не блокируя цикл событий.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._try_acquire():
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            await waiter
+
+    def _wake(self):
+        # Вызывается под self._lock: ожидающие заново проверяют окно
+        self._available.notify_all()
+        waiters, self._async_waiters = self._async_waiters, []
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(_resolve, waiter)
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._wake()
+
+    def _decrease(self, started: float, reason: str):
+        # Вызывается под self._lock
+        self.decreases[reason] += 1
+        if started < self._last_decrease:
+            return
+        self.limit = max(float(self.min_limit), self.limit * self.decrease_ratio)
+        self._last_decrease = time.monotonic()
+
+    def on_success(self, started: float, latency_s: Optional[float], tokens: int = 0, key=None):
+        """
+        Учитывает успешный запрос: увеличивает окно или уменьшает его, если задержка
+        выросла относительно базовой для key (сервера).
+        """
+        with self._lock:
+            self.succeeded += 1
+            self.tokens += tokens
+            if latency_s is not None:
+                baseline = self.baselines.get(key)
+                if baseline is None or latency_s < baseline:
+                    baseline = latency_s
+                else:
+                    # Базовая задержка медленно подтягивается вверх, если сервер стал медленнее насовсем
+                    baseline += (latency_s - baseline) * 0.01
+                self.baselines[key] = baseline
+                if latency_s > baseline * self.latency_tolerance:
+                    self._decrease(started, 'latency')
+                    return
+            self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self.peak_limit = max(self.peak_limit, self.limit)
+
+    def on_failure(self, started: float, reason: str, retry: bool):
+        with self._lock:
+            self.errors[reason] += 1
+            if retry:
+                self.retries += 1
+            else:
+                self.failed += 1
+            if reason in ('overload', 'timeout'):
+                self._decrease(started, reason)
+
+    def backoff_delay(self, attempt_no: int, error: Optional[BaseException] = None) -> float:
+        """
+        Задержка перед повтором: full jitter по экспоненте, но не меньше Retry-After.
+        """
+        delay = random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * (2 ** attempt_no)))
+        retry_after = _retry_after(error) if error is not None else None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max_s))
+        return delay
+
+    def attempts(self):
+        """
+        Попытки запроса для потоков (см. описание класса).
+        """
+        for attempt_no in range(self.max_retries + 1):
+            attempt = _Attempt(self, attempt_no)
+            yield attempt
+            if attempt.error is None:
+                return
+            time.sleep(attempt.delay)
+
+    async def attempts_async(self):
+        """
+        Попытки запроса для asyncio (см. описание класса).
+        """
+        import asyncio
+        for attempt_no in range(self.max_retries + 1):
+            attempt = _Attempt(self, attempt_no)
+            yield attempt
+            if attempt.error is None:
+                return
+            await asyncio.sleep(attempt.delay)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'succeeded': self.succeeded,
+                'retries': self.retries,
+                'failed': self.failed,
+                'tokens': self.tokens,
+                'errors': dict(self.errors),
+                'window': self.window,
+                'peak_window': int(self.peak_limit),
+                'decreases': dict(self.decreases),
+            }
+
+def _resolve(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+class _Attempt:
+    """
+    Одна попытка запроса: держит место в окне и сообщает контроллеру результат.
+    Повторяемая ошибка до первого токена подавляется — цикл attempts() повторит запрос.
+    """
+
+    def __init__(self, controller: RequestController, attempt_no: int):
+        self.controller = controller
+        self.attempt_no = attempt_no
+        self.started = None
+        self.latency_s = None
+        self.tokens = 0
+        self.key = None
+        self.progressed = False
+        self.error = None
+        self.delay = 0.0
+
+    def record(self, response):
+        """
+        Задержка на токен и число токенов по usage непотокового ответа (или последнего чанка потока).
+        """
+        usage = response_field(response, 'usage')
+        self.tokens = response_field(usage, 'total_tokens') or 0
+        if not self.progressed:
+            completion_tokens = response_field(usage, 'completion_tokens') or 0
+            self.latency_s = (time.monotonic() - self.started) / max(1, completion_tokens)
+
+    def progress(self):
+        """
+        Отмечает получение первого токена потока: задержка — время до него, повторов больше нет.
+        """
+        if not self.progressed:
+            self.progressed = True
+            self.latency_s = time.monotonic() - self.started
+
+    def _start(self):
+        self.started = time.monotonic()
+
+    def _finish(self, exc_type, exc) -> bool:
+        controller = self.controller
+        controller.release()
+        if exc_type is None:
+            controller.on_success(self.started, self.latency_s, self.tokens, self.key)
+            return False
+        if not isinstance(exc, Exception):
+            return False
+        reason = classify_error(exc)
+        retry = (reason != 'fatal' and not self.progressed and self.attempt_no < controller.max_retries)
+        controller.on_failure(self.started, reason, retry)
+        if not retry:
+            return False
+        self.error = exc
+        self.delay = controller.backoff_delay(self.attempt_no, exc)
+        print(f"\nЗапрос к LLM не удался ({reason}: {exc}), повтор {self.attempt_no + 1} "
+              f"из {controller.max_retries} через {self.delay:.1f} с.")
+        return True
+
+    def __enter__(self):
+        self.controller.acquire()
+        self._start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._finish(exc_type, exc)
+
+    async def __aenter__(self):
+        await self.controller.acquire_async()
+        self._start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self._finish(exc_type, exc)
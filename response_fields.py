@@ -0,0 +1,18 @@
+"""
+Доступ к полям ответа сервера LLM, общий для модулей учёта запросов.
+"""
+
+def response_field(obj, name):
+    """
+    Читает поле из объекта SDK или словаря. Нестандартные поля llama.cpp
+    (timings) SDK хранит как дополнительные атрибуты модели.
+    """
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    value = getattr(obj, name, None)
+    if value is None:
+        extra = getattr(obj, 'model_extra', None) or {}
+        value = extra.get(name)
+    return value
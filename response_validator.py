@@ -0,0 +1,547 @@
+#!/usr/bin/env python3
+"""
+Проверка ответов модели по JSON-схеме (main_extractor_shema.json).
+
+Схема один раз компилируется в код на Python — так же, как SchemaConverter
+генерирует из неё GBNF: для каждого типа элементов графа (узел, ребро,
+уточняющий вопрос) строится функция, которая за один проход проверяет
+элемент и возвращает ошибки по полям. Поддерживаются type, enum, const,
+minimum/maximum (и exclusive*), minLength/maxLength, pattern,
+minItems/maxItems, items, properties, required, additionalProperties,
+allOf/anyOf/oneOf (ровно один подходящий вариант) и локальные $ref;
+остальные ключевые слова игнорируются.
+
+Невалидные элементы отбрасываются, не отклоняя статью целиком; если задан
+файл карантина, они дозаписываются в него (JSONL) вместе с ошибками.
+Ребра, у которых subject или object — отброшенный узел, отбрасываются вместе с ним.
+
+Сгенерированный код для схемы можно посмотреть:
+
+    python response_validator.py prompts_and_shemes/main_extractor_shema.json
+"""
+import re
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from stream_parser import DEFAULT_ITEM_PATHS
+
+# Проверки типов JSON для сгенерированного кода; bool в Python — подкласс int, поэтому исключается явно
+TYPE_CHECKS = {
+    'string': 'isinstance({v}, str)',
+    'number': '(isinstance({v}, (int, float)) and not isinstance({v}, bool))',
+    'integer': '(isinstance({v}, int) and not isinstance({v}, bool))',
+    'boolean': 'isinstance({v}, bool)',
+    'null': '{v} is None',
+    'array': 'isinstance({v}, list)',
+    'object': 'isinstance({v}, dict)',
+}
+
+# Числовые ограничения: (ключевое слово, условие нарушения, текст ошибки).
+# Условия записаны через not, чтобы NaN тоже считался нарушением
+NUMBER_BOUNDS = (
+    ('minimum', 'not {v} >= {limit}', 'меньше minimum'),
+    ('maximum', 'not {v} <= {limit}', 'больше maximum'),
+    ('exclusiveMinimum', 'not {v} > {limit}', 'не больше exclusiveMinimum'),
+    ('exclusiveMaximum', 'not {v} < {limit}', 'не меньше exclusiveMaximum'),
+)
+
+class ValidatorCompiler:
+    """
+    Генерирует исходный код функций проверки по JSON-схеме.
+
+    Каждая функция имеет вид name(value, errors, path) и дописывает в errors
+    пары (путь поля, сообщение). Вложенные объекты и массивы разворачиваются
+    в одну функцию; пути полей вычисляются только при ошибке. Отдельные
+    функции создаются для $ref (допускают рекурсию) и вариантов anyOf/oneOf.
+    """
+
+    def __init__(self, schema: dict):
+        self._root = schema
+        self._lines: List[str] = []
+        self._constants: Dict[str, Any] = {}
+        self._refs: Dict[str, str] = {}
+        self._counter = 0
+
+    def _name(self, prefix: str) -> str:
+        self._counter += 1
+        return f'{prefix}_{self._counter}'
+
+    def _constant(self, value: Any) -> str:
+        name = self._name('_c')
+        self._constants[name] = value
+        return name
+
+    def _resolve_ref(self, ref: str) -> dict:
+        if not ref.startswith('#'):
+            raise ValueError(f"Поддерживаются только локальные $ref: {ref}")
+        target = self._root
+        for part in ref[1:].split('/')[1:]:
+            target = target[part.replace('~1', '/').replace('~0', '~')]
+        return target
+
+    def add_function(self, schema: dict, name: str) -> str:
+        """
+        Добавляет функцию проверки значения по схеме и возвращает её имя.
+        """
+        body: List[str] = []
+        self._visit(schema, 'value', 'path', body, 1)
+        self._lines.append(f'def {name}(value, errors, path):')
+        self._lines.extend(body or ['    pass'])
+        self._lines.append('')
+        return name
+
+    def _ref_function(self, ref: str) -> str:
+        name = self._refs.get(ref)
+        if name is None:
+            name = self._refs[ref] = self._name('_ref')
+            self.add_function(self._resolve_ref(ref), name)
+        return name
+
+    def _visit(self, schema: Any, v: str, path: str, out: List[str], level: int):
+        """
+        Дописывает в out проверки значения-выражения v; path — выражение пути поля.
+        """
+        indent = '    ' * level
+        if schema is True or not isinstance(schema, dict):
+            return
+        if schema is False or schema.get('not') == {}:
+            out.append(f'{indent}_error(errors, {path}, "значение не допускается схемой")')
+            return
+
+        if '$ref' in schema:
+            out.append(f'{indent}{self._ref_function(schema["$ref"])}({v}, errors, {path})')
+        for sub_schema in schema.get('allOf', []):
+            self._visit(sub_schema, v, path, out, level)
+        if schema.get('anyOf'):
+            names = [self.add_function(alt, self._name('_alt')) for alt in schema['anyOf']]
+            out.append(f'{indent}if not _any_valid(({", ".join(names)},), {v}):')
+            out.append(f'{indent}    _error(errors, {path}, "не подходит ни один вариант anyOf")')
+        if schema.get('oneOf'):
+            names = [self.add_function(alt, self._name('_alt')) for alt in schema['oneOf']]
+            message = self._name('m')
+            out.append(f'{indent}{message} = _one_of_error(({", ".join(names)},), {v})')
+            out.append(f'{indent}if {message}:')
+            out.append(f'{indent}    _error(errors, {path}, {message})')
+
+        if 'const' in schema:
+            const = self._constant(schema['const'])
+            out.append(f'{indent}if {v} != {const}:')
+            out.append(f'{indent}    _error(errors, {path}, f"ожидалось значение {{{const}!r}}")')
+        if 'enum' in schema:
+            values = schema['enum']
+            hashable = all(isinstance(value, (str, int, float, type(None))) and not isinstance(value, bool)
+                           for value in values)
+            enum = self._constant(frozenset(values) if hashable else tuple(values))
+            check = f'isinstance({v}, (str, int, float, type(None))) and {v} in {enum}' if hashable else f'{v} in {enum}'
+            out.append(f'{indent}if not ({check}):')
+            out.append(f'{indent}    _error(errors, {path}, f"значение {{_short({v})}} не входит в enum")')
+
+        types = schema.get('type')
+        if types is None:
+            types = [t for t, keys in (('object', ('properties', 'required', 'additionalProperties')),
+                                       ('array', ('items', 'minItems', 'maxItems')))
+                     if any(key in schema for key in keys)]
+            checked = False
+        else:
+            types = [types] if isinstance(types, str) else list(types)
+            checked = True
+
+        branches = []
+        for type_name in types:
+            body: List[str] = []
+            if type_name in ('number', 'integer'):
+                self._visit_number(schema, v, path, body, level + 1)
+            elif type_name == 'string':
+                self._visit_string(schema, v, path, body, level + 1)
+            elif type_name == 'array':
+                self._visit_array(schema, v, path, body, level + 1)
+            elif type_name == 'object':
+                self._visit_object(schema, v, path, body, level + 1)
+            elif type_name not in TYPE_CHECKS:
+                raise ValueError(f"Неизвестный тип в схеме: {type_name}")
+            branches.append((TYPE_CHECKS[type_name].format(v=v), body))
+
+        if not checked:
+            for condition, body in branches:
+                if body:
+                    out.append(f'{indent}if {condition}:')
+                    out.extend(body)
+            return
+        if not branches:
+            return
+        expected = '|'.join(types)
+        type_error = f'_error(errors, {path}, f"ожидался тип {expected}, получено {{_type_name({v})}}")'
+        if not any(body for _, body in branches):
+            out.append(f'{indent}if not ({" or ".join(condition for condition, _ in branches)}):')
+            out.append(f'{indent}    {type_error}')
+            return
+        keyword = 'if'
+        for condition, body in branches:
+            out.append(f'{indent}{keyword} {condition}:')
+            out.extend(body or [f'{indent}    pass'])
+            keyword = 'elif'
+        out.append(f'{indent}else:')
+        out.append(f'{indent}    {type_error}')
+
+    def _visit_number(self, schema: dict, v: str, path: str, out: List[str], level: int):
+        indent = '    ' * level
+        for keyword, condition, message in NUMBER_BOUNDS:
+            limit = schema.get(keyword)
+            if isinstance(limit, (int, float)) and not isinstance(limit, bool):
+                out.append(f'{indent}if {condition.format(v=v, limit=repr(limit))}:')
+                out.append(f'{indent}    _error(errors, {path}, f"{{{v}!r}} {message} {limit!r}")')
+
+    def _visit_string(self, schema: dict, v: str, path: str, out: List[str], level: int):
+        indent = '    ' * level
+        if 'minLength' in schema:
+            out.append(f'{indent}if len({v}) < {int(schema["minLength"])}:')
+            out.append(f'{indent}    _error(errors, {path}, "строка короче minLength {schema["minLength"]}")')
+        if 'maxLength' in schema:
+            out.append(f'{indent}if len({v}) > {int(schema["maxLength"])}:')
+            out.append(f'{indent}    _error(errors, {path}, "строка длиннее maxLength {schema["maxLength"]}")')
+        if 'pattern' in schema:
+            pattern = self._constant(re.compile(schema['pattern']))
+            out.append(f'{indent}if not {pattern}.search({v}):')
+            out.append(f'{indent}    _error(errors, {path}, f"строка не соответствует pattern {{{pattern}.pattern!r}}")')
+
+    def _visit_array(self, schema: dict, v: str, path: str, out: List[str], level: int):
+        indent = '    ' * level
+        if 'minItems' in schema:
+            out.append(f'{indent}if len({v}) < {int(schema["minItems"])}:')
+            out.append(f'{indent}    _error(errors, {path}, "элементов меньше minItems {schema["minItems"]}")')
+        if 'maxItems' in schema:
+            out.append(f'{indent}if len({v}) > {int(schema["maxItems"])}:')
+            out.append(f'{indent}    _error(errors, {path}, "элементов больше maxItems {schema["maxItems"]}")')
+        items = schema.get('items')
+        if isinstance(items, dict) and items:
+            index = self._name('i')
+            item = self._name('x')
+            body: List[str] = []
+            self._visit(items, item, f'_index({path}, {index})', body, level + 1)
+            if body:
+                out.append(f'{indent}for {index}, {item} in enumerate({v}):')
+                out.extend(body)
+
+    def _visit_object(self, schema: dict, v: str, path: str, out: List[str], level: int):
+        indent = '    ' * level
+        properties = schema.get('properties', {})
+        for key in schema.get('required', []):
+            out.append(f'{indent}if {key!r} not in {v}:')
+            out.append(f'{indent}    _error(errors, _field({path}, {key!r}), "обязательное поле отсутствует")')
+        for key, prop_schema in properties.items():
+            value = self._name('p')
+            body: List[str] = []
+            self._visit(prop_schema, value, f'_field({path}, {key!r})', body, level + 1)
+            if body:
+                out.append(f'{indent}{value} = {v}.get({key!r}, _MISSING)')
+                out.append(f'{indent}if {value} is not _MISSING:')
+                out.extend(body)
+        additional = schema.get('additionalProperties', True)
+        if additional is True:
+            return
+        known = self._constant(frozenset(properties))
+        key = self._name('k')
+        value = self._name('p')
+        out.append(f'{indent}for {key}, {value} in {v}.items():')
+        out.append(f'{indent}    if {key} not in {known}:')
+        if additional is False:
+            out.append(f'{indent}        _error(errors, _field({path}, {key}), "лишнее поле")')
+        else:
+            body: List[str] = []
+            self._visit(additional, value, f'_field({path}, {key})', body, level + 2)
+            out.extend(body or [f'{indent}        pass'])
+
+    def source(self) -> str:
+        return '\n'.join(self._lines)
+
+    def compile(self) -> Dict[str, Any]:
+        """
+        Исполняет сгенерированный код; возвращает пространство имён с функциями проверки.
+        """
+        namespace = dict(HELPERS, **self._constants)
+        exec(compile(self.source(), '<response_validator>', 'exec'), namespace)
+        return namespace
+
+_MISSING = object()
+
+# Индексы массивов в путях полей не различаются в статистике ошибок
+_INDEX_RE = re.compile(r'\[\d+\]')
+
+def _error(errors: list, path: str, message: str):
+    errors.append((path, message))
+
+def _field(path: str, key: str) -> str:
+    return f'{path}.{key}' if path else key
+
+def _index(path: str, index: int) -> str:
+    return f'{path}[{index}]'
+
+def _short(value: Any, limit: int = 60) -> str:
+    text = repr(value)
+    return text if len(text) <= limit else text[:limit] + '…'
+
+def _type_name(value: Any) -> str:
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, (int, float)):
+        return 'number'
+    return {str: 'string', list: 'array', dict: 'object'}.get(type(value), type(value).__name__)
+
+def _any_valid(functions: Tuple[Callable, ...], value: Any) -> bool:
+    for function in functions:
+        errors = []
+        function(value, errors, '')
+        if not errors:
+            return True
+    return False
+
+def _one_of_error(functions: Tuple[Callable, ...], value: Any) -> Optional[str]:
+    # oneOf требует ровно один подходящий вариант; проверка останавливается на втором
+    matched = 0
+    for function in functions:
+        errors = []
+        function(value, errors, '')
+        if not errors:
+            matched += 1
+            if matched > 1:
+                return "подходит больше одного варианта oneOf"
+    return None if matched else "не подходит ни один вариант oneOf"
+
+# Вспомогательные функции, доступные сгенерированному коду
+HELPERS = {
+    '_MISSING': _MISSING, '_error': _error, '_field': _field, '_index': _index,
+    '_short': _short, '_type_name': _type_name, '_any_valid': _any_valid,
+    '_one_of_error': _one_of_error,
+}
+
+# Поля ребра, ссылающиеся на id узлов
+EDGE_NODE_FIELDS = ('subject', 'object')
+
+def _node_ids(nodes: Iterable[Any]) -> set:
+    return {node['id'] for node in nodes if isinstance(node, dict) and isinstance(node.get('id'), str)}
+
+def item_schema(schema: dict, path: Tuple[str, ...]) -> Optional[dict]:
+    """
+    Схема элементов массива по пути свойств (например, ('graph', 'nodes')).
+    """
+    for key in path:
+        schema = (schema.get('properties') or {}).get(key)
+        if not isinstance(schema, dict):
+            return None
+    items = schema.get('items')
+    return items if isinstance(items, dict) else None
+
+class ResponseValidator:
+    """
+    Проверка элементов графа из ответов модели скомпилированными по схеме функциями.
+
+    Схема задаётся через set_schema() (функции компилируются один раз) или
+    лениво через schema_loader. filter_graph() фильтрует разобранный ответ
+    целиком, filter_items() — поток пар (тип, объект) потокового режима.
+    Невалидные элементы отбрасываются и, если задан quarantine_path,
+    дозаписываются туда строкой JSONL с ошибками по полям. filter_graph()
+    также отбрасывает ребра, ссылающиеся на отброшенные узлы.
+    """
+
+    def __init__(self, schema_loader: Optional[Callable[[], dict]] = None,
+                 quarantine_path: Optional[str] = None, enabled: bool = True,
+                 item_paths: Optional[Dict[Tuple[str, ...], str]] = None):
+        self.schema_loader = schema_loader
+        self.quarantine_path = quarantine_path
+        self.enabled = enabled
+        self.item_paths = item_paths or DEFAULT_ITEM_PATHS
+        self.valid = 0
+        self.invalid = Counter()
+        self.field_errors = Counter()
+        self._validators = None
+        self._source = ''
+        self._file = None
+        self._lock = threading.Lock()
+
+    def set_schema(self, schema: dict):
+        """
+        Компилирует функции проверки для всех типов элементов, описанных в схеме.
+        """
+        compiler = ValidatorCompiler(schema)
+        names = {}
+        for path, kind in self.item_paths.items():
+            sub_schema = item_schema(schema, path)
+            if sub_schema is not None:
+                names[kind] = compiler.add_function(sub_schema, f'validate_{kind}')
+        namespace = compiler.compile()
+        self._source = compiler.source()
+        self._validators = {kind: namespace[name] for kind, name in names.items()}
+
+    @property
+    def source(self) -> str:
+        """
+        Сгенерированный код функций проверки.
+        """
+        self._ensure_compiled()
+        return self._source
+
+    def _ensure_compiled(self):
+        if self._validators is None:
+            self.set_schema(self.schema_loader() if self.schema_loader else {})
+
+    def check(self, kind: str, item: Any) -> List[Tuple[str, str]]:
+        """
+        Ошибки элемента графа: список пар (путь поля, сообщение); пустой — элемент валиден.
+        """
+        self._ensure_compiled()
+        validate = self._validators.get(kind)
+        errors = []
+        if validate is not None:
+            validate(item, errors, '')
+        return errors
+
+    def accept(self, kind: str, item: Any, article_id: Optional[str] = None) -> bool:
+        """
+        Проверяет элемент; невалидный учитывается в статистике и отправляется в карантин.
+        """
+        errors = self.check(kind, item)
+        if not errors:
+            with self._lock:
+                self.valid += 1
+            return True
+        self._reject(kind, item, errors, article_id)
+        return False
+
+    def _reject(self, kind: str, item: Any, errors: List[Tuple[str, str]], article_id: Optional[str]):
+        with self._lock:
+            self.invalid[kind] += 1
+            self.field_errors.update(_INDEX_RE.sub('[]', f'{kind}.{path}' if path else kind) for path, _ in errors)
+        self._quarantine(kind, item, errors, article_id)
+
+    def filter_graph(self, json_data: Any, article_id: Optional[str] = None) -> Any:
+        """
+        Возвращает ответ модели без невалидных элементов графа (исходный объект не меняется).
+        Ребра, у которых subject или object — id отброшенного узла, тоже отбрасываются.
+        """
+        if not self.enabled or not isinstance(json_data, dict):
+            return json_data
+        graph = json_data.get('graph')
+        if not isinstance(graph, dict):
+            self._reject_response('graph', json_data, article_id)
+            return {**json_data, 'graph': {'nodes': [], 'edges': []}}
+
+        filtered = dict(graph)
+        # id отброшенных узлов и ключ ребер: ребра проверяются на висячие концы после всех узлов
+        dropped_nodes = set()
+        edges_key = None
+        for path, kind in self.item_paths.items():
+            if len(path) != 2 or path[0] != 'graph' or path[1] not in graph:
+                continue
+            items = graph[path[1]]
+            if items is None:
+                filtered[path[1]] = []
+                continue
+            if not isinstance(items, list):
+                self._reject_response(f'graph.{path[1]}', json_data, article_id)
+                filtered[path[1]] = []
+                continue
+            filtered[path[1]] = [item for item in items if self.accept(kind, item, article_id)]
+            if kind == 'node':
+                dropped_nodes |= _node_ids(items) - _node_ids(filtered[path[1]])
+            elif kind == 'edge':
+                edges_key = path[1]
+        if dropped_nodes and edges_key is not None:
+            filtered[edges_key] = [edge for edge in filtered[edges_key]
+                                   if self._accept_edge_nodes(edge, dropped_nodes.__contains__, article_id)]
+        return {**json_data, 'graph': filtered}
+
+    def _accept_edge_nodes(self, edge: dict, is_dropped: Callable[[str], bool], article_id: Optional[str]) -> bool:
+        """
+        Ребро (уже прошедшее проверку по схеме) остаётся, если оба его конца — не отброшенные узлы.
+        """
+        errors = [(field, f"узел {_short(edge[field])} отброшен проверкой") for field in EDGE_NODE_FIELDS
+                  if isinstance(edge.get(field), str) and is_dropped(edge[field])]
+        if not errors:
+            return True
+        # accept() уже засчитал ребро валидным
+        with self._lock:
+            self.valid -= 1
+        self._reject('edge', edge, errors, article_id)
+        return False
+
+    def filter_items(self, items: Iterable[Tuple[str, Any]], article_id: Optional[str] = None,
+                     node_status: Optional[Dict[str, bool]] = None):
+        """
+        Пропускает только валидные элементы потока пар (тип, объект). Ребра,
+        ссылающиеся на отброшенный ранее узел, тоже отбрасываются; ребро,
+        выданное до того, как его узел отброшен, уже не отзывается.
+
+        :param node_status: id узла -> принят ли хотя бы один узел с этим id.
+                            Задаётся, когда поток одной статьи проверяется по частям
+                            (по фрагментам ответа), чтобы узлы учитывались между вызовами.
+        """
+        if not self.enabled:
+            yield from items
+            return
+        node_status = node_status if node_status is not None else {}
+        is_dropped = lambda node: node_status.get(node) is False
+        for kind, item in items:
+            accepted = self.accept(kind, item, article_id)
+            if kind == 'node':
+                node = item.get('id') if isinstance(item, dict) else None
+                if isinstance(node, str):
+                    node_status[node] = accepted or node_status.get(node, False)
+            elif kind == 'edge' and accepted:
+                accepted = self._accept_edge_nodes(item, is_dropped, article_id)
+            if accepted:
+                yield kind, item
+
+    def _reject_response(self, path: str, json_data: Any, article_id: Optional[str]):
+        with self._lock:
+            self.invalid['response'] += 1
+            self.field_errors[path] += 1
+        self._quarantine('response', json_data, [(path, 'ожидался объект графа')], article_id)
+
+    def _quarantine(self, kind: str, item: Any, errors: List[Tuple[str, str]], article_id: Optional[str]):
+        if not self.quarantine_path:
+            return
+        record = {
+            'ts': round(time.time(), 3),
+            'article_id': article_id,
+            'kind': kind,
+            'errors': [{'field': path, 'message': message} for path, message in errors],
+            'item': item,
+        }
+        line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.quarantine_path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'valid': self.valid,
+                'invalid': dict(self.invalid),
+                'top_field_errors': dict(self.field_errors.most_common(5)),
+            }
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def main(args_in = None):
+    parser = argparse.ArgumentParser(description='Печатает код функций проверки, сгенерированный по JSON-схеме ответа.')
+    parser.add_argument('schema', help='Путь к JSON-схеме (например, prompts_and_shemes/main_extractor_shema.json)')
+    args = parser.parse_args(args_in)
+    with open(args.schema, 'r', encoding='utf-8') as f:
+        validator = ResponseValidator(lambda: json.load(f))
+        sys.stdout.write(validator.source)
+
+if __name__ == '__main__':
+    main()
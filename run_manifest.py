@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import hashlib
+from typing import Optional, Tuple
+
+def content_hash(article_text: str) -> str:
+    """
+    SHA-256 текста статьи — ключ, по которому статья считается уже обработанной.
+    """
+    return hashlib.sha256(article_text.encode('utf-8')).hexdigest()
+
+def _file_size(path: Optional[str]) -> int:
+    return os.path.getsize(path) if path and os.path.exists(path) else 0
+
+class RunManifest:
+    """
+    Манифест прогона для возобновления после сбоя (JSONL, только дозапись).
+
+    Первая строка — заголовок с путями выходных файлов и их размерами на момент
+    создания манифеста, далее по строке на статью: article_id, хэш содержимого,
+    статус ('done' / 'failed'), число узлов и ребер и диапазоны байтов,
+    дозаписанные статьёй в nodes/edges. Каждая запись сбрасывается на диск
+    (fsync) только после того, как строки статьи целиком записаны в TSV.
+
+    При открытии существующего манифеста TSV-файлы обрезаются до последнего
+    подтверждённого размера: так отбрасываются строки статьи, запись которой
+    прервалась, а уже обработанные статьи пропускаются по хэшу.
+    """
+
+    def __init__(self, path: str, nodes_filepath: Optional[str] = None, edges_filepath: Optional[str] = None):
+        self.path = path
+        self.nodes_filepath = nodes_filepath
+        self.edges_filepath = edges_filepath
+        self.completed = set()
+        self.resumed_done = 0
+        self.resumed_failed = 0
+        self._committed = {'nodes': None, 'edges': None}
+        self._load()
+        self._file = open(path, 'a', encoding='utf-8')
+        if self._needs_newline:
+            self._file.write('\n')
+        if self._committed['nodes'] is None:
+            self._committed = {'nodes': _file_size(nodes_filepath), 'edges': _file_size(edges_filepath)}
+            self._append({
+                'header': True,
+                'nodes_file': nodes_filepath,
+                'edges_file': edges_filepath,
+                'nodes_size': self._committed['nodes'],
+                'edges_size': self._committed['edges'],
+                'created_at': time.time(),
+            })
+        else:
+            self._rollback_partial_writes()
+
+    def _load(self):
+        self._needs_newline = False
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        self._needs_newline = bool(content) and not content.endswith('\n')
+        for line in content.splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Недописанная последняя строка после сбоя
+                continue
+            if record.get('header'):
+                if (record.get('nodes_file'), record.get('edges_file')) != (self.nodes_filepath, self.edges_filepath):
+                    print(f"Предупреждение: манифест {self.path} создан для файлов "
+                          f"{record.get('nodes_file')}/{record.get('edges_file')}")
+                self._committed = {'nodes': record.get('nodes_size', 0), 'edges': record.get('edges_size', 0)}
+            elif record.get('status') == 'done':
+                self.completed.add(record['sha256'])
+                self.resumed_done += 1
+                for name in ('nodes', 'edges'):
+                    span = record.get(f'{name}_span')
+                    if span and self._committed[name] is not None:
+                        self._committed[name] = max(self._committed[name], span[1])
+            elif record.get('status') == 'failed':
+                self.resumed_failed += 1
+
+    def _rollback_partial_writes(self):
+        """
+        Обрезает TSV до последнего подтверждённого манифестом размера.
+        """
+        for name, path in (('nodes', self.nodes_filepath), ('edges', self.edges_filepath)):
+            committed = self._committed[name]
+            size = _file_size(path)
+            if path and size > committed:
+                with open(path, 'r+b') as f:
+                    f.truncate(committed)
+                print(f"Откат незавершённой записи: {path} обрезан с {size} до {committed} байт")
+        print(f"Возобновление по манифесту {self.path}: уже обработано {len(self.completed)} статей")
+
+    def _append(self, record: dict):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def is_done(self, article_text: str) -> bool:
+        return content_hash(article_text) in self.completed
+
+    def record_done(self, article_id: str, article_text: str, nodes: int = 0, edges: int = 0,
+                    nodes_span: Optional[Tuple[int, int]] = None, edges_span: Optional[Tuple[int, int]] = None):
+        """
+        Фиксирует успешно записанную статью; вызывать после записи её строк на диск.
+        """
+        sha = content_hash(article_text)
+        self._append({
+            'article_id': article_id,
+            'sha256': sha,
+            'status': 'done',
+            'nodes': nodes,
+            'edges': edges,
+            'nodes_span': list(nodes_span) if nodes_span else None,
+            'edges_span': list(edges_span) if edges_span else None,
+            'ts': time.time(),
+        })
+        self.completed.add(sha)
+        for name, span in (('nodes', nodes_span), ('edges', edges_span)):
+            if span:
+                self._committed[name] = max(self._committed[name], span[1])
+
+    def record_failed(self, article_id: str, article_text: str, error: str = ''):
+        """
+        Фиксирует неудачную статью: при возобновлении она будет обработана снова.
+        """
+        self._append({
+            'article_id': article_id,
+            'sha256': content_hash(article_text),
+            'status': 'failed',
+            'error': error,
+            'ts': time.time(),
+        })
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Производная схема ответа экстрактора с перечислениями категорий и предикатов.
+
+Категории и предикаты, которых нет в таблицах соответствия HALD, сейчас
+обнаруживаются только после конвертации (unmapped_types /
+unmapped_relationships в HALD/convert_json_to_biolink.py), а ответы модели
+с Biolink не сверяются. Скрипт собирает целевые термины из
+HALD/to_biolink_entity.csv и HALD/to_biolink_relationship.csv и, если
+указан, из списка терминов (по одному в строке, # — комментарий; классы
+пишутся с заглавной буквы, предикаты — в snake_case, термин без префикса
+считается biolink:) и записывает копию main_extractor_shema.json с enum
+на category узла и predicate ребра.
+
+Если указать полученный файл в EXTRACTOR_SCHEMA_PATH, грамматика не даст
+модели выдать другие значения, а response_validator отбросит их и в
+ответах, полученных без грамматики. Пересборка после изменения таблиц:
+
+    python schema_enums.py --terms biolink_terms.txt
+"""
+import os
+import csv
+import sys
+import copy
+import json
+import argparse
+from typing import Iterable, List, Tuple
+
+from response_validator import item_schema
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+HALD_DIR = os.path.join(REPO_DIR, 'HALD')
+ENTITY_MAPPING_PATH = os.path.join(HALD_DIR, 'to_biolink_entity.csv')
+RELATIONSHIP_MAPPING_PATH = os.path.join(HALD_DIR, 'to_biolink_relationship.csv')
+BASE_SCHEMA_PATH = os.path.join(REPO_DIR, 'prompts_and_shemes', 'main_extractor_shema.json')
+ENUM_SCHEMA_PATH = os.path.join(REPO_DIR, 'prompts_and_shemes', 'main_extractor_shema.enums.json')
+
+DEFAULT_PREFIX = 'biolink'
+
+# Поля, на которые ставятся перечисления: путь к массиву элементов и имя свойства
+CATEGORY_FIELD = (('graph', 'nodes'), 'category')
+PREDICATE_FIELD = (('graph', 'edges'), 'predicate')
+
+def read_mapping_targets(path: str) -> List[str]:
+    """
+    Термины Biolink из таблицы соответствия HALD (последняя колонка, разделитель ';'), без повторов.
+    """
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        rows = list(csv.reader(f, delimiter=';'))
+    targets = (row[-1].strip() for row in rows[1:] if row)
+    return list(dict.fromkeys(term for term in targets if term))
+
+def normalize_term(term: str) -> str:
+    return term if ':' in term else f'{DEFAULT_PREFIX}:{term}'
+
+def is_class_term(term: str) -> bool:
+    # Классы Biolink — CamelCase (biolink:Gene), предикаты — snake_case (biolink:treats)
+    local_name = term.split(':', 1)[-1]
+    return local_name[:1].isupper()
+
+def read_term_list(path: str) -> Tuple[List[str], List[str]]:
+    """
+    Категории и предикаты из списка терминов: первое слово каждой непустой строки.
+    """
+    categories, predicates = [], []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            term = normalize_term(line.split()[0])
+            (categories if is_class_term(term) else predicates).append(term)
+    return categories, predicates
+
+def with_enums(schema: dict, categories: Iterable[str], predicates: Iterable[str]) -> dict:
+    """
+    Копия схемы с enum на category узла и predicate ребра.
+    """
+    result = copy.deepcopy(schema)
+    for (path, field), values in ((CATEGORY_FIELD, categories), (PREDICATE_FIELD, predicates)):
+        values = list(dict.fromkeys(values))
+        items = item_schema(result, path)
+        properties = items.get('properties') if items is not None else None
+        if not isinstance(properties, dict) or field not in properties:
+            raise ValueError(f"В схеме нет поля {'.'.join(path)}[].{field}")
+        if not values:
+            raise ValueError(f"Пустой список значений для {'.'.join(path)}[].{field}")
+        properties[field] = {**properties[field], 'enum': values}
+    return result
+
+def build_enum_schema(schema_path: str = BASE_SCHEMA_PATH, entity_csv: str = ENTITY_MAPPING_PATH,
+                      relationship_csv: str = RELATIONSHIP_MAPPING_PATH, terms_path: str = None) -> dict:
+    with open(schema_path, 'r', encoding='utf-8') as f:
+        schema = json.load(f)
+    categories = read_mapping_targets(entity_csv)
+    predicates = read_mapping_targets(relationship_csv)
+    if terms_path:
+        extra_categories, extra_predicates = read_term_list(terms_path)
+        categories += extra_categories
+        predicates += extra_predicates
+    return with_enums(schema, categories, predicates)
+
+def main(args_in = None):
+    parser = argparse.ArgumentParser(
+        description='Строит схему ответа экстрактора с enum категорий узлов и предикатов рёбер '
+                    'по таблицам соответствия HALD и списку терминов Biolink.')
+    parser.add_argument('--schema', default=BASE_SCHEMA_PATH, help='Исходная схема (по умолчанию: %(default)s)')
+    parser.add_argument('--entity-csv', default=ENTITY_MAPPING_PATH, help='Таблица типов сущностей (по умолчанию: %(default)s)')
+    parser.add_argument('--relationship-csv', default=RELATIONSHIP_MAPPING_PATH,
+                        help='Таблица отношений (по умолчанию: %(default)s)')
+    parser.add_argument('--terms', default=None,
+                        help='Необязательный список терминов Biolink (и других онтологий, например LECO:) по одному в строке')
+    parser.add_argument('--output', default=ENUM_SCHEMA_PATH, help='Куда записать схему (по умолчанию: %(default)s)')
+    args = parser.parse_args(args_in)
+
+    try:
+        schema = build_enum_schema(args.schema, args.entity_csv, args.relationship_csv, args.terms)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    text = json.dumps(schema, ensure_ascii=False, indent=2) + '\n'
+    if args.output == '-':
+        sys.stdout.write(text)
+        return
+    tmp_path = f'{args.output}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, args.output)
+    for (path, field), label in ((CATEGORY_FIELD, 'Категорий'), (PREDICATE_FIELD, 'Предикатов')):
+        print(f"{label}: {len(item_schema(schema, path)['properties'][field]['enum'])}")
+    print(f"Схема записана в {args.output}; чтобы грамматика её использовала, укажите EXTRACTOR_SCHEMA_PATH={args.output}")
+
+if __name__ == '__main__':
+    main()
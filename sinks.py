@@ -0,0 +1,298 @@
+"""
+Выходные форматы таблиц узлов и ребер, общие для extractor (KGXWriter,
+выгрузка graph_store) и HALD/convert_json_to_biolink.py.
+
+Формат выбирается по расширению файла (или явно строкой того же вида):
+
+    nodes.tsv          TSV без сжатия (как раньше)
+    nodes.tsv.gz       TSV в gzip
+    nodes.tsv.zst      TSV в zstd (нужен пакет zstandard)
+    nodes.jsonl[.gz]   KGX JSON Lines: объект на строку, типизированные значения
+    nodes.parquet      Parquet с типизированными колонками и группами строк
+                       по PARQUET_ROW_GROUP_SIZE (нужен pyarrow)
+
+Неизвестное расширение означает TSV. Типы колонок (COLUMN_TYPES: 'str',
+'float', 'list') используются в JSON Lines и Parquet; в TSV значения пишутся
+как есть, списки — через '|'.
+
+Сжатые TSV и JSON Lines можно дозаписывать: каждая дозапись добавляет
+отдельный член gzip или кадр zstd, а такие файлы читаются как один поток.
+Parquet дозаписывать нельзя — файл пишется целиком за один проход.
+"""
+import io
+import os
+import csv
+import gzip
+import json
+import threading
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+# Сериализация и сжатие по расширению файла
+SERIALIZATIONS = {'.tsv': 'tsv', '.jsonl': 'jsonl', '.parquet': 'parquet'}
+COMPRESSIONS = {'.gz': 'gzip', '.zst': 'zstd'}
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Строк в одной группе Parquet (и в буфере перед её записью)
+PARQUET_ROW_GROUP_SIZE = 100000
+
+# Типы колонок для JSON Lines и Parquet
+COLUMN_TYPES = ('str', 'float', 'list')
+
+def parse_format(filepath: str, output_format: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """
+    (сериализация, сжатие) по строке формата ('tsv', 'tsv.gz', 'jsonl.zst', 'parquet')
+    или, если она не задана, по расширению файла.
+    """
+    name = f'output.{output_format}' if output_format else filepath
+    root, ext = os.path.splitext(name.lower())
+    compression = COMPRESSIONS.get(ext)
+    if compression:
+        root, ext = os.path.splitext(root)
+    serialization = SERIALIZATIONS.get(ext, 'tsv')
+    if serialization == 'parquet' and compression:
+        raise ValueError("Parquet сжимается внутри файла, внешнее сжатие (.gz/.zst) не поддерживается")
+    return serialization, compression
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError("Для файлов .zst нужен пакет zstandard (pip install zstandard)") from e
+    return zstandard
+
+def open_text(filepath: str, mode: str, compression: Optional[str] = None):
+    """
+    Открывает текстовый файл ('r', 'w' или 'a') с учётом сжатия, в UTF-8 без преобразования переводов строк.
+    """
+    if compression == 'gzip':
+        return gzip.open(filepath, mode + 't', compresslevel=GZIP_LEVEL, encoding='utf-8', newline='')
+    if compression == 'zstd':
+        zstandard = _zstandard()
+        return zstandard.open(filepath, mode + 't', cctx=zstandard.ZstdCompressor(level=ZSTD_LEVEL),
+                              encoding='utf-8', newline='')
+    return open(filepath, mode, encoding='utf-8', newline='')
+
+def compress_block(data: bytes, compression: Optional[str] = None) -> bytes:
+    """
+    Сжимает блок для дозаписи одним куском: отдельный член gzip или кадр zstd.
+    """
+    if not data or compression is None:
+        return data
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=GZIP_LEVEL)
+    return _zstandard().ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+def typed_value(value: Any, column_type: str) -> Any:
+    """
+    Значение колонки в типе для JSON Lines/Parquet; пустые значения — None (для списков — []).
+    """
+    if column_type == 'float':
+        if value in (None, ''):
+            return None
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    if column_type == 'list':
+        if isinstance(value, (list, tuple)):
+            return [str(item) for item in value]
+        return [item for item in str(value).split('|') if item] if value not in (None, '') else []
+    return None if value is None else str(value)
+
+class RowSink:
+    """
+    Приёмник строк таблицы: значения в порядке columns.
+    """
+
+    def __init__(self, columns: Sequence[str], types: Optional[Dict[str, str]] = None):
+        self.columns = list(columns)
+        self.types = [(types or {}).get(column, 'str') for column in self.columns]
+        self.rows_written = 0
+
+    @property
+    def accepts_text(self) -> bool:
+        """
+        Можно ли передавать готовые строки TSV в write_text.
+        """
+        return False
+
+    def write(self, values: Sequence[Any]):
+        raise NotImplementedError
+
+    def write_many(self, rows: Iterable[Sequence[Any]]):
+        for values in rows:
+            self.write(values)
+
+    def write_text(self, text: str, rows: int):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class TextSink(RowSink):
+    """
+    TSV или KGX JSON Lines в текстовый поток (файл, сжатый файл или StringIO).
+    """
+
+    def __init__(self, stream, columns: Sequence[str], serialization: str = 'tsv',
+                 types: Optional[Dict[str, str]] = None, header: bool = True, lineterminator: str = '\r\n'):
+        super().__init__(columns, types)
+        self.stream = stream
+        self.serialization = serialization
+        if serialization == 'tsv':
+            self._writer = csv.writer(stream, delimiter='\t', lineterminator=lineterminator)
+            if header:
+                self._writer.writerow(self.columns)
+
+    @property
+    def accepts_text(self) -> bool:
+        return self.serialization == 'tsv'
+
+    def _json_line(self, values: Sequence[Any]) -> str:
+        return json.dumps({column: typed_value(value, column_type)
+                           for column, column_type, value in zip(self.columns, self.types, values)},
+                          ensure_ascii=False) + '\n'
+
+    def write(self, values: Sequence[Any]):
+        if self.serialization == 'tsv':
+            self._writer.writerow(values)
+        else:
+            self.stream.write(self._json_line(values))
+        self.rows_written += 1
+
+    def write_many(self, rows: Iterable[Sequence[Any]]):
+        if self.serialization == 'tsv':
+            rows = rows if isinstance(rows, list) else list(rows)
+            self._writer.writerows(rows)
+            self.rows_written += len(rows)
+        else:
+            super().write_many(rows)
+
+    def write_text(self, text: str, rows: int):
+        """
+        Пишет готовый текст TSV из rows строк (поля не должны требовать экранирования).
+        """
+        if not self.accepts_text:
+            raise ValueError(f"Готовый TSV нельзя записать в {self.serialization}")
+        self.stream.write(text)
+        self.rows_written += rows
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.stream.close()
+
+class ParquetSink(RowSink):
+    """
+    Parquet с типизированными колонками; строки копятся и пишутся группами по row_group_size.
+    """
+
+    def __init__(self, filepath: str, columns: Sequence[str], types: Optional[Dict[str, str]] = None,
+                 row_group_size: int = PARQUET_ROW_GROUP_SIZE):
+        super().__init__(columns, types)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise RuntimeError("Для файлов .parquet нужен пакет pyarrow (pip install pyarrow)") from e
+        self._pa = pyarrow
+        arrow_types = {'str': pyarrow.string(), 'float': pyarrow.float64(), 'list': pyarrow.list_(pyarrow.string())}
+        self.schema = pyarrow.schema([(column, arrow_types[column_type])
+                                      for column, column_type in zip(self.columns, self.types)])
+        self.row_group_size = row_group_size
+        self._writer = pyarrow.parquet.ParquetWriter(filepath, self.schema, compression='zstd')
+        self._rows = []
+
+    def write(self, values: Sequence[Any]):
+        self._rows.append(values)
+        if len(self._rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        columns = [[typed_value(values[i], column_type) for values in self._rows]
+                   for i, column_type in enumerate(self.types)]
+        self._writer.write_table(self._pa.Table.from_arrays(columns, schema=self.schema),
+                                 row_group_size=self.row_group_size)
+        self.rows_written += len(self._rows)
+        self._rows = []
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+def _is_empty(filepath: str) -> bool:
+    return not os.path.exists(filepath) or os.path.getsize(filepath) == 0
+
+def open_sink(filepath: str, columns: Sequence[str], types: Optional[Dict[str, str]] = None,
+              append: bool = False, output_format: Optional[str] = None, header: bool = True,
+              lineterminator: str = '\r\n') -> RowSink:
+    """
+    Открывает приёмник строк в формате по расширению filepath (или output_format).
+    При append заголовок TSV пишется, только если файл пуст.
+    """
+    serialization, compression = parse_format(filepath, output_format)
+    if serialization == 'parquet':
+        if append and not _is_empty(filepath):
+            raise ValueError(f"Parquet не поддерживает дозапись: {filepath} уже существует")
+        return ParquetSink(filepath, columns, types)
+    write_header = header and (not append or _is_empty(filepath))
+    stream = open_text(filepath, 'a' if append else 'w', compression)
+    return TextSink(stream, columns, serialization, types, write_header, lineterminator)
+
+# Дозаписи блоков (BlockSink.commit) выполняются по одной: заголовок TSV пишется
+# по размеру файла в момент дозаписи, а не при создании приёмника
+_BLOCK_APPEND_LOCK = threading.Lock()
+
+class BlockSink(TextSink):
+    """
+    Строки копятся в памяти и дозаписываются в файл одним блоком с fsync (commit).
+    Для сжатых форматов блок — отдельный член gzip или кадр zstd, поэтому
+    файл можно обрезать по границе блока (run_manifest).
+
+    Заголовок TSV решается в commit: параллельные статьи создают приёмники до того,
+    как кто-либо из них записал файл, и иначе каждая дописала бы свой заголовок.
+    Заголовок пишется отдельным блоком перед первым и в диапазон байтов не входит.
+    """
+
+    def __init__(self, filepath: str, columns: Sequence[str], types: Optional[Dict[str, str]] = None,
+                 output_format: Optional[str] = None, lineterminator: str = '\r\n'):
+        serialization, self.compression = parse_format(filepath, output_format)
+        if serialization == 'parquet':
+            raise ValueError(f"Parquet не поддерживает дозапись блоками: {filepath}")
+        self.filepath = filepath
+        self.lineterminator = lineterminator
+        super().__init__(io.StringIO(), columns, serialization, types, header=False, lineterminator=lineterminator)
+
+    def _header_block(self) -> bytes:
+        header = io.StringIO()
+        csv.writer(header, delimiter='\t', lineterminator=self.lineterminator).writerow(self.columns)
+        return compress_block(header.getvalue().encode('utf-8'), self.compression)
+
+    def commit(self) -> Tuple[int, int]:
+        """
+        Дозаписывает накопленный блок и сбрасывает его на диск.
+        Возвращает диапазон байтов (начало, конец) в файле.
+        """
+        data = compress_block(self.stream.getvalue().encode('utf-8'), self.compression)
+        with _BLOCK_APPEND_LOCK, open(self.filepath, 'ab') as f:
+            if self.serialization == 'tsv' and f.tell() == 0:
+                f.write(self._header_block())
+            start = f.tell()
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            return start, f.tell()
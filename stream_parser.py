@@ -0,0 +1,214 @@
+import re
+import json
+from typing import Dict, List, Optional, Tuple
+
+OPEN_TAG = "<thinking>"
+CLOSE_TAG = "</thinking>"
+
+# Пути массивов в ответе модели, элементы которых выдаются по мере готовности
+DEFAULT_ITEM_PATHS = {
+    ('graph', 'nodes'): 'node',
+    ('graph', 'edges'): 'edge',
+    ('graph', 'clarifications'): 'clarification',
+}
+
+STRUCT_RE = re.compile(r'["{}\[\]:,]')
+STRING_RE = re.compile(r'["\\]')
+
+class GraphStreamParser:
+    """
+    Инкрементальный разбор ответа модели вида <thinking>...</thinking>{json}.
+
+    Блок <thinking> пропускается (считается только его длина), а в JSON
+    отслеживается путь текущего контейнера: как только закрывается очередной
+    объект массива graph.nodes / graph.edges / graph.clarifications, он
+    разбирается json.loads и возвращается из feed(). В памяти хранится только
+    текст текущего элемента, а не весь ответ.
+
+    Использование:
+        parser = GraphStreamParser()
+        for text in stream:
+            for kind, item in parser.feed(text):
+                ...
+    """
+
+    def __init__(self, item_paths: Optional[Dict[Tuple[str, ...], str]] = None):
+        self._item_paths = item_paths or DEFAULT_ITEM_PATHS
+        self._pending = ''
+        self._in_json = False
+        self._in_thinking = None
+        self.had_thinking = False
+        self.thinking_chars = 0
+        self.json_chars = 0
+        self.done = False
+
+        self._stack: List[str] = []
+        self._keys: List[Optional[str]] = []
+        self._current_key = None
+        self._last_string = None
+        self._in_string = False
+        self._escape = False
+        self._record_string = False
+        self._string_parts: List[str] = []
+        self._capture: Optional[List[str]] = None
+        self._capture_depth = 0
+        self._capture_kind = None
+
+    def feed(self, text: str) -> List[Tuple[str, dict]]:
+        """
+        Принимает очередной фрагмент ответа модели.
+
+        :return: Список пар (тип, объект) для элементов, завершённых в этом фрагменте;
+                 тип — 'node', 'edge' или 'clarification'.
+        """
+        if self.done or not text:
+            return []
+        if not self._in_json:
+            self._pending += text
+            start = self._find_json_start()
+            if start is None:
+                return []
+            text = self._pending[start:]
+            self._pending = ''
+            self._in_json = True
+        return self._scan(text)
+
+    def _find_json_start(self) -> Optional[int]:
+        """
+        Ищет начало JSON в накопленном тексте, пропуская блок <thinking>.
+        Возвращает индекс '{' в self._pending или None, если JSON ещё не начался.
+        """
+        if self._in_thinking is None:
+            stripped = self._pending.lstrip()
+            if not stripped:
+                return None
+            if stripped.startswith(OPEN_TAG):
+                self._in_thinking = True
+                self.had_thinking = True
+                self._pending = stripped[len(OPEN_TAG):]
+            elif OPEN_TAG.startswith(stripped):
+                # Тег пришёл не целиком — ждём следующий фрагмент
+                return None
+            else:
+                self._in_thinking = False
+
+        if self._in_thinking:
+            end = self._pending.find(CLOSE_TAG)
+            if end == -1:
+                # Храним только хвост, в котором может начинаться закрывающий тег
+                keep = len(CLOSE_TAG) - 1
+                if len(self._pending) > keep:
+                    self.thinking_chars += len(self._pending) - keep
+                    self._pending = self._pending[-keep:]
+                return None
+            self.thinking_chars += end
+            self._pending = self._pending[end + len(CLOSE_TAG):]
+            self._in_thinking = False
+
+        start = self._pending.find('{')
+        if start == -1:
+            self._pending = ''
+            return None
+        return start
+
+    def _item_kind(self) -> Optional[str]:
+        if not self._stack or self._stack[-1] != '[':
+            return None
+        return self._item_paths.get(tuple(self._keys[1:]))
+
+    def _scan(self, text: str) -> List[Tuple[str, dict]]:
+        items = []
+        pos = 0
+        length = len(text)
+        capture_from = 0 if self._capture is not None else None
+
+        while pos < length:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    if self._record_string:
+                        self._string_parts.append(text[pos])
+                    pos += 1
+                    continue
+                m = STRING_RE.search(text, pos)
+                if m is None:
+                    if self._record_string:
+                        self._string_parts.append(text[pos:])
+                    pos = length
+                    break
+                i = m.start()
+                if self._record_string:
+                    self._string_parts.append(text[pos:i + 1] if text[i] == '\\' else text[pos:i])
+                pos = i + 1
+                if text[i] == '\\':
+                    self._escape = True
+                else:
+                    self._in_string = False
+                    if self._record_string:
+                        self._last_string = json.loads('"' + ''.join(self._string_parts) + '"')
+                continue
+
+            m = STRUCT_RE.search(text, pos)
+            if m is None:
+                pos = length
+                break
+            i = m.start()
+            ch = text[i]
+            pos = i + 1
+
+            if ch == '"':
+                self._in_string = True
+                # Значения внутри захватываемого элемента отдельно не нужны
+                self._record_string = self._capture is None
+                self._string_parts = []
+            elif ch in '{[':
+                if self._capture is None and ch == '{':
+                    kind = self._item_kind()
+                    if kind is not None:
+                        self._capture = []
+                        self._capture_kind = kind
+                        self._capture_depth = len(self._stack)
+                        capture_from = i
+                self._stack.append(ch)
+                self._keys.append(self._current_key)
+                self._current_key = None
+            elif ch in '}]':
+                if self._stack:
+                    self._stack.pop()
+                    self._keys.pop()
+                self._current_key = None
+                if self._capture is not None and len(self._stack) == self._capture_depth:
+                    self._capture.append(text[capture_from:i + 1])
+                    try:
+                        items.append((self._capture_kind, json.loads(''.join(self._capture))))
+                    except json.JSONDecodeError as e:
+                        print(f"\nОшибка декодирования элемента {self._capture_kind}: {e}")
+                    self._capture = None
+                    capture_from = None
+                if not self._stack:
+                    self.done = True
+                    self.json_chars += pos
+                    return items
+            elif ch == ':':
+                self._current_key = self._last_string
+            elif ch == ',':
+                self._current_key = None
+
+        if self._capture is not None:
+            self._capture.append(text[capture_from:])
+        self.json_chars += length
+        return items
+
+    @property
+    def json_started(self) -> bool:
+        """
+        True, если блок <thinking> закончился и начался JSON.
+        """
+        return self._in_json
+
+    @property
+    def complete(self) -> bool:
+        """
+        True, если JSON ответа был получен целиком.
+        """
+        return self.done
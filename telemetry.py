@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+from response_fields import response_field
+
+# Стадии обработки статьи, для которых копится время (секунды, сумма по чанкам);
+# thinking — часть decoding до начала JSON (только в потоковом режиме)
+STAGES = ('prompt_assembly', 'http_request', 'ttft', 'decoding', 'thinking', 'json_extraction', 'tsv_write')
+
+# Запись текущей статьи; задачи asyncio и потоки чанков получают копию контекста
+_current_article = contextvars.ContextVar('telemetry_article', default=None)
+
+# Как часто (в секундах) переписывать Prometheus textfile во время прогона
+PROMETHEUS_WRITE_INTERVAL_S = 10.0
+
+class ArticleRecord:
+    """
+    Метрики одной статьи: время стадий, токены, длины частей ответа, число элементов.
+    """
+
+    def __init__(self, article_id):
+        self.article_id = article_id
+        self.started = time.time()
+        self._started_perf = time.perf_counter()
+        self.spans = {}
+        self.requests = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.thinking_chars = 0
+        self.json_chars = 0
+        self.nodes = 0
+        self.edges = 0
+        self.status = 'done'
+        self.error = None
+        self.duration_s = None
+        # Чанки одной статьи в синхронном режиме обрабатываются в разных потоках
+        self._lock = threading.Lock()
+
+    def add_span(self, name, seconds):
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def finish(self):
+        self.duration_s = time.perf_counter() - self._started_perf
+
+    @property
+    def thinking_tokens(self) -> int:
+        # usage не делит completion на части: токены блока <thinking> оцениваются по доле его длины
+        chars = self.thinking_chars + self.json_chars
+        return round(self.completion_tokens * self.thinking_chars / chars) if chars else 0
+
+    @property
+    def json_tokens(self) -> int:
+        return self.completion_tokens - self.thinking_tokens
+
+    def to_dict(self):
+        return {
+            'article_id': self.article_id,
+            'status': self.status,
+            'error': self.error,
+            'started_at': round(self.started, 3),
+            'duration_ms': round(self.duration_s * 1000, 1),
+            'spans_ms': {name: round(seconds * 1000, 1) for name, seconds in self.spans.items()},
+            'requests': self.requests,
+            'cache_hits': self.cache_hits,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'thinking_chars': self.thinking_chars,
+            'json_chars': self.json_chars,
+            'thinking_tokens': self.thinking_tokens,
+            'json_tokens': self.json_tokens,
+            'thinking_share': round(self.thinking_tokens / self.completion_tokens, 3) if self.completion_tokens else None,
+            'nodes': self.nodes,
+            'edges': self.edges,
+        }
+
+class Telemetry:
+    """
+    Телеметрия прогона: время стадий, токены и размер графа по каждой статье.
+
+    Обработка статьи оборачивается в article(article_id); внутри неё
+    span(name) / add_span() добавляют время стадии к записи текущей статьи
+    (запись передаётся через contextvars, поэтому работает и для задач
+    asyncio, и для потоков чанков). Вне article() все вызовы ничего не делают.
+
+    Завершённые записи дозаписываются построчно в JSONL (path), агрегаты
+    по прогону — в Prometheus textfile (prometheus_path) для node_exporter:
+    файл переписывается атомарно не чаще раза в PROMETHEUS_WRITE_INTERVAL_S
+    и при close().
+    """
+
+    def __init__(self, path: Optional[str] = None, prometheus_path: Optional[str] = None):
+        self.path = path
+        self.prometheus_path = prometheus_path
+        self._file = None
+        self._lock = threading.Lock()
+        self._last_prometheus_write = 0.0
+        self.articles = {'done': 0, 'failed': 0}
+        self.stage_seconds = {}
+        self.stage_counts = {}
+        self.duration_seconds = 0.0
+        self.totals = {'requests': 0, 'cache_hits': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                       'thinking_chars': 0, 'json_chars': 0, 'thinking_tokens': 0, 'json_tokens': 0,
+                       'nodes': 0, 'edges': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path or self.prometheus_path)
+
+    @staticmethod
+    def current() -> Optional[ArticleRecord]:
+        return _current_article.get()
+
+    @contextmanager
+    def article(self, article_id):
+        """
+        Контекст обработки одной статьи. Исключение внутри помечает статью как неудачную.
+        """
+        if not self.enabled:
+            yield None
+            return
+        record = ArticleRecord(article_id)
+        token = _current_article.set(record)
+        try:
+            yield record
+        except BaseException as e:
+            record.status = 'failed'
+            record.error = str(e)
+            raise
+        finally:
+            _current_article.reset(token)
+            record.finish()
+            self._finish(record)
+
+    @contextmanager
+    def span(self, name):
+        record = _current_article.get()
+        if record is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            record.add_span(name, time.perf_counter() - started)
+
+    def add_span(self, name, seconds):
+        record = _current_article.get()
+        if record is not None:
+            record.add_span(name, seconds)
+
+    def set_failed(self, error=''):
+        record = _current_article.get()
+        if record is not None:
+            record.status = 'failed'
+            record.error = error or record.error
+
+    def record_response(self, response):
+        """
+        Учитывает usage ответа (или последнего чанка потока) текущей статьи.
+        """
+        record = _current_article.get()
+        if record is None:
+            return
+        usage = response_field(response, 'usage')
+        with record._lock:
+            record.requests += 1
+            record.prompt_tokens += response_field(usage, 'prompt_tokens') or 0
+            record.completion_tokens += response_field(usage, 'completion_tokens') or 0
+
+    def record_content(self, thinking_chars, json_chars, cache_hit=False):
+        """
+        Учитывает длины частей ответа модели: блока <thinking> и JSON.
+        """
+        record = _current_article.get()
+        if record is None:
+            return
+        with record._lock:
+            record.thinking_chars += thinking_chars
+            record.json_chars += json_chars
+            if cache_hit:
+                record.requests += 1
+                record.cache_hits += 1
+
+    def record_items(self, nodes, edges):
+        record = _current_article.get()
+        if record is None:
+            return
+        with record._lock:
+            record.nodes += nodes
+            record.edges += edges
+
+    def _finish(self, record):
+        with self._lock:
+            self.articles[record.status] = self.articles.get(record.status, 0) + 1
+            self.duration_seconds += record.duration_s
+            for name, seconds in record.spans.items():
+                self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+                self.stage_counts[name] = self.stage_counts.get(name, 0) + 1
+            for name in self.totals:
+                self.totals[name] += getattr(record, name)
+
+            if self.path:
+                if self._file is None:
+                    self._file = open(self.path, 'a', encoding='utf-8')
+                self._file.write(json.dumps(record.to_dict(), ensure_ascii=False) + '\n')
+                self._file.flush()
+
+            now = time.monotonic()
+            if self.prometheus_path and now - self._last_prometheus_write >= PROMETHEUS_WRITE_INTERVAL_S:
+                self._write_prometheus()
+                self._last_prometheus_write = now
+
+    def _write_prometheus(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+        metric('kg_extractor_articles_total', 'counter', 'Processed articles by status.',
+               [({'status': status}, count) for status, count in sorted(self.articles.items())])
+        metric('kg_extractor_article_duration_seconds_total', 'counter', 'Total article processing time.',
+               [({}, round(self.duration_seconds, 6))])
+        metric('kg_extractor_stage_duration_seconds_total', 'counter', 'Total time spent per pipeline stage.',
+               [({'stage': name}, round(self.stage_seconds[name], 6)) for name in sorted(self.stage_seconds)])
+        metric('kg_extractor_stage_articles_total', 'counter', 'Articles that went through a pipeline stage.',
+               [({'stage': name}, self.stage_counts[name]) for name in sorted(self.stage_counts)])
+        metric('kg_extractor_requests_total', 'counter', 'LLM requests including response cache hits.',
+               [({'cache': 'miss'}, self.totals['requests'] - self.totals['cache_hits']),
+                ({'cache': 'hit'}, self.totals['cache_hits'])])
+        metric('kg_extractor_tokens_total', 'counter', 'Tokens reported in chat completion usage.',
+               [({'kind': 'prompt'}, self.totals['prompt_tokens']),
+                ({'kind': 'completion'}, self.totals['completion_tokens'])])
+        metric('kg_extractor_response_chars_total', 'counter', 'Response length by section.',
+               [({'section': 'thinking'}, self.totals['thinking_chars']),
+                ({'section': 'json'}, self.totals['json_chars'])])
+        metric('kg_extractor_completion_tokens_by_section_total', 'counter',
+               'Completion tokens by response section, estimated from section lengths.',
+               [({'section': 'thinking'}, self.totals['thinking_tokens']),
+                ({'section': 'json'}, self.totals['json_tokens'])])
+        metric('kg_extractor_graph_items_total', 'counter', 'Graph items written.',
+               [({'kind': 'node'}, self.totals['nodes']), ({'kind': 'edge'}, self.totals['edges'])])
+
+        # node_exporter читает файл целиком, поэтому подменяем его атомарно
+        tmp_path = f'{self.prometheus_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.prometheus_path)
+
+    def stats(self) -> dict:
+        articles = sum(self.articles.values())
+        return {
+            'articles': dict(self.articles),
+            'stage_ms_per_article': {
+                name: round(self.stage_seconds[name] / self.stage_counts[name] * 1000, 1)
+                for name in STAGES if name in self.stage_seconds
+            },
+            'prompt_tokens': self.totals['prompt_tokens'],
+            'completion_tokens': self.totals['completion_tokens'],
+            'thinking_share': round(self.totals['thinking_chars']
+                                    / max(1, self.totals['thinking_chars'] + self.totals['json_chars']), 3),
+            'thinking_token_share': round(self.totals['thinking_tokens']
+                                          / max(1, self.totals['completion_tokens']), 3),
+            'thinking_tokens_per_article': round(self.totals['thinking_tokens'] / articles, 1) if articles else 0.0,
+            'nodes_per_article': round(self.totals['nodes'] / articles, 1) if articles else 0.0,
+            'edges_per_article': round(self.totals['edges'] / articles, 1) if articles else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            if self.prometheus_path:
+                self._write_prometheus()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def split_response_lengths(response_content):
+    """
+    Длины блока <thinking> и JSON в ответе модели (в символах).
+    """
+    closing_tag = "</thinking>"
+    end = response_content.rfind(closing_tag)
+    if end == -1:
+        return 0, len(response_content)
+    start = response_content.find("<thinking>")
+    thinking_start = start + len("<thinking>") if start != -1 and start < end else 0
+    return end - thinking_start, len(response_content[end + len(closing_tag):].strip())
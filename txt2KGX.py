@@ -1,7 +1,21 @@
 import json
+import asyncio
 
 import argparse
-from extractor import Entity_Relationships_Recognition, process_kgx_json
+from config import (
+    MAX_CONCURRENCY, CHUNK_MAX_CHARS, CHUNK_OVERLAP, LLM_MAX_REQUESTS, LLM_MAX_TOKENS, THINKING_MODE, THINKING_MAX_CHARS,
+    COMPACT_OUTPUT
+)
+from chunking import split_article
+from extractor import (
+    Entity_Relationships_Recognition_chunked, Entity_Relationships_Recognition_stream,
+    process_kgx_json, process_kgx_stream, response_cache, prefix_cache, telemetry, response_validator,
+    request_controller, endpoint_pool, set_thinking_policy, set_compact_output, THINKING_MODES
+)
+from batch import is_batch_source, iter_inputs, run_batch
+from graph_store import GraphStore
+from run_manifest import RunManifest
+from sinks import parse_format
 
 
 
@@ -16,14 +30,16 @@ def main():
     parser.add_argument(
         'input_file',
         type=str,
-        help='Путь к входному текстовому файлу (статье).'
+        help='Путь к входному текстовому файлу (статье), директории, glob-шаблону '
+             'или JSONL-манифесту для пакетного режима.'
     )
     # Опциональные аргументы для выходных файлов
     parser.add_argument(
         '--nodes-file', 
         type=str, 
         default='nodes.tsv',
-        help='Имя выходного файла для узлов (по умолчанию: nodes.tsv)'
+        help='Имя выходного файла для узлов (по умолчанию: nodes.tsv); формат по расширению: '
+             '.tsv, .tsv.gz, .tsv.zst, .jsonl (KGX JSON Lines), .parquet (только с --store)'
     )
     parser.add_argument(
         '--edges-file', 
@@ -31,8 +47,207 @@ def main():
         default='edges.tsv',
         help='Имя выходного файла для ребер (по умолчанию: edges.tsv)'
     )
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=MAX_CONCURRENCY,
+        help=f'Максимальное число одновременных запросов к LLM в пакетном режиме (по умолчанию: {MAX_CONCURRENCY}); '
+             'фактическое окно подстраивается под задержку и ответы 429/503 сервера'
+    )
+    parser.add_argument(
+        '--max-requests',
+        type=int,
+        default=LLM_MAX_REQUESTS,
+        help='Бюджет прогона на запросы к LLM с учётом повторов, 0 — без ограничения (по умолчанию: LLM_MAX_REQUESTS)'
+    )
+    parser.add_argument(
+        '--max-tokens',
+        type=int,
+        default=LLM_MAX_TOKENS,
+        help='Бюджет прогона на токены LLM (промпт + ответ по usage), 0 — без ограничения (по умолчанию: LLM_MAX_TOKENS)'
+    )
+    parser.add_argument(
+        '--chunk-size',
+        type=int,
+        default=CHUNK_MAX_CHARS,
+        help=f'Максимальный размер чанка длинной статьи в символах, 0 — не делить (по умолчанию: {CHUNK_MAX_CHARS})'
+    )
+    parser.add_argument(
+        '--chunk-overlap',
+        type=int,
+        default=CHUNK_OVERLAP,
+        help=f'Перекрытие соседних чанков в символах (по умолчанию: {CHUNK_OVERLAP})'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Не использовать кэш ответов LLM (ни чтение, ни запись)'
+    )
+    parser.add_argument(
+        '--cache-path',
+        type=str,
+        default=None,
+        help='Путь к SQLite-файлу кэша ответов LLM (по умолчанию: LLM_CACHE_PATH или .llm_cache.sqlite)'
+    )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Получать ответ модели потоком и дозаписывать узлы и ребра по мере готовности '
+             '(статьи, разбиваемые на чанки, обрабатываются как обычно)'
+    )
+    parser.add_argument(
+        '--prompt-cache',
+        action='store_true',
+        help='Просить llama.cpp переиспользовать KV-кэш системного промпта (cache_prompt) '
+             'и печатать статистику вычисленных/закэшированных токенов промпта'
+    )
+    parser.add_argument(
+        '--slots',
+        type=int,
+        default=None,
+        help='Число слотов сервера llama.cpp для закрепления запросов через id_slot '
+             '(по умолчанию: LLAMA_SLOTS; 0 — слот выбирает сервер)'
+    )
+    parser.add_argument(
+        '--store',
+        type=str,
+        default=None,
+        help='SQLite-хранилище графа с дедупликацией узлов по id и ребер по (subject, predicate, object); '
+             'после прогона --nodes-file/--edges-file перезаписываются выгрузкой из хранилища'
+    )
+    parser.add_argument(
+        '--manifest',
+        type=str,
+        default=None,
+        help='JSONL-манифест прогона: строки каждой статьи пишутся атомарно, при повторном запуске '
+             'обработанные статьи пропускаются, а недописанные строки прерванной статьи отбрасываются'
+    )
+    parser.add_argument(
+        '--telemetry',
+        type=str,
+        default=None,
+        help='JSONL-файл телеметрии: по строке на статью со временем стадий, токенами, '
+             'длиной <thinking> и JSON и числом узлов/ребер (по умолчанию: TELEMETRY_PATH)'
+    )
+    parser.add_argument(
+        '--prometheus',
+        type=str,
+        default=None,
+        help='Prometheus textfile с агрегатами прогона для node_exporter (по умолчанию: TELEMETRY_PROMETHEUS_PATH)'
+    )
+    parser.add_argument(
+        '--no-validate',
+        action='store_true',
+        help='Не проверять узлы и ребра ответа модели по JSON-схеме (по умолчанию: RESPONSE_VALIDATION_DISABLED)'
+    )
+    parser.add_argument(
+        '--quarantine',
+        type=str,
+        default=None,
+        help='JSONL-файл для узлов и ребер, не прошедших проверку по схеме, с ошибками по полям '
+             '(по умолчанию: VALIDATION_QUARANTINE_PATH; без него такие элементы просто отбрасываются)'
+    )
+    parser.add_argument(
+        '--thinking',
+        choices=THINKING_MODES,
+        default=THINKING_MODE,
+        help='Блок рассуждения <thinking> перед JSON: off — без него, bounded — не длиннее '
+             '--thinking-max-chars символов, unbounded — без ограничения (по умолчанию: THINKING_MODE)'
+    )
+    parser.add_argument(
+        '--thinking-max-chars',
+        type=int,
+        default=THINKING_MAX_CHARS,
+        help='Граница длины <thinking> в символах для --thinking bounded; токен — примерно 3–4 символа '
+             '(по умолчанию: THINKING_MAX_CHARS)'
+    )
+    parser.add_argument(
+        '--compact',
+        action='store_true',
+        default=COMPACT_OUTPUT,
+        help='Компактный ответ модели: короткие ключи вместо имён полей и JSON без пробелов; '
+             'ответ разворачивается к исходной схеме до проверки и записи (по умолчанию: COMPACT_OUTPUT)'
+    )
     args = parser.parse_args()
 
+    if not args.store and any(parse_format(path)[0] == 'parquet' for path in (args.nodes_file, args.edges_file)):
+        parser.error("Parquet нельзя дозаписывать по статьям: для выгрузки в .parquet добавьте --store")
+
+    if args.no_cache:
+        response_cache.enabled = False
+    if args.cache_path:
+        response_cache.path = args.cache_path
+    if args.prompt_cache:
+        prefix_cache.enabled = True
+    if args.slots is not None:
+        prefix_cache.set_slots(args.slots)
+    if args.telemetry:
+        telemetry.path = args.telemetry
+    if args.prometheus:
+        telemetry.prometheus_path = args.prometheus
+    request_controller.set_max_limit(max(1, args.concurrency))
+    request_controller.max_requests = args.max_requests
+    request_controller.max_tokens = args.max_tokens
+    try:
+        set_thinking_policy(args.thinking, args.thinking_max_chars)
+    except ValueError as e:
+        parser.error(str(e))
+    set_compact_output(args.compact)
+    if args.no_validate:
+        response_validator.enabled = False
+    if args.quarantine:
+        response_validator.quarantine_path = args.quarantine
+
+    store = GraphStore(args.store) if args.store else None
+    manifest = None
+    if args.manifest:
+        # В режиме хранилища TSV перезаписываются выгрузкой, откатывать в них нечего
+        manifest = RunManifest(args.manifest, *((None, None) if store else (args.nodes_file, args.edges_file)))
+    try:
+        run(args, store, manifest)
+        if store is not None:
+            store.export_tsv(args.nodes_file, args.edges_file)
+    finally:
+        if manifest is not None:
+            manifest.close()
+        if store is not None:
+            store.close()
+        if request_controller.requests:
+            print(f"Запросы к LLM: {request_controller.stats()}")
+            for base_url, endpoint_stats in endpoint_pool.stats().items():
+                print(f"Сервер {base_url}: {endpoint_stats}")
+        endpoint_pool.close()
+        if response_cache.enabled:
+            print(f"Кэш ответов LLM: {response_cache.stats()}")
+        if prefix_cache.enabled:
+            print(f"Prefill промпта (llama.cpp): {prefix_cache.stats()}")
+        response_cache.close()
+        if response_validator.enabled:
+            print(f"Проверка ответов по схеме: {response_validator.stats()}")
+            response_validator.close()
+        if telemetry.enabled:
+            print(f"Телеметрия: {telemetry.stats()}")
+            telemetry.close()
+
+def run(args, store=None, manifest=None):
+    """
+    Запускает обработку одного файла или пакетный режим по разобранным аргументам.
+    """
+    # Пакетный режим: директория, glob или JSONL-манифест
+    if is_batch_source(args.input_file):
+        asyncio.run(run_batch(
+            iter_inputs(args.input_file),
+            args.nodes_file,
+            args.edges_file,
+            concurrency=max(1, args.concurrency),
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+            stream=args.stream,
+            store=store,
+            manifest=manifest
+        ))
+        return
+
     # Чтение текста статьи из файла, указанного в аргументах
     try:
         with open(args.input_file, 'r', encoding='utf-8') as file:
@@ -41,18 +256,52 @@ def main():
         print(f"Ошибка: Входной файл не найден по пути '{args.input_file}'")
         return # Прекращаем выполнение, если файл не найден
 
+    if manifest is not None and manifest.is_done(article_text):
+        print(f"Статья '{args.input_file}' уже обработана (по манифесту {args.manifest}), пропускаем.")
+        return
+
+    with telemetry.article(args.input_file):
+        writer = _run_single(args, article_text, store, manifest)
+        if writer is None:
+            telemetry.set_failed('не удалось обработать статью')
+
+def _run_single(args, article_text, store=None, manifest=None):
+    """
+    Обрабатывает одну статью; возвращает KGXWriter (или хранилище) либо None при ошибке.
+    """
+    atomic = manifest is not None
+    writer = None
+
     # Основной блок обработки
     try:
-        # 1. Извлечение данных из текста
-        kgx_data = Entity_Relationships_Recognition(article_text=article_text)
-        
-        # 2. Обработка и сохранение данных в TSV
-        process_kgx_json(kgx_data, args.nodes_file, args.edges_file)
+        chunks = split_article(article_text, args.chunk_size)
+        if args.stream and len(chunks) == 1:
+            # Потоковый режим: строки пишутся по мере генерации ответа
+            writer = process_kgx_stream(Entity_Relationships_Recognition_stream(chunks[0], strict=atomic),
+                                        args.nodes_file, args.edges_file, store, atomic=atomic)
+        else:
+            # 1. Извлечение данных из текста
+            kgx_data = Entity_Relationships_Recognition_chunked(
+                article_text, max_chars=args.chunk_size, overlap=args.chunk_overlap)
+
+            # 2. Обработка и сохранение данных в TSV
+            writer = process_kgx_json(kgx_data, args.nodes_file, args.edges_file, store, atomic=atomic)
+
+        if manifest is not None:
+            manifest.record_done(args.input_file, article_text, writer.nodes_written, writer.edges_written,
+                                 getattr(writer, 'nodes_span', None), getattr(writer, 'edges_span', None))
 
-    except json.JSONDecodeError:
+    except json.JSONDecodeError as e:
         print("Ошибка: Неверный формат JSON получен от модуля распознавания.")
+        if manifest is not None:
+            manifest.record_failed(args.input_file, article_text, f"неверный JSON: {e}")
+        writer = None
     except Exception as e:
         print(f"Произошла непредвиденная ошибка: {e}")
+        if manifest is not None:
+            manifest.record_failed(args.input_file, article_text, str(e))
+        writer = None
+    return writer
 
 
 if __name__ == '__main__':